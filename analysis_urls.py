@@ -1,41 +1,80 @@
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from logging import getLogger
 from re import search
-from typing import Any
+from threading import Event, Lock
+from typing import Any, Callable, Iterator, TypeVar
 
 import yt_dlp
+from canonical_url import canonicalize_url
+from download_scheduler import expected_size
 from logger_config import LoggerConfigurator
+from metadata_cache import MetadataCache
+from record_store import RecordStore
 from types_config import ExYdlOpts, UrlData, UrlsDataList
+from ydl_pool import YoutubeDLPool
 
 Metadata = dict[str, Any]
 
+T = TypeVar("T")
+
 
 class AnalysisUrls:
     """A class for analyzing YouTube video URLs and retrieving information."""
 
-    def __init__(self, cookiefile: str = "") -> None:
+    def __init__(
+        self,
+        cookiefile: str = "",
+        max_workers: int = 1,
+        cache: MetadataCache | None = None,
+        ydl_pool: YoutubeDLPool | None = None,
+    ) -> None:
         """Initialize the AnalysisUrls object.
 
         Args:
             cookiefile (str, optional): Path to the cookie file. Defaults to "".
+            max_workers (int, optional): Number of urls resolved concurrently.
+            Defaults to 1, which resolves the urls one after another.
+            cache (MetadataCache | None, optional): Persistent cache of metadata.
+            Defaults to None, which always retrieves metadata from the internet.
+            ydl_pool (YoutubeDLPool | None, optional): Pool of YoutubeDL instances,
+            which can be shared with the downloader. Defaults to None, which
+            creates a new pool with cookiefile.
 
         Attributes:
             logger: Logger object for logging messages.
             cookie_filepath (str): Path to the cookie file.
-            _specified_cookie (bool): True if cookiefile is specified, False otherwise.
-            _tmp_directly_specified_idx (int): Temporary index used during analysis.
-            _same_playlist_idx (int): Used to assign different values for each playlist.
+            max_workers (int): Number of urls resolved concurrently.
+            cache (MetadataCache | None): Persistent cache of metadata.
+            ydl_pool (YoutubeDLPool): Pool of YoutubeDL instances.
+            info_dicts (dict[str, Metadata]): Full metadata kept by
+            'get_urls_detailed_data' with keep_info=True, keyed by url.
 
         Example:
-            >>> analyzer = AnalysisUrls(cookiefile="dir/cookies.txt")
+            >>> analyzer = AnalysisUrls(cookiefile="dir/cookies.txt", max_workers=4)
         """
 
         LoggerConfigurator()
         self.logger = getLogger()
 
         self.cookie_filepath: str = cookiefile
-        self._specified_cookie: bool = True if cookiefile != "" else False
-        self._tmp_directly_specified_idx: int = 0
-        self._same_playlist_idx: int = 0
+        self.max_workers: int = max(1, max_workers)
+        self.cache: MetadataCache | None = cache
+        self.ydl_pool: YoutubeDLPool = ydl_pool or YoutubeDLPool(cookiefile)
+        self.info_dicts: dict[str, Metadata] = {}
+        # Large keys that are not needed to download the video later
+        self.UNNEEDED_INFO_KEYS: tuple[str, ...] = (
+            "automatic_captions",
+            "subtitles",
+            "heatmap",
+            "requested_formats",
+            "requested_subtitles",
+            "requested_downloads",
+        )
+        # Metadata being retrieved, shared by the threads asking for the same url
+        self._in_flight: dict[tuple[str, bool], Future[Metadata | None]] = {}
+        self._in_flight_lock = Lock()
 
     def get_urls_data(self, urls: list[str]) -> UrlsDataList:
         """Get information for a list of URLs.
@@ -51,6 +90,10 @@ class AnalysisUrls:
             The index of the playlist starts from 1.
             same_playlist: If it's 1 or more, videos in the same playlist.
             Otherwise(it's 0), normal videos.
+            The urls are resolved on up to 'max_workers' threads, but the result
+            is always in the order of the urls given, and so is same_playlist.
+            Urls are canonicalized, and a url or playlist given more than once
+            appears only once, at its first position.
 
         Example:
             In this example, assume 'playlist cba321' includes 'aa11' and 'bb22'.
@@ -84,18 +127,154 @@ class AnalysisUrls:
             ]
         """
 
-        urls_with_data: UrlsDataList = []
-        for idx, url in enumerate(urls, start=1):
-            self.logger.info(f"Url: {url}")
-            ret = self._analyze_metadata(url)
+        return [record.to_url_data() for record in self.get_urls_records(urls)]
+
+    def get_urls_records(self, urls: list[str]) -> RecordStore:
+        """Same as 'get_urls_data', but the information is stored in a RecordStore.
+
+        Note:
+            Every video is a row of the store, so no dict is created per video.
+            Use this for playlists or channels with many videos.
+
+        Example:
+            >>> analyzer = AnalysisUrls()
+            >>> store = analyzer.get_urls_records(urls)
+            >>> print(store[0]["title"], store.titles[0])
+            Sample Title 1 Sample Title 1
+        """
+
+        records = RecordStore()
+        same_playlist_idx: int = 0
+        # Keyed by the urls of the videos in the playlist
+        playlists: dict[tuple[str, ...], RecordStore] = {}
+
+        canonical_urls = list(dict.fromkeys(canonicalize_url(url) for url in urls))
+        if len(canonical_urls) < len(urls):
+            self.logger.info(
+                f"{len(urls) - len(canonical_urls)} duplicate urls are ignored."
+            )
+        results = self._map_in_order(self._analyze_metadata, canonical_urls)
+        # Playlists are numbered here, in the order of the urls given,
+        # since the threads finish in no particular order.
+        for ret in results:
             if ret is None:
                 continue
-            urls_with_data.extend(ret)
-            self.logger.info(f"Progress: {idx} / {len(urls)}")
-        return urls_with_data
+            if len(ret) != 0 and ret.indexes[0] != 0:
+                key = tuple(ret.urls)
+                # When the same playlist is given by another url
+                if key in playlists:
+                    first = playlists[key].directly_specified
+                    for i, directly_specified in enumerate(ret.directly_specified):
+                        first[i] = first[i] or directly_specified
+                    continue
+                playlists[key] = ret
+                same_playlist_idx += 1
+                ret.same_playlists = array("I", [same_playlist_idx]) * len(ret)
+            records.extend(ret)
+        return records
+
+    def iter_urls_data(
+        self, urls: list[str], stop_event: Event | None = None
+    ) -> Iterator[UrlData]:
+        """Yield information for a list of URLs as soon as it is retrieved.
+
+        Args:
+            urls (List[str]): A list of URLs for which information is desired.
+            stop_event (Event | None, optional): When it is set, no more
+            information is retrieved and the iteration ends. Defaults to None.
+
+        Yields:
+            UrlData: Information for each video, the same as 'get_urls_data'.
+
+        Note:
+            The urls are retrieved one after another, and the videos of a
+            playlist are yielded page by page while the rest is being listed,
+            so that the caller can start on the first videos and memory does
+            not grow with the size of the playlist. Breaking out of the loop
+            (or closing the iterator) also stops the retrieval.
+            Unlike 'get_urls_data', a playlist given by several urls is not
+            merged, since it is not fully known when its first video is yielded.
+
+        Example:
+            >>> analyzer = AnalysisUrls()
+            >>> for url_data in analyzer.iter_urls_data(urls):
+            ...     print(url_data["title"])
+        """
 
-    def _analyze_metadata(self, url: str) -> list[UrlData] | None:
-        ret_url_data: list[UrlData] = []
+        same_playlist_idx: int = 0
+
+        canonical_urls = list(dict.fromkeys(canonicalize_url(url) for url in urls))
+        for progress, url in enumerate(canonical_urls, start=1):
+            is_first = True
+            for url_data in self._iter_metadata(url):
+                if stop_event is not None and stop_event.is_set():
+                    self.logger.info("Retrieving information is stopped.")
+                    return
+                if is_first and url_data["index"] != 0:
+                    same_playlist_idx += 1
+                is_first = False
+                if url_data["index"] != 0:
+                    url_data["same_playlist"] = same_playlist_idx
+                yield url_data
+            self.logger.info(f"Progress: {progress} / {len(canonical_urls)}")
+
+    def _map_in_order(
+        self,
+        func: Callable[[str], T],
+        urls: list[str],
+        timeout: float | None = None,
+    ) -> list[T | None]:
+        """Call func for each url on up to max_workers threads, keeping url order.
+
+        A url whose call is still running 'timeout' seconds after it started is
+        given up, and None is left in its place.
+        """
+        results: list[Any] = [None] * len(urls)
+        started: dict[int, float] = {}
+        gave_up: bool = False
+        done_count: int = 0
+
+        def run(idx: int, url: str) -> T:
+            started[idx] = time.monotonic()
+            return func(url)
+
+        e = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {e.submit(run, idx, url): idx for idx, url in enumerate(urls)}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(
+                    pending,
+                    timeout=None if timeout is None else min(timeout, 1.0),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    results[futures[future]] = future.result()
+                    done_count += 1
+                    self.logger.info(f"Progress: {done_count} / {len(urls)}")
+                if timeout is None:
+                    continue
+                now = time.monotonic()
+                for future in list(pending):
+                    idx = futures[future]
+                    if idx in started and now - started[idx] > timeout:
+                        # The thread cannot be stopped, only its result is discarded
+                        pending.discard(future)
+                        gave_up = True
+                        done_count += 1
+                        self.logger.warning(
+                            f"Timed out after {timeout} seconds. Url: '{urls[idx]}'."
+                        )
+                        self.logger.info(f"Progress: {done_count} / {len(urls)}")
+        finally:
+            e.shutdown(wait=not gave_up, cancel_futures=True)
+        return results
+
+    def _analyze_metadata(
+        self, url: str, directly_specified_idx: int = 0
+    ) -> RecordStore | None:
+        ret_url_data = RecordStore()
+        self.logger.info(f"Url: {url}")
         info = self._download_metadata(url)
         if info is None:
             self.logger.warning(f"Failed to retrieve video metadata. Url: {url}")
@@ -103,10 +282,9 @@ class AnalysisUrls:
         try:
             # When the url of the playlist 'itself' is specified
             entries = info["entries"]
-            ret_url_data = self._retrieving_info_from_entries(
-                entries, directly_specified_idx=self._tmp_directly_specified_idx
+            self._retrieving_info_from_entries(
+                entries, ret_url_data, directly_specified_idx=directly_specified_idx
             )
-            self._tmp_directly_specified_idx = 0
         except KeyError:
             if "&list=" in info["webpage_url"]:
                 # When specifying the url of a video in the playlist
@@ -115,9 +293,10 @@ class AnalysisUrls:
                 if ret == 0:
                     self.logger.error(f"Unexpected webpage_url: {info['webpage_url']}")
                     # TODO これが発生してしまう条件をより詳しく調べる
-                self._tmp_directly_specified_idx = ret
                 # Recursive call with the url of the playlist itself as an argument
-                ret = self._analyze_metadata(url=info["url"])
+                ret = self._analyze_metadata(
+                    url=info["url"], directly_specified_idx=ret
+                )
                 if ret is None:
                     self.logger.error(f"Unexpected url: '{url}'.")
                     return None
@@ -125,23 +304,106 @@ class AnalysisUrls:
             else:
                 # When it is a normal video, Not in playlist.
                 ret_url_data.append(
-                    self._create_url_data(url=info["webpage_url"], title=info["title"])
+                    canonicalize_url(info["webpage_url"]),
+                    info["title"],
+                    expected_size=expected_size(info),
                 )
         # For a playlist, the number of elements in the return value is equal
         # to the number of videos in the playlist (When normal url)
         return ret_url_data
 
+    def _iter_metadata(
+        self, url: str, directly_specified_idx: int = 0
+    ) -> Iterator[UrlData]:
+        # Same as '_analyze_metadata', but the entries are read lazily
+        self.logger.info(f"Url: {url}")
+        if self.cache is not None:
+            info = self.cache.get(url, True)
+            if info is not None:
+                yield from self._iter_info(info, directly_specified_idx)
+                return
+        ex_ydl_opts: ExYdlOpts = {"extract_flat": True, "quiet": True}
+        # The instance is kept while the entries are read
+        with self.ydl_pool.checkout(dict(ex_ydl_opts)) as ydl:
+            try:
+                info = ydl.extract_info(url=url, download=False, process=False)
+                if info is None:
+                    raise yt_dlp.DownloadError("No metadata.")
+                yield from self._iter_info(info, directly_specified_idx)
+            except (yt_dlp.DownloadError, yt_dlp.utils.ExtractorError) as e:
+                self.logger.debug(e)
+                self.logger.warning(f"Failed to retrieve video metadata. Url: {url}")
+
+    def _iter_info(
+        self, info: Metadata, directly_specified_idx: int
+    ) -> Iterator[UrlData]:
+        if "entries" in info:
+            # When the url of the playlist 'itself' is specified
+            for idx, entry in enumerate(info["entries"], start=1):
+                yield self._create_url_data(
+                    entry["url"],
+                    entry["title"],
+                    index=idx,
+                    directly_specified=idx == directly_specified_idx,
+                    expected_size=expected_size(entry),
+                )
+        elif "&list=" in info["webpage_url"]:
+            # When specifying the url of a video in the playlist
+            idx = self._search_index_of_video(info["webpage_url"])
+            yield from self._iter_metadata(info["url"], directly_specified_idx=idx)
+        else:
+            # When it is a normal video, Not in playlist.
+            yield self._create_url_data(
+                url=info["webpage_url"],
+                title=info["title"],
+                expected_size=expected_size(info),
+            )
+
     def _download_metadata(
-        self, url: str, extract_flat: bool = True
+        self, url: str, extract_flat: bool = True, timeout: float | None = None
     ) -> Metadata | None:
+        url = canonicalize_url(url)
+        key = (url, extract_flat)
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if future is None:
+                future = self._in_flight[key] = Future()
+        if not is_owner:
+            self.logger.debug(f"Wait for the same url in another thread. Url: '{url}'")
+            return future.result()
+        try:
+            info = self._extract_metadata(url, extract_flat, timeout)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(info)
+        finally:
+            # Only the lookups in progress are shared, not to keep the failures
+            # and the metadata. Later lookups are served by the cache
+            with self._in_flight_lock:
+                del self._in_flight[key]
+        return info
+
+    def _extract_metadata(
+        self, url: str, extract_flat: bool, timeout: float | None
+    ) -> Metadata | None:
+        if self.cache is not None:
+            info = self.cache.get(url, extract_flat)
+            if info is not None:
+                return info
         ex_ydl_opts: ExYdlOpts = {"extract_flat": extract_flat, "quiet": True}
-        if self._specified_cookie:
-            ex_ydl_opts["cookiefile"] = self.cookie_filepath
-        with yt_dlp.YoutubeDL(ex_ydl_opts) as ydl:
+        if timeout is not None:
+            ex_ydl_opts["socket_timeout"] = timeout
+        # Cookies are given by the pool
+        with self.ydl_pool.checkout(dict(ex_ydl_opts)) as ydl:
             try:
                 info = ydl.extract_info(url=url, download=False)
             except yt_dlp.DownloadError:
                 return None
+        if info is not None and self.cache is not None:
+            self.cache.put(url, extract_flat, ydl.sanitize_info(info))
         return info
 
     def _create_url_data(
@@ -151,13 +413,15 @@ class AnalysisUrls:
         index: int = 0,
         same_playlist: int = 0,
         directly_specified: bool = True,
+        expected_size: float = 0.0,
     ) -> UrlData:
         return {
-            "url": url,
+            "url": canonicalize_url(url),
             "title": title,
             "index": index,
             "same_playlist": same_playlist,
             "directly_specified": directly_specified,
+            "expected_size": expected_size,
         }
 
     def _search_index_of_video(self, url: str) -> int:
@@ -170,40 +434,49 @@ class AnalysisUrls:
             return 0
 
     def _retrieving_info_from_entries(
-        self, entries: Any, directly_specified_idx: int = 0
-    ) -> list[UrlData]:
-        ret_urls_data: list[UrlData] = []
-        self._same_playlist_idx += 1
+        self, entries: Any, records: RecordStore, directly_specified_idx: int = 0
+    ) -> None:
+        # same_playlist is numbered by 'get_urls_records' once the order is settled
         for idx, entry in enumerate(entries, start=1):
             directly_specified = True if idx == directly_specified_idx else False
-            ret_urls_data.append(
-                self._create_url_data(
-                    entry["url"],
-                    entry["title"],
-                    index=idx,
-                    same_playlist=self._same_playlist_idx,
-                    directly_specified=directly_specified,
-                )
+            records.append(
+                canonicalize_url(entry["url"]),
+                entry["title"],
+                index=idx,
+                directly_specified=directly_specified,
+                expected_size=expected_size(entry),
             )
-        return ret_urls_data
 
     def get_urls_detailed_data(
-        self, urls: list[str], wanted_data: str
-    ) -> list[dict[str, Any]]:
+        self,
+        urls: list[str],
+        wanted_data: str,
+        timeout: float | None = None,
+        keep_info: bool = False,
+    ) -> list[dict[str, Any] | None]:
         """Get detailed information for a list of video URLs.
 
         Args:
             urls (List[str]): A list of URLs for which detailed information is desired.
             wanted_data (str): A comma-separated string specifying the data to be
             retrieved for each URL.
+            timeout (float | None, optional): Seconds after which a url that is
+            still being retrieved is given up. Defaults to None, no time limit.
+            keep_info (bool, optional): If True, the full metadata of each url is
+            kept in 'info_dicts' without the keys that are not needed to download
+            it, so that the downloader does not have to extract it again.
 
         Returns:
-            UrlsData: A list containing detailed information with URL for each URL.
+            list[dict[str, Any] | None]: A list containing detailed information
+            with URL for each URL, in the same order as the URLs. None is placed
+            for URLs whose information could not be retrieved.
 
         Notes:
             - DO NOT include the playlist in the URLs. If you cannot be sure,
             use a URLs obtained using 'get_urls_with_title' method of the same class.
-            - If non-existent data is specified, keyerror is generated.
+            - If non-existent data is specified, None is placed for the URLs.
+            - The URLs are retrieved on up to 'max_workers' threads. URLs that
+            failed are logged together once all of them have been tried.
             - Refer to the Output Template that exist
             in the https://github.com/yt-dlp/yt-dlp for available data
 
@@ -227,26 +500,47 @@ class AnalysisUrls:
                 }
             ]
         """
-        # TODO ここ将来的にマルチスレッドに
-
-        data_acquired: list[dict[str, Any]] = []
         want: list[str] = wanted_data.replace(" ", "").split(",")
 
-        for idx, url in enumerate(urls, start=1):
-            self.logger.info(f"Url: {url}")
-            info = self._download_metadata(url, extract_flat=False)
-            if info is None:
-                self.logger.warning(f"Failed to retrieve video metadata. Url: '{url}'.")
-                continue
-
-            part_data_acquired: dict[str, int | str | bool] = {"url": url}
-            for key in want:
-                part_data_acquired[key] = info[key]
-
-            data_acquired.append(part_data_acquired)
-            self.logger.info(f"Progress: {idx} / {len(urls)}")
+        data_acquired = self._map_in_order(
+            lambda url: self._select_detailed_data(url, want, timeout, keep_info),
+            urls,
+            timeout=timeout,
+        )
+        failures = [url for url, data in zip(urls, data_acquired) if data is None]
+        if failures:
+            self.logger.warning(
+                f"Failed to retrieve the information of {len(failures)} / "
+                f"{len(urls)} urls."
+            )
+            for url in failures:
+                self.logger.warning(f"\t> '{url}'")
         return data_acquired
 
+    def _select_detailed_data(
+        self, url: str, want: list[str], timeout: float | None, keep_info: bool
+    ) -> dict[str, Any] | None:
+        self.logger.info(f"Url: {url}")
+        info = self._download_metadata(url, extract_flat=False, timeout=timeout)
+        if info is None:
+            self.logger.warning(f"Failed to retrieve video metadata. Url: '{url}'.")
+            return None
+        if keep_info:
+            self.info_dicts[url] = {
+                key: value
+                for key, value in info.items()
+                if key not in self.UNNEEDED_INFO_KEYS
+            }
+
+        part_data_acquired: dict[str, Any] = {"url": url}
+        for key in want:
+            if key not in info:
+                # Such as a live stream without 'upload_date', not to stop the others
+                self.logger.warning(f"No '{key}' in the metadata. Url: '{url}'.")
+                return None
+            part_data_acquired[key] = info[key]
+        return part_data_acquired
+
 
 # if __name__ == "__main__":
 #     a = AnalysisUrls()
@@ -0,0 +1,140 @@
+import time
+from datetime import datetime
+from datetime import time as day_time
+from threading import Lock
+from typing import Any
+
+from yt_dlp.utils import parse_bytes
+
+# (start, end, bytes per second), 0 bytes per second means no limit
+RateSchedule = list[tuple[day_time, day_time, float]]
+
+
+def parse_rate(text: str) -> float:
+    """Parse a rate such as '500K' or '2M' (bytes per second), 0 means no limit."""
+    rate = parse_bytes(text.strip())
+    if rate is None:
+        raise ValueError(f"Invalid rate: '{text}'")
+    return float(rate)
+
+
+def parse_rate_schedule(text: str) -> RateSchedule:
+    """Parse comma-separated 'HH:MM-HH:MM=RATE' entries.
+
+    Example:
+        >>> parse_rate_schedule("09:00-18:00=2M, 18:00-22:00=10M")
+        [(datetime.time(9, 0), datetime.time(18, 0), 2097152.0),
+         (datetime.time(18, 0), datetime.time(22, 0), 10485760.0)]
+    """
+
+    schedule: RateSchedule = []
+    for entry in text.split(","):
+        if not entry.strip():
+            continue
+        try:
+            span, rate = entry.split("=")
+            start, end = span.split("-")
+            schedule.append(
+                (
+                    day_time.fromisoformat(start.strip()),
+                    day_time.fromisoformat(end.strip()),
+                    parse_rate(rate),
+                )
+            )
+        except ValueError:
+            raise ValueError(f"Invalid schedule: '{entry.strip()}'") from None
+    return schedule
+
+
+class BandwidthLimiter:
+    """A token bucket limiting the total download speed of all threads.
+
+    Unlike 'ratelimit' of yt-dlp, which limits each download, the total stays
+    the same however many threads are downloading.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        schedule: RateSchedule | None = None,
+        burst_seconds: float = 1.0,
+    ) -> None:
+        """Initialize the BandwidthLimiter object.
+
+        Args:
+            rate (float, optional): Bytes per second when no entry of schedule
+            applies. Defaults to 0.0, which means no limit.
+            schedule (RateSchedule | None, optional): Bytes per second for
+            times of the day, the first matching entry is used. An entry whose
+            end is before its start continues past midnight. Defaults to None.
+            burst_seconds (float, optional): Seconds of the rate that can be
+            downloaded at once after an idle period. Defaults to 1.0.
+
+        Note:
+            'hook' is a progress hook of yt-dlp. It is called after each block
+            of data is written, and sleeps in the downloading thread until the
+            block is paid for. The blocks are paid in the order they arrive, so
+            the threads get the bandwidth in turn.
+
+        Example:
+            >>> limiter = BandwidthLimiter(
+            ...     rate=parse_rate("10M"),
+            ...     schedule=parse_rate_schedule("09:00-18:00=2M"),
+            ... )
+            >>> ydl_opts["progress_hooks"] = [limiter.hook]
+        """
+
+        self.rate: float = rate
+        self.schedule: RateSchedule = schedule or []
+        self.burst_seconds: float = burst_seconds
+        self._lock = Lock()
+        # Negative while the threads are waiting for the bytes already received
+        self._tokens: float = 0.0
+        self._updated: float = time.monotonic()
+        # Bytes already paid for each file being downloaded
+        self._counted: dict[str, int] = {}
+
+    def current_rate(self) -> float:
+        now = datetime.now().time()
+        for start, end, rate in self.schedule:
+            if start <= end:
+                if start <= now < end:
+                    return rate
+            elif now >= start or now < end:
+                return rate
+        return self.rate
+
+    def hook(self, progress: dict[str, Any]) -> None:
+        """Progress hook for yt-dlp, called by every download thread."""
+        # 'tmpfilename' is not given when the download is finished
+        key = progress.get("filename") or ""
+        downloaded = progress.get("downloaded_bytes") or 0
+        with self._lock:
+            if progress.get("status") != "downloading":
+                # Already paid for, or an existing file that was not downloaded
+                self._counted.pop(key, None)
+                return
+            # A resumed download starts from the size of the '.part' file
+            delta = downloaded - self._counted.setdefault(key, downloaded)
+            self._counted[key] = downloaded
+        if delta > 0:
+            self.consume(delta)
+
+    def consume(self, byte_count: int) -> None:
+        """Sleep until byte_count bytes are allowed by the current rate."""
+        with self._lock:
+            rate = self.current_rate()
+            now = time.monotonic()
+            if rate <= 0:
+                self._tokens = 0.0
+                self._updated = now
+                return
+            self._tokens = min(
+                rate * self.burst_seconds,
+                self._tokens + (now - self._updated) * rate,
+            )
+            self._updated = now
+            self._tokens -= byte_count
+            wait_seconds = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
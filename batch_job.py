@@ -0,0 +1,171 @@
+import json
+import os
+import tomllib
+from typing import Any
+
+from deside_option_video_download import CusOpt, Records
+from download_archive import DownloadArchive
+from enum_config import DownloadMode, Thumbnail
+from record_store import RecordStore
+from types_config import BatchJob, BatchPlan, DlYdlOpts, PlannedVideo
+
+PLAN_VERSION: int = 1
+# Keys of a job file and their types
+JOB_KEYS: dict[str, type] = {
+    "dir_path": str,
+    "urls": list,
+    "csv_files": list,
+    "playlist_ranges": dict,
+    "ffmpeg_path": str,
+    "download_mode": str,
+    "thumbnail_mode": str,
+    "file_name_format": str,
+}
+
+
+def load_job(path: str) -> BatchJob:
+    """Read a job file in TOML ('.toml') or JSON (otherwise).
+
+    Raises:
+        ValueError: If the file cannot be read or parsed, or has an unknown key
+        or a value of a wrong type.
+
+    Example:
+        A job file 'job.toml':
+            dir_path = "videos"
+            urls = ["https://www.youtube.com/playlist?list=cba321"]
+            csv_files = ["urls.csv"]
+            download_mode = "M4A"
+            thumbnail_mode = "PLAIN"
+            file_name_format = "D_T"
+
+            [playlist_ranges]
+            default = "all"
+            1 = "1, 5-7"
+        >>> job = load_job("job.toml")
+    """
+
+    try:
+        if os.path.splitext(path)[1].lower() == ".toml":
+            with open(path, "rb") as f:
+                data: Any = tomllib.load(f)
+        else:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+    except (tomllib.TOMLDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid job file '{path}': {e}") from None
+    except OSError as e:
+        raise ValueError(f"Cannot read the job file '{path}': {e}") from None
+    return validate_job(data, f"'{path}'")
+
+
+def validate_job(data: Any, source: str = "the job") -> BatchJob:
+    """Check the keys and the types of a job, such as one submitted to a daemon.
+
+    Args:
+        data (Any): A job parsed from TOML or JSON.
+        source (str, optional): Where the job came from, for the errors.
+        Defaults to "the job".
+
+    Raises:
+        ValueError: If data has an unknown key or a value of a wrong type.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid job in {source}: not a table of options.")
+    for key, value in data.items():
+        if key not in JOB_KEYS:
+            raise ValueError(f"Unknown key in {source}: '{key}'")
+        if not isinstance(value, JOB_KEYS[key]):
+            raise ValueError(
+                f"'{key}' in {source} must be {JOB_KEYS[key].__name__}, "
+                f"not {type(value).__name__}."
+            )
+        # 'urls' and 'csv_files' are lists of str
+        if isinstance(value, list) and not all(isinstance(x, str) for x in value):
+            raise ValueError(f"'{key}' in {source} must be a list of str.")
+    if "dir_path" not in data:
+        raise ValueError(f"'dir_path' is required in {source}.")
+    # Numbers are also accepted as the keys of the playlists in TOML
+    data["playlist_ranges"] = {
+        str(key): str(value) for key, value in data.get("playlist_ranges", {}).items()
+    }
+    return data
+
+
+def save_plan(
+    path: str, ydl_opts: DlYdlOpts, custom_opt: CusOpt, multi_record: Records
+) -> None:
+    """Write the resolved videos and options, so that 'load_plan' downloads them.
+
+    Note:
+        The full metadata of the videos is not written, since the stream urls
+        in it expire. The videos are extracted again when they are downloaded.
+    """
+    download_archive: DownloadArchive | None = custom_opt.get("download_archive")
+    plan: BatchPlan = {
+        "version": PLAN_VERSION,
+        "ydl_opts": {
+            key: value  # type: ignore[misc]
+            for key, value in ydl_opts.items()
+            if key not in ["progress_hooks"]
+        },
+        "dir_path": custom_opt["dir_path"],
+        "ffmpeg_path": custom_opt["ffmpeg_path"],
+        "download_mode": custom_opt["download_mode"].name,
+        "thumbnail_mode": custom_opt["thumbnail_mode"].name,
+        "archive_file": "" if download_archive is None else download_archive.file_path,
+        "videos": [
+            PlannedVideo(**record.to_url_data(), filename=record.filename)
+            for record in multi_record
+        ],
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_plan(path: str) -> tuple[DlYdlOpts, CusOpt, Records]:
+    """Read a plan written by 'save_plan'.
+
+    Returns:
+        tuple[DlYdlOpts, CusOpt, Records]: The same as
+        'DesideOptionVideoDownload.run', to be given to VideoDownloaderQueue.
+
+    Raises:
+        ValueError: If the file cannot be read, or is not a plan of this version.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            plan: BatchPlan = json.load(f)
+        if not isinstance(plan, dict):
+            raise ValueError(f"Invalid plan file '{path}': not an object.")
+        if plan.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version: {plan.get('version')}")
+        custom_opt: CusOpt = {
+            "dir_path": plan["dir_path"],
+            "ffmpeg_path": plan["ffmpeg_path"],
+            "download_mode": DownloadMode[plan["download_mode"]],
+            "thumbnail_mode": Thumbnail[plan["thumbnail_mode"]],
+            "info_dicts": {},
+            "download_archive": (
+                DownloadArchive(plan["archive_file"]) if plan["archive_file"] else None
+            ),
+        }
+        records = RecordStore()
+        for video in plan["videos"]:
+            row = records.append(
+                video["url"],
+                video["title"],
+                video["index"],
+                video["same_playlist"],
+                video["directly_specified"],
+                video.get("expected_size", 0.0),
+            )
+            records[row].filename = video["filename"]
+            records[row].selected = True
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid plan file '{path}': {e!r}") from None
+    except OSError as e:
+        raise ValueError(f"Cannot read the plan file '{path}': {e}") from None
+    return plan["ydl_opts"], custom_opt, records.selected_records()
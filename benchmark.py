@@ -0,0 +1,649 @@
+"""Offline benchmark of the analysis, the downloads and the post-processing.
+
+A local HTTP server serves synthetic videos, and an extractor of yt-dlp points
+at it, so that the thread counts, the schedulers and the post-processing modes
+can be compared without accessing YouTube. Each run appends a line of JSON to
+the output file, with the commit it was run on.
+
+Example:
+    python ./benchmark.py --videos 40 --sizes 1M,8M --threads 1,4,8
+    python ./benchmark.py --ffmpeg ffmpeg --modes M4A,WAV --thumbnails PLAIN,SET
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import product
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+from analysis_urls import AnalysisUrls
+from bandwidth_limiter import parse_rate
+from deside_option_video_download import DesideOptionVideoDownload
+from download_metrics import PHASE_KEYS, MetricsRecorder
+from download_retry import RetryPolicy
+from download_scheduler import RecordsPriorityQueue
+from enum_config import DownloadMode, FileNameFormat, SchedulePolicy, Thumbnail
+from video_download import VideoDownloaderQueue
+from ydl_pool import YoutubeDLPool
+
+# Bit rate of the audio generated by ffmpeg, to make files of the wanted size
+AUDIO_BITRATE: int = 128_000
+BLOCK_SIZE: int = 64 * 1024
+# Served as the thumbnail when ffmpeg cannot make a real one
+PLACEHOLDER_WEBP: bytes = (
+    b"RIFF\x1a\x00\x00\x00WEBPVP8L\x0d\x00\x00\x00/\x00\x00\x00\x10"
+)
+# Modes that run ffmpeg after the download
+FFMPEG_MODES: tuple[DownloadMode, ...] = (DownloadMode.WAV,)
+FFMPEG_THUMBNAILS: tuple[Thumbnail, ...] = (
+    Thumbnail.GET_PNG,
+    Thumbnail.SET,
+    Thumbnail.GET_AND_SET,
+)
+
+
+class SyntheticMediaServer(ThreadingHTTPServer):
+    """A local server of videos of given sizes, with latency and failures.
+
+    Paths:
+        /playlist/<index>: Entries of a playlist as JSON.
+        /info/<video id>: Metadata of a video as JSON.
+        /media/<video id>.<ext>: The file of a video, with Range support.
+        /thumb/<video id>.webp: The thumbnail of a video.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        sizes: list[int],
+        playlists: int = 0,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        media_files: dict[int, str] | None = None,
+        thumbnail_file: str = "",
+        seed: int = 0,
+    ) -> None:
+        """Initialize the SyntheticMediaServer object.
+
+        Args:
+            sizes (list[int]): Bytes of each video, which is named 'v<index>'.
+            playlists (int, optional): Number of playlists the videos are
+            divided into. Defaults to 0, no playlist.
+            latency (float, optional): Seconds before each response.
+            Defaults to 0.0.
+            failure_rate (float, optional): Probability that a request for the
+            metadata or the file of a video is answered with 503.
+            Defaults to 0.0.
+            media_files (dict[int, str] | None, optional): Real files served
+            instead of the synthetic bytes, keyed by size. Defaults to None.
+            thumbnail_file (str, optional): Real image served as the thumbnail.
+            Defaults to "", a placeholder.
+            seed (int, optional): Seed of the failures. Defaults to 0.
+        """
+
+        super().__init__(("127.0.0.1", 0), _MediaRequestHandler)
+        self.sizes: list[int] = sizes
+        self.playlists: int = playlists
+        self.latency: float = latency
+        self.failure_rate: float = failure_rate
+        self.media_files: dict[int, str] = media_files or {}
+        self.thumbnail_file: str = thumbnail_file
+        self._random = random.Random(seed)
+        self._random_lock = Lock()
+        self.base_url: str = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> None:
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    def urls(self) -> list[str]:
+        """Return the urls to give to the analysis, playlists or videos."""
+        if self.playlists:
+            return [f"{self.base_url}/playlist/{i}" for i in range(self.playlists)]
+        return [f"{self.base_url}/video/v{i}" for i in range(len(self.sizes))]
+
+    def video_info(self, index: int) -> dict[str, Any]:
+        video_id = f"v{index}"
+        size = self.media_size(index)
+        media_url = f"{self.base_url}/media/{video_id}"
+        # One format with video and one only with audio, for all download modes
+        return {
+            "id": video_id,
+            "title": f"Video {index}",
+            "upload_date": "20240101",
+            "duration": size * 8 / AUDIO_BITRATE,
+            "webpage_url": f"{self.base_url}/video/{video_id}",
+            "thumbnails": [
+                {"id": "0", "url": f"{self.base_url}/thumb/{video_id}.webp"}
+            ],
+            "formats": [
+                {
+                    "format_id": "audio",
+                    "url": media_url + ".m4a",
+                    "ext": "m4a",
+                    "vcodec": "none",
+                    "acodec": "mp4a.40.2",
+                    "filesize": size,
+                },
+                {
+                    "format_id": "video",
+                    "url": media_url + ".mp4",
+                    "ext": "mp4",
+                    "vcodec": "avc1.4d401e",
+                    "acodec": "mp4a.40.2",
+                    "height": 360,
+                    "fps": 30,
+                    "filesize": size,
+                },
+            ],
+        }
+
+    def playlist_entries(self, index: int) -> list[dict[str, Any]]:
+        return [
+            {
+                "url": f"{self.base_url}/video/v{i}",
+                "title": f"Video {i}",
+                "filesize": self.media_size(i),
+            }
+            for i in range(index, len(self.sizes), self.playlists)
+        ]
+
+    def media_size(self, index: int) -> int:
+        size = self.sizes[index]
+        if size in self.media_files:
+            return os.path.getsize(self.media_files[size])
+        return size
+
+    def should_fail(self) -> bool:
+        with self._random_lock:
+            return self._random.random() < self.failure_rate
+
+
+class _MediaRequestHandler(BaseHTTPRequestHandler):
+    server: SyntheticMediaServer
+
+    def do_GET(self) -> None:
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        kind, _, name = self.path.strip("/").partition("/")
+        try:
+            if kind == "playlist":
+                self._send_json(server.playlist_entries(int(name)))
+            elif kind == "info":
+                if server.should_fail():
+                    self.send_error(503)
+                    return
+                self._send_json(server.video_info(int(name.lstrip("v"))))
+            elif kind == "media":
+                if server.should_fail():
+                    self.send_error(503)
+                    return
+                self._send_media(int(os.path.splitext(name)[0].lstrip("v")))
+            elif kind == "thumb":
+                self._send_thumbnail()
+            else:
+                self.send_error(404)
+        except (ValueError, IndexError):
+            self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up the download
+            pass
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, data: Any) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_media(self, index: int) -> None:
+        server = self.server
+        size = server.media_size(index)
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start = int(first or 0)
+            end = min(end, int(last)) if last else end
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end + 1 - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        media_file = server.media_files.get(server.sizes[index])
+        if media_file is not None:
+            with open(media_file, "rb") as f:
+                f.seek(start)
+                remaining = end + 1 - start
+                while remaining > 0 and (data := f.read(min(remaining, BLOCK_SIZE))):
+                    self.wfile.write(data)
+                    remaining -= len(data)
+            return
+        block = bytes(BLOCK_SIZE)
+        remaining = end + 1 - start
+        while remaining > 0:
+            self.wfile.write(block[: min(remaining, BLOCK_SIZE)])
+            remaining -= BLOCK_SIZE
+
+    def _send_thumbnail(self) -> None:
+        body = PLACEHOLDER_WEBP
+        if self.server.thumbnail_file:
+            with open(self.server.thumbnail_file, "rb") as f:
+                body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/webp")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BenchmarkIE(InfoExtractor):
+    """Extractor of the videos and the playlists of SyntheticMediaServer."""
+
+    IE_NAME = "benchmark"
+    _VALID_URL = r"http://127\.0\.0\.1:\d+/(?P<kind>video|playlist)/(?P<id>[\w-]+)"
+
+    def _real_extract(self, url: str) -> dict[str, Any]:
+        kind, item_id = self._match_valid_url(url).group("kind", "id")
+        base_url = url.split(f"/{kind}/")[0]
+        if kind == "playlist":
+            entries = self._download_json(f"{base_url}/playlist/{item_id}", item_id)
+            return self.playlist_result(
+                [
+                    self.url_result(
+                        entry["url"],
+                        BenchmarkIE,
+                        video_title=entry["title"],
+                        filesize=entry["filesize"],
+                    )
+                    for entry in entries
+                ],
+                playlist_id=item_id,
+                playlist_title=f"Playlist {item_id}",
+            )
+        return self._download_json(f"{base_url}/info/{item_id}", item_id)
+
+
+class BenchmarkYoutubeDLPool(YoutubeDLPool):
+    """YoutubeDLPool whose instances extract the urls of the local server."""
+
+    def _create(self, params: dict[str, Any]) -> yt_dlp.YoutubeDL:
+        # Never send the requests for the local server to a proxy
+        ydl = super()._create({**params, "proxy": ""})
+        ie = BenchmarkIE()
+        ydl.add_info_extractor(ie)
+        # The generic extractor accepts any url, so this one must come first
+        ydl._ies = {ie.ie_key(): ydl._ies.pop(ie.ie_key()), **ydl._ies}
+        return ydl
+
+
+def make_media_files(
+    ffmpeg_path: str, sizes: list[int], work_dir: str
+) -> tuple[dict[int, str], str]:
+    """Make real audio files of about the given sizes, and a thumbnail.
+
+    Returns:
+        tuple[dict[int, str], str]: The files keyed by size, and the thumbnail.
+    """
+
+    def run(args: list[str]) -> None:
+        subprocess.run(
+            [ffmpeg_path, "-y", "-loglevel", "error", *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+
+    media_files: dict[int, str] = {}
+    for size in sorted(set(sizes)):
+        path = os.path.join(work_dir, f"media_{size}.mp4")
+        duration = max(1.0, size * 8 / AUDIO_BITRATE)
+        run(
+            [
+                "-f",
+                "lavfi",
+                "-i",
+                f"anoisesrc=d={duration:.1f}:c=pink",
+                "-c:a",
+                "aac",
+                "-b:a",
+                str(AUDIO_BITRATE),
+                "-f",
+                "mp4",
+                path,
+            ]
+        )
+        media_files[size] = path
+    thumbnail_file = os.path.join(work_dir, "thumbnail.webp")
+    run(
+        [
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc=size=320x180",
+            "-frames:v",
+            "1",
+            thumbnail_file,
+        ]
+    )
+    return media_files, thumbnail_file
+
+
+def run_benchmark(
+    server: SyntheticMediaServer,
+    work_dir: str,
+    ffmpeg_path: str,
+    download_mode: DownloadMode,
+    thumbnail_mode: Thumbnail,
+    threads: int,
+    policy: SchedulePolicy,
+    analysis_threads: int,
+    postprocess_threads: int,
+    retry_delay: float,
+) -> dict[str, Any]:
+    """Analyze the urls of the server and download all videos once.
+
+    Returns:
+        dict[str, Any]: Throughput, latencies and CPU time of the run.
+    """
+
+    dir_path = tempfile.mkdtemp(prefix="run_", dir=work_dir)
+    ydl_pool = BenchmarkYoutubeDLPool()
+    # The options are built as in the interactive selection
+    optioner = DesideOptionVideoDownload(
+        analysis_threads=analysis_threads, ydl_pool=ydl_pool, use_archive=False
+    )
+    optioner.dir_path = dir_path
+    optioner.ffmpeg_path = ffmpeg_path
+    optioner.can_use_ffmpeg = bool(ffmpeg_path)
+    optioner.download_mode = download_mode
+    optioner.thumbnail_mode = thumbnail_mode
+    # The upload date is retrieved with the full metadata, as the downloads use
+    optioner.file_name_fmt = FileNameFormat.D_T
+    cpu_start = os.times()
+    started = time.monotonic()
+    try:
+        records = AnalysisUrls(
+            max_workers=analysis_threads, ydl_pool=ydl_pool
+        ).get_urls_records(server.urls())
+        for record in records:
+            record.selected = True
+        multi_record = optioner.assembly_file_name(records.selected_records())
+        analysis_seconds = time.monotonic() - started
+
+        records_q = RecordsPriorityQueue(policy=policy)
+        for record in multi_record:
+            records_q.put(record)
+        metrics = MetricsRecorder()
+        downloader = VideoDownloaderQueue(
+            optioner.assembly_ydl_opts(),
+            optioner.assembly_custom_opt(),
+            thread_count=threads,
+            ydl_pool=ydl_pool,
+            postprocess_threads=postprocess_threads,
+            retry_policy=RetryPolicy(base_delay=retry_delay),
+            metrics=metrics,
+        )
+        download_started = time.monotonic()
+        status_q = downloader.start_download(records_q)
+        download_seconds = time.monotonic() - download_started
+    finally:
+        ydl_pool.close()
+        shutil.rmtree(dir_path, ignore_errors=True)
+    cpu_end = os.times()
+
+    items = metrics.items()
+    successes = sum(state for state, _ in _drain(status_q))
+    transferred = sum(item.get("bytes", 0) for item in items)
+    # From the start of the downloads until the video is ready
+    latencies = [
+        sum(item.get(key, 0.0) for key in PHASE_KEYS.values())  # type: ignore
+        for item in items
+        if item.get("status") == "success"
+    ]
+    return {
+        "download_mode": download_mode.name,
+        "thumbnail_mode": thumbnail_mode.name,
+        "threads": threads,
+        "schedule": policy.value,
+        "analysis_threads": analysis_threads,
+        "postprocess_threads": postprocess_threads,
+        "videos": len(multi_record),
+        "successes": successes,
+        "bytes": transferred,
+        "retries": sum(item.get("retries", 0) for item in items),
+        "analysis_seconds": analysis_seconds,
+        "download_seconds": download_seconds,
+        "throughput_bytes_per_second": transferred / download_seconds,
+        "latency_p50_seconds": percentile(latencies, 50),
+        "latency_p95_seconds": percentile(latencies, 95),
+        "cpu_seconds": (cpu_end.user - cpu_start.user)
+        + (cpu_end.system - cpu_start.system),
+        "child_cpu_seconds": (cpu_end.children_user - cpu_start.children_user)
+        + (cpu_end.children_system - cpu_start.children_system),
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return the q-th percentile of values by the nearest rank, 0 if empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _drain(status_q: Queue[tuple[bool, str]]) -> list[tuple[bool, str]]:
+    results = []
+    while not status_q.empty():
+        results.append(status_q.get())
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def analysis_args() -> argparse.Namespace:
+    def int_list(text: str) -> list[int]:
+        return [int(value) for value in text.split(",")]
+
+    def size_list(text: str) -> list[int]:
+        return [int(parse_rate(value)) for value in text.split(",")]
+
+    def enum_list(enum_type: Any) -> Any:
+        return lambda text: [
+            enum_type[value.strip().upper()] for value in text.split(",")
+        ]
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=20, help="Number of videos.")
+    parser.add_argument(
+        "--sizes",
+        type=size_list,
+        default=[2**20, 8 * 2**20],
+        help="Sizes of the videos in turn, such as '1M,8M'. Defaults to '1M,8M'.",
+    )
+    parser.add_argument(
+        "--playlists",
+        type=int,
+        default=2,
+        help="Number of playlists the videos are in. 0 gives each video's url.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Seconds before each response of the server. Defaults to 0.05.",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Probability that a request for a video is answered with 503.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int_list,
+        default=[1, 4],
+        help="Download threads of each run, such as '1,4,8'.",
+    )
+    parser.add_argument(
+        "--schedules",
+        type=lambda text: [SchedulePolicy(value) for value in text.split(",")],
+        default=[SchedulePolicy.LARGEST_FIRST],
+        help="Schedule policies of each run, such as 'fifo,largest,smallest'.",
+    )
+    parser.add_argument(
+        "--modes",
+        type=enum_list(DownloadMode),
+        default=[DownloadMode.M4A],
+        help="Download modes of each run, such as 'M4A,WAV'. See enum_config.py",
+    )
+    parser.add_argument(
+        "--thumbnails",
+        type=enum_list(Thumbnail),
+        default=[Thumbnail.PLAIN],
+        help="Thumbnail modes of each run, such as 'PLAIN,SET'. See enum_config.py",
+    )
+    parser.add_argument("--analysis-threads", type=int, default=4)
+    parser.add_argument(
+        "--postprocess-threads",
+        type=int,
+        default=0,
+        help="Threads of ffmpeg. Defaults to 0, the number of CPUs.",
+    )
+    parser.add_argument("--retry-delay", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each setting.")
+    parser.add_argument(
+        "--ffmpeg",
+        type=str,
+        default="",
+        help=(
+            "Path to ffmpeg. Without it, the videos are zero bytes and the "
+            "modes using ffmpeg are skipped."
+        ),
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="benchmark_results.jsonl",
+        help="File the results are appended to, one run per line.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the logs.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = analysis_args()
+    if not args.verbose:
+        # LoggerConfigurator resets the level of the logger, but not this
+        logging.disable(logging.INFO)
+    sizes = [args.sizes[i % len(args.sizes)] for i in range(args.videos)]
+    settings = []
+    for mode, thumbnail, threads, policy in product(
+        args.modes, args.thumbnails, args.threads, args.schedules
+    ):
+        if not args.ffmpeg and (mode in FFMPEG_MODES or thumbnail in FFMPEG_THUMBNAILS):
+            print(f"Skipped without ffmpeg: {mode.name}, {thumbnail.name}")
+            continue
+        settings.append((mode, thumbnail, threads, policy))
+
+    with tempfile.TemporaryDirectory(prefix="video_downloader_benchmark_") as work_dir:
+        media_files, thumbnail_file = {}, ""
+        if args.ffmpeg:
+            media_files, thumbnail_file = make_media_files(args.ffmpeg, sizes, work_dir)
+        server = SyntheticMediaServer(
+            sizes,
+            playlists=args.playlists,
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            media_files=media_files,
+            thumbnail_file=thumbnail_file,
+            seed=args.seed,
+        )
+        server.start()
+        common = {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "yt_dlp": yt_dlp.version.__version__,
+            "cpus": os.cpu_count(),
+            "latency": args.latency,
+            "failure_rate": args.failure_rate,
+            "playlists": args.playlists,
+        }
+        try:
+            for (mode, thumbnail, threads, policy), _ in product(
+                settings, range(args.repeat)
+            ):
+                result = run_benchmark(
+                    server,
+                    work_dir,
+                    args.ffmpeg,
+                    mode,
+                    thumbnail,
+                    threads,
+                    policy,
+                    args.analysis_threads,
+                    args.postprocess_threads,
+                    args.retry_delay,
+                )
+                result = {**common, **result}
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+                print(
+                    f"{mode.name} {thumbnail.name} threads={threads} "
+                    f"{policy.value}: "
+                    f"{result['throughput_bytes_per_second'] / 2**20:.1f} MiB/s, "
+                    f"p50 {result['latency_p50_seconds']:.2f}s, "
+                    f"p95 {result['latency_p95_seconds']:.2f}s, "
+                    f"cpu {result['cpu_seconds']:.2f}s, "
+                    f"{result['successes']} / {result['videos']}"
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from re import fullmatch, search
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+YOUTUBE_HOSTS: tuple[str, ...] = (
+    "youtube.com",
+    "www.youtube.com",
+    "m.youtube.com",
+    "music.youtube.com",
+    "www.youtube-nocookie.com",
+)
+SHORT_HOSTS: tuple[str, ...] = ("youtu.be", "www.youtu.be")
+# Paths whose next part is the id of the video, such as '/shorts/abc123'
+VIDEO_ID_PATHS: tuple[str, ...] = ("shorts", "embed", "live", "v")
+TRACKING_PARAMS: tuple[str, ...] = (
+    "si",
+    "feature",
+    "pp",
+    "fbclid",
+    "gclid",
+    "igshid",
+)
+VIDEO_ID_PATTERN = r"[\w-]{11}"
+
+
+def canonicalize_url(url: str) -> str:
+    """Return the canonical form of the url, so that equal resources compare equal.
+
+    Args:
+        url (str): Url entered by the user or obtained from a playlist.
+
+    Returns:
+        str: For YouTube, 'https://www.youtube.com/watch?v=...' for videos,
+        with '&list=...&index=...' only if they are specified, and
+        'https://www.youtube.com/playlist?list=...' for playlists.
+        Other urls lose only the tracking parameters and the fragment.
+
+    Example:
+        >>> canonicalize_url("https://youtu.be/abc123DEF45?si=xyz&t=30")
+        'https://www.youtube.com/watch?v=abc123DEF45'
+        >>> canonicalize_url("https://m.youtube.com/playlist?list=PLx&feature=share")
+        'https://www.youtube.com/playlist?list=PLx'
+    """
+
+    url = url.strip()
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith("utm_")
+    ]
+    if host not in YOUTUBE_HOSTS and host not in SHORT_HOSTS:
+        return urlunsplit(
+            (parts.scheme.lower(), host, parts.path, urlencode(query), "")
+        )
+
+    params = dict(query)
+    path = [part for part in parts.path.split("/") if part]
+    video_id = params.get("v", "")
+    if host in SHORT_HOSTS and path:
+        video_id = path[0]
+    elif len(path) >= 2 and path[0] in VIDEO_ID_PATHS:
+        video_id = path[1]
+    playlist_id = params.get("list", "")
+
+    if fullmatch(VIDEO_ID_PATTERN, video_id):
+        canonical = f"https://www.youtube.com/watch?v={video_id}"
+        if playlist_id:
+            canonical += f"&list={playlist_id}"
+            if params.get("index", "").isdigit():
+                canonical += f"&index={params['index']}"
+        return canonical
+    if playlist_id and path in [["playlist"], ["watch"]]:
+        return f"https://www.youtube.com/playlist?list={playlist_id}"
+    # Channels and the other pages
+    return urlunsplit(("https", "www.youtube.com", parts.path, urlencode(query), ""))
+
+
+def video_key(url: str) -> str:
+    """Return a key which is the same for all urls of a video.
+
+    Example:
+        >>> video_key("https://youtu.be/abc123DEF45")
+        'youtube abc123DEF45'
+        >>> video_key("https://www.youtube.com/watch?v=abc123DEF45&list=PLx")
+        'youtube abc123DEF45'
+    """
+
+    canonical = canonicalize_url(url)
+    match = search(
+        rf"^https://www\.youtube\.com/watch\?v=({VIDEO_ID_PATTERN})", canonical
+    )
+    if match is None:
+        # The id is not known without extraction
+        return canonical
+    return f"youtube {match.group(1)}"
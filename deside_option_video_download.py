@@ -3,26 +3,39 @@ import os
 import re
 import subprocess
 from array import array
+from enum import Enum
 from itertools import zip_longest
 from logging import getLogger
-from typing import Any
+from typing import Any, Iterable, Iterator, TypeVar
 
 from analysis_urls import AnalysisUrls
+from download_archive import DownloadArchive
+from download_scheduler import expected_size
 from enum_config import DownloadMode, FileNameFormat, Thumbnail
 from logger_config import LoggerConfigurator
-from types_config import DlYdlOpts, Playlist, PlaylistList, UrlsDataList, VideoDataList
+from metadata_cache import MetadataCache
+from record_store import RecordStore, RecordView
+from types_config import BatchJob, DlYdlOpts
+from ydl_pool import YoutubeDLPool
 
-UrlTitleIdx = tuple[str, str, int]
-UrlsTitleIdxList = list[UrlTitleIdx]
-
-UrlFilename = tuple[str, str]
-UrlsFilenameList = list[UrlFilename]
+Records = list[RecordView]
+PlaylistRecords = list[Records]
 
 CusOpt = dict[str, Any]
+E = TypeVar("E", bound=Enum)
 
 
 class DesideOptionVideoDownload:
-    def __init__(self, cookie_file: str = "") -> None:
+    def __init__(
+        self,
+        cookie_file: str = "",
+        analysis_threads: int = 1,
+        analysis_timeout: float | None = None,
+        metadata_cache: MetadataCache | None = None,
+        ydl_pool: YoutubeDLPool | None = None,
+        use_archive: bool = True,
+        archive_file: str = "",
+    ) -> None:
         LoggerConfigurator()
         self.logger = getLogger()
         # const
@@ -30,28 +43,43 @@ class DesideOptionVideoDownload:
         self.EXT_M4A: str = ".m4a"
         self.EXT_MP4: str = ".mp4"
         self.PRIVATE_VIDEO_TITLE: str = "[Private video]"
+        self.ARCHIVE_FILENAME: str = "download_archive.txt"
         # variable
         self.ffmpeg_path: str = ""
         self.dir_path: str = ""
         self.cookie_file: str = cookie_file
+        self.analysis_threads: int = analysis_threads
+        self.analysis_timeout: float | None = analysis_timeout
+        self.metadata_cache: MetadataCache | None = metadata_cache
+        self.ydl_pool: YoutubeDLPool | None = ydl_pool
+        self.use_archive: bool = use_archive
+        # "" means the archive in the directory to save files
+        self.archive_file: str = archive_file
+        self.download_archive: DownloadArchive | None = None
+        # Full metadata of the videos, passed to the downloader
+        self.info_dicts: dict[str, dict[str, Any]] = {}
         self.download_mode: DownloadMode = DownloadMode.HIGH
         self.thumbnail_mode: Thumbnail = Thumbnail.PLAIN
         self.file_name_fmt: FileNameFormat = FileNameFormat.PLAIN
         self.can_use_ffmpeg: bool = False
 
-    def run(self) -> tuple[DlYdlOpts, CusOpt, UrlsFilenameList] | None:
+    def run(self) -> tuple[DlYdlOpts, CusOpt, Records] | None:
         urls: list[str] = []
 
         # start
         self.input_dir_path()
 
+        self.open_download_archive()
+
         self.can_use_ffmpeg = self.use_ffmpeg_or()
 
         self.input_urls(urls)
 
-        url_title_idx_li = self.parse_urls(urls)
+        records = self.parse_urls(urls)
+
+        self.skip_downloaded(records.selected_records())
 
-        if not url_title_idx_li:
+        if not any(records.selected):
             self.logger.info(
                 "Video was not selected or failed to retrieve information."
                 " Therefore, it is terminated."
@@ -66,11 +94,187 @@ class DesideOptionVideoDownload:
 
         ydl_opts = self.assembly_ydl_opts()
 
-        multi_url_filename = self.assembly_file_name(url_title_idx_li)
+        multi_record = self.assembly_file_name(records.selected_records())
 
         custom_opt = self.assembly_custom_opt()
 
-        return (ydl_opts, custom_opt, multi_url_filename)
+        return (ydl_opts, custom_opt, multi_record)
+
+    def run_pipelined(
+        self,
+    ) -> tuple[DlYdlOpts, CusOpt, Iterator[RecordView]]:
+        """Same as 'run', but the urls are analyzed while the videos are downloaded.
+
+        Returns:
+            tuple[DlYdlOpts, CusOpt, Iterator[RecordView]]: The options and a
+            generator of videos with file names, which analyzes the urls as it
+            is read.
+
+        Note:
+            All options are selected before the analysis. All videos in the
+            playlists are downloaded, except private ones, since the range
+            cannot be selected before the playlist is listed.
+        """
+
+        urls: list[str] = []
+
+        self.input_dir_path()
+
+        self.open_download_archive()
+
+        self.can_use_ffmpeg = self.use_ffmpeg_or()
+
+        self.input_urls(urls)
+
+        self.select_download_mode()
+
+        self.select_thumbnail()
+
+        self.select_filename()
+
+        ydl_opts = self.assembly_ydl_opts()
+
+        custom_opt = self.assembly_custom_opt()
+
+        return (ydl_opts, custom_opt, self.iter_records(urls))
+
+    def run_job(self, job: BatchJob) -> tuple[DlYdlOpts, CusOpt, Records] | None:
+        """Same as 'run', but the options are given by job instead of the prompts.
+
+        Args:
+            job (BatchJob): Options usually entered in the prompts, typically
+            read from a job file with 'batch_job.load_job'.
+
+        Returns:
+            tuple[DlYdlOpts, CusOpt, Records] | None: The same as 'run'.
+
+        Raises:
+            ValueError: If an option of job is invalid, such as a mode that
+            requires ffmpeg without a usable 'ffmpeg_path'.
+
+        Note:
+            Nothing is read from the terminal, so it can be used from a script
+            or a scheduled task. The directory to save files is created if it
+            does not exist. The videos of a playlist are selected by the range
+            of its number in 'playlist_ranges', or of "default", in the same
+            notation as the prompt, such as "1, 5-7". All videos are selected
+            if neither is given.
+
+        Example:
+            >>> optioner = DesideOptionVideoDownload()
+            >>> result = optioner.run_job(
+            ...     {
+            ...         "dir_path": "videos",
+            ...         "urls": ["https://www.youtube.com/playlist?list=cba321"],
+            ...         "playlist_ranges": {"1": "1-10"},
+            ...         "download_mode": "M4A",
+            ...     }
+            ... )
+        """
+
+        self.download_mode = self._job_enum(DownloadMode, job, "download_mode")
+        self.thumbnail_mode = self._job_enum(Thumbnail, job, "thumbnail_mode")
+        self.file_name_fmt = self._job_enum(FileNameFormat, job, "file_name_format")
+        self.ffmpeg_path = job.get("ffmpeg_path", "")
+        self.can_use_ffmpeg = self.ffmpeg_execution_test(self.ffmpeg_path)
+        if self.ffmpeg_path and not self.can_use_ffmpeg:
+            raise ValueError(f"ffmpeg cannot be run: '{self.ffmpeg_path}'")
+        needs_ffmpeg = (
+            self.download_mode == DownloadMode.WAV
+            or self.thumbnail_mode
+            in [
+                Thumbnail.GET_PNG,
+                Thumbnail.SET,
+                Thumbnail.GET_AND_SET,
+            ]
+        )
+        if needs_ffmpeg and not self.can_use_ffmpeg:
+            raise ValueError(
+                f"'{self.download_mode.name}' and '{self.thumbnail_mode.name}' "
+                "require 'ffmpeg_path'."
+            )
+
+        os.makedirs(job["dir_path"], exist_ok=True)
+        self.dir_path = job["dir_path"]
+        self.logger.info(f"'{self.dir_path}' is selected as the storage location.")
+        self.open_download_archive()
+
+        urls: list[str] = [url for url in job.get("urls", []) if url.strip()]
+        for csv_path in job.get("csv_files", []):
+            if not os.path.isfile(csv_path):
+                raise ValueError(f"'{csv_path}' does not exist.")
+            self.read_from_csv_file(urls, csv_path)
+        if not urls:
+            raise ValueError("No urls are given by 'urls' or 'csv_files'.")
+
+        records = self.parse_urls(urls, job.get("playlist_ranges", {}))
+        self.skip_downloaded(records.selected_records())
+        if not any(records.selected):
+            self.logger.info(
+                "Video was not selected or failed to retrieve information."
+                " Therefore, it is terminated."
+            )
+            return None
+        ydl_opts = self.assembly_ydl_opts()
+        multi_record = self.assembly_file_name(records.selected_records())
+        custom_opt = self.assembly_custom_opt()
+        return (ydl_opts, custom_opt, multi_record)
+
+    def _job_enum(self, enum_type: type[E], job: BatchJob, key: str) -> E:
+        name = job.get(key)
+        if name is None:
+            # The same as the initial values
+            return {
+                "download_mode": self.download_mode,
+                "thumbnail_mode": self.thumbnail_mode,
+                "file_name_format": self.file_name_fmt,
+            }[key]
+        try:
+            return enum_type[str(name).upper()]
+        except KeyError:
+            choices = ", ".join(member.name for member in enum_type)
+            raise ValueError(f"Invalid {key}: '{name}'. Choose from {choices}.")
+
+    def iter_records(self, urls: list[str]) -> Iterator[RecordView]:
+        seen: set[tuple[str, str]] = set()
+        # A small store for each batch, so that memory does not grow
+        records = RecordStore()
+        # Upload dates are retrieved for several videos at once
+        batch_size = 1
+        if "upload_date" in self.sorted_combination():
+            batch_size = self.analysis_threads
+
+        analyzer = AnalysisUrls(
+            cookiefile=self.cookie_file,
+            max_workers=self.analysis_threads,
+            cache=self.metadata_cache,
+            ydl_pool=self.ydl_pool,
+        )
+        for url_data in analyzer.iter_urls_data(urls):
+            if url_data["title"] == self.PRIVATE_VIDEO_TITLE:
+                continue
+            if self.is_downloaded(url_data["url"]):
+                continue
+            records.append(
+                url_data["url"],
+                url_data["title"],
+                url_data["index"],
+                expected_size=url_data.get("expected_size", 0.0),
+            )
+            if len(records) >= batch_size:
+                yield from self._new_file_name(records, seen)
+                records = RecordStore()
+        yield from self._new_file_name(records, seen)
+
+    def _new_file_name(
+        self, records: RecordStore, seen: set[tuple[str, str]]
+    ) -> Iterator[RecordView]:
+        if len(records) == 0:
+            return
+        for record in self.assembly_file_name(list(records)):
+            if (record.url, record.filename) not in seen:
+                seen.add((record.url, record.filename))
+                yield record
 
     def input_urls(self, urls: list[str]) -> list[str]:
         USAGE_MESS = (
@@ -135,6 +339,27 @@ class DesideOptionVideoDownload:
                     self.logger.warning(f"Cannot be accessed: '{path}'")
         self.logger.info(f"'{self.dir_path}' is selected as the storage location.")
 
+    def open_download_archive(self) -> None:
+        if not self.use_archive:
+            self.logger.info("The download archive is not used.")
+            return
+        path = self.archive_file or os.path.join(self.dir_path, self.ARCHIVE_FILENAME)
+        self.download_archive = DownloadArchive(path)
+
+    def is_downloaded(self, url: str) -> bool:
+        if self.download_archive is None:
+            return False
+        if self.download_archive.contains_url(url):
+            self.logger.info(f"Already downloaded, so it is skipped. Url: '{url}'")
+            return True
+        return False
+
+    def skip_downloaded(self, multi_record: Records) -> None:
+        # Before the upload dates are retrieved, to save the requests for them
+        for record in multi_record:
+            if self.is_downloaded(record.url):
+                record.selected = False
+
     def use_ffmpeg_or(self) -> bool:
         # Continue when initialized with appropriate values
         ret = self.input_ffmpeg_filepath(only_once=True)
@@ -199,45 +424,63 @@ class DesideOptionVideoDownload:
                 f"'{user_input}' is an invalid input. Please enter {OPT_MESS}."
             )
 
-    def parse_urls(self, urls: list[str]) -> UrlsTitleIdxList:
-        multi_url_title_idx: UrlsTitleIdxList = []
+    def parse_urls(
+        self, urls: list[str], playlist_ranges: dict[str, str] | None = None
+    ) -> RecordStore:
+        """Analyze the urls, and select the videos of the playlists.
 
+        Args:
+            urls (list[str]): Urls of videos and playlists.
+            playlist_ranges (dict[str, str] | None, optional): Range of each
+            playlist, keyed by its number from 1 or "default". Defaults to None,
+            which asks for the range of each playlist in the terminal.
+        """
         self.logger.info("Start parsing the urls.")
-        analyzer = AnalysisUrls(cookiefile=self.cookie_file)
-        urls_data = analyzer.get_urls_data(urls)
+        analyzer = AnalysisUrls(
+            cookiefile=self.cookie_file,
+            max_workers=self.analysis_threads,
+            cache=self.metadata_cache,
+            ydl_pool=self.ydl_pool,
+        )
+        records = analyzer.get_urls_records(urls)
         self.logger.info("Finish parsing the urls.")
-        print()
+        if playlist_ranges is None:
+            print()
 
-        multi_pl_data, nl_data = self.extract_playlist(urls_data)
+        multi_pl_data, nl_data = self.extract_playlist(records)
 
-        for a in nl_data:
-            multi_url_title_idx.append((a["url"], a["title"], 0))
+        for record in nl_data:
+            record.selected = True
 
         if len(multi_pl_data) == 0:
-            return multi_url_title_idx
+            return records
+        if playlist_ranges is not None:
+            for idx, pl_data in enumerate(multi_pl_data, start=1):
+                text = playlist_ranges.get(str(idx), playlist_ranges.get("default"))
+                bool_arr = self.select_range_from_text(pl_data, text or "all")
+                for i, record in enumerate(pl_data):
+                    record.selected = bool(bool_arr[i])
+            return records
         print(f"{len(multi_pl_data)} playlists are included in urls.")
         for idx, pl_data in enumerate(multi_pl_data, start=1):
             print(f"Playlist for the {idx} / {len(multi_pl_data)}.")
             bool_arr = self.select_range_playlist(pl_data)
-            for idx, data in enumerate(pl_data):
-                if bool_arr[idx]:
-                    multi_url_title_idx.append(
-                        (data["url"], data["title"], data["index"])
-                    )
-        return multi_url_title_idx
+            for idx, record in enumerate(pl_data):
+                record.selected = bool(bool_arr[idx])
+        return records
 
     def extract_playlist(
         # fmt: off
             self,
-            urls_data: UrlsDataList,
+            urls_data: Iterable[RecordView],
         # fmt: on
-    ) -> tuple[PlaylistList, VideoDataList]:
+    ) -> tuple[PlaylistRecords, Records]:
         """Methods for extracting playlists.
 
         Args:
-            urls_data (List[Dict[str, Any]]): List of url data. Each data
-            is in dictionary format and has an "index" key, which represents the order
-            in the playlist.
+            urls_data (Iterable[RecordView]): Videos of a RecordStore. Each data
+            can be read like a dictionary and has an "index" key, which represents
+            the order in the playlist. (Shown as dictionaries in the example)
 
         Returns:
             tuple[]: Returns a tuple of playlist data and non-playlist data.
@@ -314,9 +557,9 @@ class DesideOptionVideoDownload:
             ]
         """
 
-        multi_pl_data: PlaylistList = []  # Listed by playlist
-        nl_data: VideoDataList = []  # Normal video, not a playlist
-        pl_data: Playlist = []
+        multi_pl_data: PlaylistRecords = []  # Listed by playlist
+        nl_data: Records = []  # Normal video, not a playlist
+        pl_data: Records = []
         last_idx: int = 0
 
         for data in urls_data:
@@ -336,7 +579,7 @@ class DesideOptionVideoDownload:
             multi_pl_data.append(pl_data)
         return multi_pl_data, nl_data
 
-    def select_range_playlist(self, pl_data: Playlist) -> array:
+    def select_range_playlist(self, pl_data: Records) -> array:
         USAGE = (
             "Specify the range to be downloaded by index. "
             "Specifying outside the range will be ignored. "
@@ -368,24 +611,39 @@ class DesideOptionVideoDownload:
                 elif part == "usage":
                     print(USAGE)
                     continue
-                ret = self.analyze_range_input(part, pl_data, bool_arr)
-                if not ret[0]:
-                    self.logger.info(
-                        f"Entered '{part}' is skipped due to syntax error."
-                    )
-                elif not ret[1]:
-                    self.logger.info(
-                        "The out-of-range portion of the entered value was ignored."
-                    )
+                self._apply_range_part(part, pl_data, bool_arr)
+
+    def select_range_from_text(self, pl_data: Records, text: str) -> array:
+        """Same as 'select_range_playlist', but the range is given by text.
+
+        Example:
+            >>> bool_arr = optioner.select_range_from_text(pl_data, "1, 5-7")
+        """
+        bool_arr = array("b", [0] * len(pl_data))
+        for part in re.sub(r"\s+", "", text.lower()).split(","):
+            # The commands only for the prompt are ignored
+            if part not in ["", "f", "usage", "display"]:
+                self._apply_range_part(part, pl_data, bool_arr)
+        self.disable_private_videos(bool_arr, pl_data)
+        return bool_arr
+
+    def _apply_range_part(self, part: str, pl_data: Records, bool_arr: array) -> None:
+        ret = self.analyze_range_input(part, pl_data, bool_arr)
+        if not ret[0]:
+            self.logger.info(f"Entered '{part}' is skipped due to syntax error.")
+        elif not ret[1]:
+            self.logger.info(
+                "The out-of-range portion of the entered value was ignored."
+            )
 
     def analyze_range_input(
-        self, part: str, pl_data: Playlist, bool_arr: array
+        self, part: str, pl_data: Records, bool_arr: array
     ) -> tuple[bool, bool]:
         """Set the specified range to True.
 
         Args:
             part (str): String representing a range. (lower-case)
-            pl_data (Playlist): A list of playlist from which to select
+            pl_data (Records): A list of playlist from which to select
             a range.
             bool_arr (array): Download each video in the playlist or.
 
@@ -403,10 +661,14 @@ class DesideOptionVideoDownload:
             self.array_bool_change(bool_arr, 0, len(bool_arr) - 1)
             return RET_CORRECT
         elif part == "original":
+            found = False
+            # More than one if the playlist is specified by several urls
             for data in pl_data:
                 if data["directly_specified"]:
                     bool_arr[data["index"] - 1] = True
-                    return RET_CORRECT
+                    found = True
+            if found:
+                return RET_CORRECT
             # Since the url of the playlist itself is specified
             return RET_RANGE_ERROR
         elif part == "display":
@@ -445,7 +707,7 @@ class DesideOptionVideoDownload:
                 return RET_RANGE_ERROR
         return RET_CORRECT
 
-    def disable_private_videos(self, bool_arr: array, pl_data: Playlist) -> None:
+    def disable_private_videos(self, bool_arr: array, pl_data: Records) -> None:
         for i, data in enumerate(pl_data):
             if data["title"] == self.PRIVATE_VIDEO_TITLE:
                 bool_arr[i] = False  # TODO 似ているやつ別メソッドに
@@ -493,9 +755,8 @@ class DesideOptionVideoDownload:
             "5": "Get and Set thumbnails, ext=png",
         }
         MODE_NOTE = (
-            "Thumbnails cannot be specified if the download format is an audio file. "
-            "3 to 5 require 'ffmpeg.exe'. When embedding a thumbnail, "
-            "add the image to the very first frame of the video."
+            "3 to 5 require 'ffmpeg.exe'. When setting a thumbnail, "
+            "it is embedded as the cover art of the video or the audio file."
         )
 
         print("Select settings about thumbnails.")
@@ -580,34 +841,47 @@ class DesideOptionVideoDownload:
 
     def assembly_file_name(
         # fmt: off
-            self, url_title_idx_li: UrlsTitleIdxList
+            self, multi_record: Records
         # fmt: on
-    ) -> UrlsFilenameList:
-        multi_url_filename: UrlsFilenameList = []
-        # Get the order of items for file names
-        combination_dict: dict[str, int] = self.calculate_combination()
-        combination: tuple[str, ...] = tuple(
-            key
-            for key, value in sorted(combination_dict.items(), key=lambda x: x[1])
-            if value != -1
-        )
+    ) -> Records:
+        combination: tuple[str, ...] = self.sorted_combination()
         # Get the upload date, only if upload date is used as the file name
-        multi_upload_date: list[str] = []
+        multi_upload_date: list[str | None] = []
         if "upload_date" in combination:
             multi_upload_date = self.get_upload_date(
-                [url_title_idx[0] for url_title_idx in url_title_idx_li]
+                [record.url for record in multi_record]
             )
-        # Create a list of file name and url tuples
-        for url_title_idx, upload_date in zip_longest(
-            url_title_idx_li, multi_upload_date
-        ):
-            url_filename = self.assembly_filename(
-                url_title_idx,
+            # The full metadata tells the size better than the playlist
+            for record in multi_record:
+                info = self.info_dicts.get(record.url)
+                if info is not None and expected_size(info) > 0:
+                    record.expected_size = expected_size(info)
+        # Set the file name of each record
+        for record, upload_date in zip_longest(multi_record, multi_upload_date):
+            record.filename = self.assembly_filename(
+                record,
                 upload_date,
                 combination,
             )
-            multi_url_filename.append(url_filename)
-        return multi_url_filename
+        # Two threads must not download to the same file
+        unique_record: dict[tuple[str, str], RecordView] = {}
+        for record in multi_record:
+            unique_record.setdefault((record.url, record.filename), record)
+        if len(unique_record) < len(multi_record):
+            self.logger.info(
+                f"{len(multi_record) - len(unique_record)} "
+                "duplicate downloads are removed."
+            )
+        return list(unique_record.values())
+
+    def sorted_combination(self) -> tuple[str, ...]:
+        # Get the order of items for file names
+        combination_dict: dict[str, int] = self.calculate_combination()
+        return tuple(
+            key
+            for key, value in sorted(combination_dict.items(), key=lambda x: x[1])
+            if value != -1
+        )
 
     def calculate_combination(self) -> dict[str, int]:
         T = "title"
@@ -638,15 +912,27 @@ class DesideOptionVideoDownload:
             combination[item] = i
         return combination
 
-    def get_upload_date(self, urls: list[str]) -> list[str]:
+    def get_upload_date(self, urls: list[str]) -> list[str | None]:
         UPLOAD_DATE = "upload_date"
-        multi_upload_date: list[str] = []
+        multi_upload_date: list[str | None] = []
 
         self.logger.info("Start getting the upload date.")
-        analyzer = AnalysisUrls(cookiefile=self.cookie_file)
-        multi_data = analyzer.get_urls_detailed_data(urls, UPLOAD_DATE)
+        analyzer = AnalysisUrls(
+            cookiefile=self.cookie_file,
+            max_workers=self.analysis_threads,
+            cache=self.metadata_cache,
+            ydl_pool=self.ydl_pool,
+        )
+        multi_data = analyzer.get_urls_detailed_data(
+            urls, UPLOAD_DATE, timeout=self.analysis_timeout, keep_info=True
+        )
+        self.info_dicts.update(analyzer.info_dicts)
         self.logger.info("Finish getting the upload date.")
+        # Keep the same length as urls so that each date stays with its url
         for data in multi_data:
+            if data is None:
+                multi_upload_date.append(None)
+                continue
             date = data[UPLOAD_DATE]
             if not isinstance(date, str):
                 self.logger.error(f"Unexpected error. Date: '{date}'")
@@ -657,22 +943,24 @@ class DesideOptionVideoDownload:
     def assembly_filename(
         # fmt:off
             self,
-            url_title_idx: UrlTitleIdx,
+            record: RecordView,
             upload_date: str | None,
             combination: tuple[str, ...],
         # fmt:on
-    ) -> UrlFilename:
+    ) -> str:
         DELIM = ","
         filename: str = ""
         ext: str = ""
-        url, title, idx = url_title_idx
+        url, title, idx = record.url, record.title, record.index
 
         for item in combination:
             if item == "upload_date":
+                # When the upload date of this url could not be retrieved
                 if upload_date is None:
-                    # TODO ほかにもあるUnexpected errorが起きた時に呼び出すメソッド
-                    # ログ保存用のメソッド作る
-                    self.logger.error("Unexpected error in 'assembly_filename'.")
+                    self.logger.warning(
+                        f"Upload date is unknown, so it is left out of the file name. "
+                        f"Url: '{url}'"
+                    )
                     continue
                 filename += upload_date
             elif item == "title":
@@ -687,7 +975,7 @@ class DesideOptionVideoDownload:
             ext = self.EXT_M4A
         else:
             ext = self.EXT_MP4
-        return (url, filename.strip(DELIM) + ext)
+        return filename.strip(DELIM) + ext
 
     def remove_symbols(self, string: str) -> str:
         pattern = re.compile(r"\W")
@@ -700,6 +988,8 @@ class DesideOptionVideoDownload:
             "ffmpeg_path": self.ffmpeg_path,
             "download_mode": self.download_mode,
             "thumbnail_mode": self.thumbnail_mode,
+            "info_dicts": self.info_dicts,
+            "download_archive": self.download_archive,
         }
 
 
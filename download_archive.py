@@ -0,0 +1,77 @@
+import os
+from logging import getLogger
+from threading import Lock
+from typing import Any
+
+from canonical_url import canonicalize_url, video_key
+from logger_config import LoggerConfigurator
+
+
+class DownloadArchive:
+    """A persistent record of the downloaded videos, keyed by extractor and id.
+
+    The file has the same format as the 'download_archive' of yt-dlp, one
+    'extractor id' per line, so it can also be used with yt-dlp itself.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        """Initialize the DownloadArchive object.
+
+        Args:
+            file_path (str): Path to the archive file. Created when the first
+            video is recorded.
+
+        Example:
+            >>> archive = DownloadArchive("dir/download_archive.txt")
+            >>> archive.contains_url("https://www.youtube.com/watch?v=abc123DEF45")
+            False
+        """
+
+        LoggerConfigurator()
+        self.logger = getLogger()
+
+        self.file_path: str = file_path
+        self._lock = Lock()
+        self._ids: set[str] = set()
+        if os.path.isfile(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                # A line cut off by a crash does not match any id
+                self._ids = {line.strip() for line in f if line.strip()}
+        self.logger.debug(f"{len(self._ids)} videos are in '{file_path}'.")
+
+    def __contains__(self, archive_id: str) -> bool:
+        return archive_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def contains_url(self, url: str) -> bool:
+        """Return True if the video of url is recorded.
+
+        Note:
+            Only urls whose id is known without extraction (YouTube videos)
+            can be found, False is returned for the other urls.
+        """
+        archive_id = self.archive_id_from_url(url)
+        return archive_id is not None and archive_id in self._ids
+
+    def record(self, info: dict[str, Any]) -> None:
+        """Record the video of the metadata returned by yt-dlp."""
+        extractor = info.get("extractor_key") or info.get("ie_key")
+        if not extractor or not info.get("id"):
+            return
+        archive_id = f"{extractor.lower()} {info['id']}"
+        with self._lock:
+            if archive_id in self._ids:
+                return
+            # One write of a whole line, flushed before it is added to the set
+            with open(self.file_path, "a", encoding="utf-8") as f:
+                f.write(archive_id + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._ids.add(archive_id)
+
+    def archive_id_from_url(self, url: str) -> str | None:
+        key = video_key(url)
+        # Other keys are the urls themselves
+        return key if key != canonicalize_url(url) else None
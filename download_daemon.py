@@ -0,0 +1,719 @@
+"""Service that keeps the downloader warm and takes jobs over a local HTTP API.
+
+Jobs have the same options as the job files of 'main.py --job', except
+'ffmpeg_path', and their paths must be absolute. 'submit' makes the relative
+paths of a job file relative to its directory. The jobs are run one after
+another, and their state is kept in the state directory, so that the jobs left
+unfinished are resumed when the daemon is started again.
+
+API, in JSON:
+    POST   /jobs       Submit a job, returns its state with "id".
+    GET    /jobs       States of all jobs.
+    GET    /jobs/<id>  State of a job.
+    DELETE /jobs/<id>  Cancel a job.
+
+Every request needs 'Authorization: Bearer <token>', where the token is in the
+file 'token' of the state directory, and a POST also needs
+'Content-Type: application/json'. Requests with an 'Origin' header, or to a
+host other than 127.0.0.1:<port>, are rejected, so that web pages cannot call
+the API.
+
+Example:
+    python ./download_daemon.py --port 8765 serve --threads 4 --ffmpeg ffmpeg
+    python ./download_daemon.py submit job.toml
+    python ./download_daemon.py status
+    python ./download_daemon.py cancel 0123456789abcdef
+"""
+
+import argparse
+import hmac
+import json
+import os
+import secrets
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any, TypedDict
+
+from bandwidth_limiter import BandwidthLimiter, parse_rate
+from batch_job import load_job, load_plan, save_plan, validate_job
+from deside_option_video_download import DesideOptionVideoDownload
+from download_metrics import MetricsRecorder
+from download_retry import RetryPolicy
+from download_scheduler import RecordsPriorityQueue
+from enum_config import SchedulePolicy
+from fragment_budget import FragmentBudget
+from logger_config import LoggerConfigurator
+from metadata_cache import MetadataCache, default_cache_dir
+from types_config import BatchJob
+from video_download import VideoDownloaderQueue
+from ydl_pool import YoutubeDLPool
+
+DEFAULT_PORT: int = 8765
+STATE_FILENAME: str = "jobs.json"
+TOKEN_FILENAME: str = "token"
+# Largest body of a request, a job is far smaller
+MAX_REQUEST_BYTES: int = 4 * 1024 * 1024
+# Statuses of the jobs that will not run again
+FINAL_STATUSES: tuple[str, ...] = ("done", "failed", "cancelled")
+
+
+class JobState(TypedDict):
+    """A job submitted to the daemon, the times are 'time.time()'"""
+
+    id: str
+    # queued, analyzing, downloading, done, failed or cancelled
+    status: str
+    job: BatchJob
+    submitted_at: float
+    finished_at: float  # 0.0 until the job is finished
+    total: int  # Videos to download, 0 until the job is analyzed
+    succeeded: int
+    failed_urls: list[str]
+    # Files finished before the daemon was stopped, not downloaded on resume
+    finished_files: list[str]
+    error: str
+
+
+class DownloadDaemon:
+    """Run the submitted jobs with a YoutubeDL pool and caches kept across jobs.
+
+    Note:
+        Each job is analyzed with 'DesideOptionVideoDownload.run_job', and its
+        videos are saved as a plan in the state directory before they are
+        downloaded. A job stopped while downloading is resumed from its plan,
+        skipping the videos finished before it was stopped, or recorded in the
+        download archive if the daemon was killed.
+    """
+
+    def __init__(
+        self,
+        state_dir: str,
+        cookie_file: str = "",
+        analysis_threads: int = 4,
+        thread_count: int = 4,
+        postprocess_threads: int = 0,
+        policy: SchedulePolicy = SchedulePolicy.LARGEST_FIRST,
+        retry_policy: RetryPolicy | None = None,
+        bandwidth_limiter: BandwidthLimiter | None = None,
+        fragment_budget: FragmentBudget | None = None,
+        metadata_cache: MetadataCache | None = None,
+        ydl_pool: YoutubeDLPool | None = None,
+        use_archive: bool = True,
+        ffmpeg_path: str = "",
+    ) -> None:
+        """Initialize the DownloadDaemon object.
+
+        Args:
+            state_dir (str): Directory of the states and the plans of the jobs.
+            ydl_pool (YoutubeDLPool | None, optional): Pool shared by all jobs.
+            Defaults to None, which creates a new pool with cookie_file.
+            ffmpeg_path (str, optional): ffmpeg used by all jobs, since jobs
+            cannot give it. Defaults to "", which does not use ffmpeg.
+
+            The other arguments are the same as those of
+            DesideOptionVideoDownload and VideoDownloaderQueue, shared by all
+            jobs.
+
+        Example:
+            >>> daemon = DownloadDaemon("state", thread_count=4)
+            >>> daemon.start()
+            >>> state = daemon.submit({"dir_path": "/videos", "urls": [url]})
+            >>> daemon.status(state["id"])[0]["status"]
+            'queued'
+            >>> daemon.stop()
+        """
+
+        LoggerConfigurator()
+        self.logger = getLogger()
+
+        self.state_dir: str = state_dir
+        self.cookie_file: str = cookie_file
+        self.analysis_threads: int = analysis_threads
+        self.thread_count: int = thread_count
+        self.postprocess_threads: int = postprocess_threads
+        self.policy: SchedulePolicy = policy
+        self.retry_policy: RetryPolicy | None = retry_policy
+        self.bandwidth_limiter: BandwidthLimiter | None = bandwidth_limiter
+        self.fragment_budget: FragmentBudget | None = fragment_budget
+        self.metadata_cache: MetadataCache | None = metadata_cache
+        self.ydl_pool: YoutubeDLPool = ydl_pool or YoutubeDLPool(cookie_file)
+        self.use_archive: bool = use_archive
+        self.ffmpeg_path: str = ffmpeg_path
+        # Guards the states, the running job and the state file
+        self._lock = Lock()
+        self._jobs: dict[str, JobState] = {}
+        self._pending: Queue[str | None] = Queue()
+        self._thread: Thread | None = None
+        self._stopping: bool = False
+        # The downloader and the metrics of the job being downloaded
+        self._running: tuple[str, VideoDownloaderQueue, MetricsRecorder] | None = None
+
+        os.makedirs(state_dir, exist_ok=True)
+        self._load_state()
+
+    def start(self) -> None:
+        """Start running the jobs, beginning with those left unfinished."""
+        self._stopping = False
+        self._thread = Thread(target=self._run_jobs, name="jobs", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after the downloads in progress, leaving the job to be resumed."""
+        with self._lock:
+            self._stopping = True
+            if self._running is not None:
+                self._running[1].cancel()
+        self._pending.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, job: BatchJob) -> JobState:
+        """Add a job to the end of the queue.
+
+        Raises:
+            ValueError: If job has an unknown key or a value of a wrong type,
+            has 'ffmpeg_path', or has a relative path.
+        """
+        job = validate_job(job)
+        # Relative to the directory of the daemon otherwise, not of the client
+        for path in [job["dir_path"], *job.get("csv_files", [])]:
+            if not isinstance(path, str) or not os.path.isabs(path):
+                raise ValueError(f"Paths in a submitted job must be absolute: {path!r}")
+        if "ffmpeg_path" in job:
+            # Not to run any program given over the API
+            raise ValueError(
+                "'ffmpeg_path' cannot be submitted, start the daemon with '--ffmpeg'."
+            )
+        state: JobState = {
+            "id": uuid.uuid4().hex[:16],
+            "status": "queued",
+            "job": job,
+            "submitted_at": time.time(),
+            "finished_at": 0.0,
+            "total": 0,
+            "succeeded": 0,
+            "failed_urls": [],
+            "finished_files": [],
+            "error": "",
+        }
+        with self._lock:
+            self._jobs[state["id"]] = state
+            self._save_state()
+        self._pending.put(state["id"])
+        self.logger.info(f"Job '{state['id']}' is submitted.")
+        return state.copy()
+
+    def status(self, job_id: str | None = None) -> list[dict[str, Any]]:
+        """Return the states of all jobs, or of one job if job_id is given.
+
+        Note:
+            The state of the job being downloaded also has "finished", the
+            number of its videos finished so far.
+        """
+        with self._lock:
+            if job_id is not None and job_id not in self._jobs:
+                raise KeyError(job_id)
+            states: list[dict[str, Any]] = [
+                {**state, "failed_urls": list(state["failed_urls"])}
+                for state in self._jobs.values()
+                if job_id is None or state["id"] == job_id
+            ]
+            running = self._running
+        if running is not None:
+            for state in states:
+                if state["id"] == running[0]:
+                    items = running[2].items()
+                    state["finished"] = sum("status" in item for item in items)
+        return states
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job, returning False if it has already finished.
+
+        Raises:
+            KeyError: If there is no job of job_id.
+
+        Note:
+            The downloads of the job in progress are finished, and its other
+            videos are skipped.
+        """
+        with self._lock:
+            state = self._jobs[job_id]
+            if state["status"] in FINAL_STATUSES:
+                return False
+            state["status"] = "cancelled"
+            state["finished_at"] = time.time()
+            if self._running is not None and self._running[0] == job_id:
+                self._running[1].cancel()
+            self._save_state()
+        self.logger.info(f"Job '{job_id}' is cancelled.")
+        return True
+
+    def close(self) -> None:
+        """Stop, and release the pool of YoutubeDL and the cache."""
+        self.stop()
+        self.ydl_pool.close()
+        if self.metadata_cache is not None:
+            self.metadata_cache.close()
+
+    def _run_jobs(self) -> None:
+        while True:
+            job_id = self._pending.get()
+            if job_id is None or self._stopping:
+                return
+            with self._lock:
+                if self._jobs[job_id]["status"] in FINAL_STATUSES:
+                    continue
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                # Not to stop the daemon for an invalid job or an unexpected error
+                self.logger.error(f"Job '{job_id}' failed: {e}")
+                self._update(job_id, status="failed", error=str(e))
+
+    def _run_job(self, job_id: str) -> None:
+        plan_path = os.path.join(self.state_dir, f"{job_id}.plan.json")
+        with self._lock:
+            state = self._jobs[job_id]
+            is_resumed = state["status"] == "downloading"
+        if is_resumed and os.path.isfile(plan_path):
+            self.logger.info(f"Job '{job_id}' is resumed.")
+            ydl_opts, custom_opt, multi_record = load_plan(plan_path)
+            finished_files = set(state["finished_files"])
+            download_archive = custom_opt["download_archive"]
+            multi_record = [
+                record
+                for record in multi_record
+                if record.filename not in finished_files
+                and not (
+                    download_archive is not None
+                    and download_archive.contains_url(record.url)
+                )
+            ]
+        else:
+            self.logger.info(f"Job '{job_id}' is started.")
+            self._update(job_id, status="analyzing")
+            optioner = DesideOptionVideoDownload(
+                cookie_file=self.cookie_file,
+                analysis_threads=self.analysis_threads,
+                metadata_cache=self.metadata_cache,
+                ydl_pool=self.ydl_pool,
+                use_archive=self.use_archive,
+            )
+            result = optioner.run_job({**state["job"], "ffmpeg_path": self.ffmpeg_path})
+            if result is None:
+                self._update(job_id, status="done")
+                return
+            ydl_opts, custom_opt, multi_record = result
+            save_plan(plan_path, ydl_opts, custom_opt, multi_record)
+            self._update(job_id, status="downloading", total=len(multi_record))
+
+        records_q = RecordsPriorityQueue(policy=self.policy)
+        for record in multi_record:
+            records_q.put(record)
+        metrics = MetricsRecorder()
+        video_downloader = VideoDownloaderQueue(
+            ydl_opts,
+            custom_opt,
+            thread_count=self.thread_count,
+            ydl_pool=self.ydl_pool,
+            postprocess_threads=self.postprocess_threads,
+            retry_policy=self.retry_policy,
+            bandwidth_limiter=self.bandwidth_limiter,
+            fragment_budget=self.fragment_budget,
+            metrics=metrics,
+        )
+        with self._lock:
+            # Cancelled while it was analyzed
+            if state["status"] == "cancelled" or self._stopping:
+                video_downloader.cancel()
+            self._running = (job_id, video_downloader, metrics)
+        try:
+            status_urls_q = video_downloader.start_download(records_q)
+        finally:
+            with self._lock:
+                self._running = None
+
+        with self._lock:
+            while not status_urls_q.empty():
+                is_success, url = status_urls_q.get()
+                if is_success:
+                    state["succeeded"] += 1
+                else:
+                    state["failed_urls"].append(url)
+            state["finished_files"] += [
+                item["filename"]
+                for item in metrics.items()
+                if item.get("status") in ["success", "linked"]
+            ]
+            if state["status"] == "downloading" and not self._stopping:
+                state["status"] = "done"
+                state["finished_at"] = time.time()
+            self._save_state()
+        if state["status"] in FINAL_STATUSES and os.path.isfile(plan_path):
+            os.remove(plan_path)
+        self.logger.info(
+            f"Job '{job_id}' is {state['status']}. Success / Total: "
+            f"'{state['succeeded']} / {state['total']}'"
+        )
+
+    def _update(self, job_id: str, **values: Any) -> None:
+        with self._lock:
+            state = self._jobs[job_id]
+            if state["status"] == "cancelled":
+                return
+            state.update(values)  # type: ignore[typeddict-item]
+            if state["status"] in FINAL_STATUSES:
+                state["finished_at"] = time.time()
+            self._save_state()
+
+    def _load_state(self) -> None:
+        path = os.path.join(self.state_dir, STATE_FILENAME)
+        if not os.path.isfile(path):
+            return
+        jobs: dict[str, JobState] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                states: list[JobState] = json.load(f)
+            for state in states:
+                # Such as a state edited by hand
+                missing = set(JobState.__annotations__) - set(state)
+                if missing:
+                    raise KeyError(f"No {sorted(missing)} in a job")
+                if state["status"] == "analyzing":
+                    # Analyzed again from the start
+                    state["status"] = "queued"
+                jobs[state["id"]] = state
+        except (ValueError, KeyError, TypeError) as e:
+            # Including json.JSONDecodeError, kept for the user to look into
+            broken_path = f"{path}.broken-{time.strftime('%Y%m%d%H%M%S')}"
+            os.replace(path, broken_path)
+            self.logger.error(
+                f"The states of the jobs are broken, starting without them: {e!r}. "
+                f"The file is moved to '{broken_path}'."
+            )
+            return
+        self._jobs.update(jobs)
+        for state in jobs.values():
+            if state["status"] not in FINAL_STATUSES:
+                self._pending.put(state["id"])
+        unfinished = self._pending.qsize()
+        if unfinished:
+            self.logger.info(f"{unfinished} unfinished jobs are resumed.")
+
+    def _save_state(self) -> None:
+        # Called with the lock held, replaced at once not to leave a broken file
+        path = os.path.join(self.state_dir, STATE_FILENAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(list(self._jobs.values()), f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+class DaemonServer(ThreadingHTTPServer):
+    """The HTTP API of a DownloadDaemon, for localhost only."""
+
+    def __init__(self, daemon: DownloadDaemon, port: int, token: str) -> None:
+        """Initialize the DaemonServer object.
+
+        Args:
+            daemon (DownloadDaemon): Daemon to run the jobs.
+            port (int): Port on 127.0.0.1.
+            token (str): Token required in the 'Authorization' header.
+        """
+        self.daemon: DownloadDaemon = daemon
+        self.token: str = token
+        super().__init__(("127.0.0.1", port), _DaemonRequestHandler)
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    server: DaemonServer
+    # Seconds until a client that stopped sending is given up
+    timeout = 30.0
+
+    def do_GET(self) -> None:
+        if not self._is_allowed():
+            return
+        job_id = self._job_id()
+        if job_id is None:
+            return
+        try:
+            states = self.server.daemon.status(job_id or None)
+        except KeyError:
+            self._send_json(404, {"error": f"No job '{job_id}'"})
+            return
+        self._send_json(200, states[0] if job_id else states)
+
+    def do_POST(self) -> None:
+        if not self._is_allowed():
+            return
+        if self.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        body = self._read_json_body()
+        if body is None:
+            return
+        try:
+            job = json.loads(body or b"null")
+            state = self.server.daemon.submit(job)
+        except ValueError as e:
+            # Including json.JSONDecodeError
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(201, state)
+
+    def do_DELETE(self) -> None:
+        if not self._is_allowed():
+            return
+        job_id = self._job_id()
+        if job_id is None:
+            return
+        if not job_id:
+            self._send_json(405, {"error": "Cancel a job by '/jobs/<id>'"})
+            return
+        try:
+            is_cancelled = self.server.daemon.cancel(job_id)
+        except KeyError:
+            self._send_json(404, {"error": f"No job '{job_id}'"})
+            return
+        if not is_cancelled:
+            self._send_json(409, {"error": f"Job '{job_id}' has already finished"})
+            return
+        self._send_json(200, self.server.daemon.status(job_id)[0])
+
+    def log_message(self, format: str, *args: Any) -> None:
+        self.server.daemon.logger.debug(format % args)
+
+    def _is_allowed(self) -> bool:
+        # Sends the error and returns False if the request is not from the client
+        host = f"127.0.0.1:{self.server.server_address[1]}"
+        if self.headers.get("Host") != host or "Origin" in self.headers:
+            self._send_json(403, {"error": "Only requests to localhost are accepted"})
+            return False
+        authorization = self.headers.get("Authorization", "")
+        if not hmac.compare_digest(
+            authorization.encode(), f"Bearer {self.server.token}".encode()
+        ):
+            self._send_json(401, {"error": "Invalid token"})
+            return False
+        return True
+
+    def _read_json_body(self) -> bytes | None:
+        # None after sending the error, without reading more than is sent
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type.lower() != "application/json":
+            self._send_json(415, {"error": "Content-Type must be application/json"})
+            return None
+        if "Content-Length" not in self.headers:
+            self._send_json(411, {"error": "Content-Length is required"})
+            return None
+        try:
+            length = int(self.headers["Content-Length"])
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {"error": "Invalid Content-Length"})
+            return None
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {"error": "The request is too large"})
+            return None
+        try:
+            return self.rfile.read(length)
+        except TimeoutError:
+            self._send_json(408, {"error": "The body is shorter than Content-Length"})
+            return None
+
+    def _job_id(self) -> str | None:
+        # "" for all jobs, None after sending 404 if the path is not of the API
+        parts = self.path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) > 2:
+            self._send_json(404, {"error": "Not found"})
+            return None
+        return parts[1] if len(parts) == 2 else ""
+
+    def _send_json(self, code: int, data: Any) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def load_token(state_dir: str, create: bool = False) -> str:
+    """Read the token of the API in state_dir.
+
+    Args:
+        state_dir (str): State directory of the daemon.
+        create (bool, optional): Create a token readable only by the user if
+        there is none. Defaults to False.
+
+    Raises:
+        OSError: If the token cannot be read or created.
+    """
+    path = os.path.join(state_dir, TOKEN_FILENAME)
+    if create and not os.path.isfile(path):
+        os.makedirs(state_dir, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(secrets.token_urlsafe(32))
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def resolve_job_paths(job: BatchJob, job_path: str) -> BatchJob:
+    """Make the relative paths in a job relative to the directory of its file."""
+    base_dir = os.path.dirname(os.path.abspath(job_path))
+    job["dir_path"] = os.path.join(base_dir, job["dir_path"])
+    if "csv_files" in job:
+        job["csv_files"] = [
+            os.path.join(base_dir, path) if isinstance(path, str) else path
+            for path in job["csv_files"]
+        ]
+    return job
+
+
+def request_api(
+    method: str,
+    path: str,
+    token: str,
+    data: Any = None,
+    port: int = DEFAULT_PORT,
+) -> Any:
+    """Call the API of a daemon on localhost, returning the JSON it sent."""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data=None if data is None else json.dumps(data).encode(),
+        method=method,
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+
+def analysis_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port of the API on localhost. Defaults to {DEFAULT_PORT}.",
+    )
+    parser.add_argument(
+        "--state-dir",
+        type=str,
+        default=os.path.join(default_cache_dir(), "daemon"),
+        help="Directory of the states of the jobs and the token of the API, "
+        "kept across restarts.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the daemon.")
+    serve.add_argument(
+        "--ffmpeg",
+        type=str,
+        default="",
+        help="Path of ffmpeg for all jobs. Defaults to none.",
+    )
+    same = "The same as main.py, for all jobs."
+    serve.add_argument("-c", "--cookiefile", type=str, default="", help=same)
+    serve.add_argument("-a", "--analysis-threads", type=int, default=4, help=same)
+    serve.add_argument("-t", "--threads", type=int, default=4, help=same)
+    serve.add_argument("--postprocess-threads", type=int, default=0, help=same)
+    serve.add_argument(
+        "--schedule",
+        type=str,
+        choices=[policy.value for policy in SchedulePolicy],
+        default=SchedulePolicy.LARGEST_FIRST.value,
+        help=same,
+    )
+    serve.add_argument("--retries", type=int, default=2, help=same)
+    serve.add_argument("--retry-delay", type=float, default=5.0, help=same)
+    serve.add_argument("--limit-rate", type=parse_rate, default=0.0, help=same)
+    serve.add_argument("--fragments", type=int, default=16, help=same)
+    serve.add_argument("--no-archive", action="store_true", help=same)
+    serve.add_argument("--no-cache", action="store_true", help=same)
+    serve.add_argument("--cache-dir", type=str, default="", help=same)
+
+    submit = commands.add_parser("submit", help="Submit a job file.")
+    submit.add_argument("job", help="Job file in TOML or JSON, as for main.py.")
+    status = commands.add_parser("status", help="Show the states of the jobs.")
+    status.add_argument("id", nargs="?", default="")
+    cancel = commands.add_parser("cancel", help="Cancel a job.")
+    cancel.add_argument("id")
+    return parser.parse_args()
+
+
+def serve(args: argparse.Namespace) -> None:
+    bandwidth_limiter = BandwidthLimiter(args.limit_rate) if args.limit_rate else None
+    metadata_cache = None
+    if not args.no_cache:
+        metadata_cache = MetadataCache(cache_dir=args.cache_dir)
+    daemon = DownloadDaemon(
+        args.state_dir,
+        cookie_file=args.cookiefile.strip(" \"'"),
+        analysis_threads=args.analysis_threads,
+        thread_count=args.threads,
+        postprocess_threads=args.postprocess_threads,
+        policy=SchedulePolicy(args.schedule),
+        retry_policy=RetryPolicy(
+            max_attempts=args.retries + 1, base_delay=args.retry_delay
+        ),
+        bandwidth_limiter=bandwidth_limiter,
+        fragment_budget=FragmentBudget(args.fragments) if args.fragments else None,
+        metadata_cache=metadata_cache,
+        use_archive=not args.no_archive,
+        ffmpeg_path=args.ffmpeg.strip(" \"'"),
+    )
+    server = DaemonServer(daemon, args.port, load_token(args.state_dir, create=True))
+    daemon.start()
+    daemon.logger.info(f"Waiting for jobs on http://127.0.0.1:{args.port}/jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        daemon.logger.info("Stopping after the downloads in progress.")
+    finally:
+        server.server_close()
+        daemon.close()
+
+
+def main() -> None:
+    args = analysis_args()
+    if args.command == "serve":
+        serve(args)
+        return
+    try:
+        token = load_token(args.state_dir)
+    except OSError as e:
+        result = {"error": f"Cannot read the token of the daemon: {e}"}
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    try:
+        if args.command == "submit":
+            job = resolve_job_paths(load_job(args.job), args.job)
+            result = request_api("POST", "/jobs", token, job, args.port)
+        elif args.command == "status":
+            path = f"/jobs/{args.id}".rstrip("/")
+            result = request_api("GET", path, token, port=args.port)
+        else:
+            result = request_api("DELETE", f"/jobs/{args.id}", token, port=args.port)
+    except ValueError as e:
+        result = {"error": str(e)}
+    except urllib.error.URLError as e:
+        result = {"error": f"The daemon is not running on port {args.port}: {e}"}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Iterator, NotRequired, TypedDict
+
+
+class ItemMetrics(TypedDict):
+    """Measurements of a video, the seconds are summed over the retries"""
+
+    url: str
+    filename: str
+    status: NotRequired[str]  # 'success', 'failure' or 'linked'
+    queue_wait_seconds: NotRequired[float]
+    # From the start of the download to the first byte, including the extraction
+    first_byte_seconds: NotRequired[float]
+    transfer_seconds: NotRequired[float]
+    ffmpeg_seconds: NotRequired[float]
+    thumbnail_seconds: NotRequired[float]
+    bytes: NotRequired[int]
+    throughput_bytes_per_second: NotRequired[float]
+    retries: NotRequired[int]
+    error_class: NotRequired[str]
+
+
+# Keys exported as the sums of phase seconds for Prometheus
+PHASE_KEYS: dict[str, str] = {
+    "queue_wait": "queue_wait_seconds",
+    "first_byte": "first_byte_seconds",
+    "transfer": "transfer_seconds",
+    "ffmpeg": "ffmpeg_seconds",
+    "thumbnail": "thumbnail_seconds",
+}
+PROMETHEUS_PREFIX: str = "video_downloader"
+
+
+class TransferProbe:
+    """Progress hook for yt-dlp measuring the first byte and the size of a download.
+
+    Example:
+        >>> probe = TransferProbe()
+        >>> ydl_opts["progress_hooks"] = [probe.hook]
+    """
+
+    def __init__(self) -> None:
+        # 'time.monotonic()' when the first data arrived, None until then
+        self.first_byte: float | None = None
+        self.bytes: int = 0
+        self._downloaded: dict[str, int] = {}
+
+    def hook(self, progress: dict[str, Any]) -> None:
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+        if progress.get("status") != "downloading":
+            return
+        # 'tmpfilename' is not given when the download is finished
+        key = progress.get("filename") or ""
+        downloaded = progress.get("downloaded_bytes") or 0
+        # A resumed download starts from the size of the '.part' file
+        previous = self._downloaded.setdefault(key, downloaded)
+        if downloaded > previous:
+            self.bytes += downloaded - previous
+            self._downloaded[key] = downloaded
+
+
+class MetricsRecorder:
+    """Collect the metrics of each download, and export them after the batch.
+
+    The metrics are keyed by the file name, which is unique in a batch.
+
+    Example:
+        >>> metrics = MetricsRecorder()
+        >>> metrics.set("Title.mp4", "url", "https://www.youtube.com/watch?v=abc123")
+        >>> with metrics.timer("Title.mp4", "ffmpeg_seconds"):
+        ...     convert()
+        >>> metrics.export_jsonl("metrics.jsonl")
+        >>> metrics.export_prometheus("textfile/video_downloader.prom")
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._items: dict[str, ItemMetrics] = {}
+
+    def set(self, filename: str, key: str, value: Any) -> None:
+        with self._lock:
+            self._item(filename)[key] = value  # type: ignore[literal-required]
+
+    def add(self, filename: str, key: str, value: float) -> None:
+        with self._lock:
+            item = self._item(filename)
+            item[key] = item.get(key, 0) + value  # type: ignore[literal-required]
+
+    def add_transfer(self, filename: str, started: float, probe: TransferProbe) -> None:
+        """Split the seconds since started into the first byte and the transfer.
+
+        Args:
+            filename (str): File name of the video.
+            started (float): 'time.monotonic()' when the download started.
+            probe (TransferProbe): Progress of the download.
+        """
+        now = time.monotonic()
+        first_byte = now if probe.first_byte is None else probe.first_byte
+        with self._lock:
+            item = self._item(filename)
+            item["first_byte_seconds"] = item.get("first_byte_seconds", 0.0) + (
+                first_byte - started
+            )
+            item["transfer_seconds"] = item.get("transfer_seconds", 0.0) + (
+                now - first_byte
+            )
+            item["bytes"] = item.get("bytes", 0) + probe.bytes
+
+    @contextmanager
+    def timer(self, filename: str, key: str) -> Iterator[None]:
+        """Add the seconds spent in the with block to key."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(filename, key, time.monotonic() - started)
+
+    def _item(self, filename: str) -> ItemMetrics:
+        return self._items.setdefault(filename, {"url": "", "filename": filename})
+
+    def items(self) -> list[ItemMetrics]:
+        """Return a copy of the metrics of all videos, with their throughput."""
+        with self._lock:
+            items = [ItemMetrics(**item) for item in self._items.values()]
+        for item in items:
+            if item.get("transfer_seconds") and item.get("bytes"):
+                item["throughput_bytes_per_second"] = (
+                    item["bytes"] / item["transfer_seconds"]
+                )
+        return items
+
+    def export_jsonl(self, path: str) -> None:
+        """Write the metrics of each video as a line of JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            for item in self.items():
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def export_prometheus(self, path: str) -> None:
+        """Write the totals of the batch for the textfile collector of Prometheus.
+
+        Note:
+            The file is written to a temporary file and renamed, so that the
+            collector never reads a half-written file.
+        """
+        items = self.items()
+        p = PROMETHEUS_PREFIX
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+
+        metric("items", "gauge", "Videos of the last batch by status.")
+        for status in ["success", "failure", "linked"]:
+            count = sum(item.get("status") == status for item in items)
+            lines.append(f'{p}_items{{status="{status}"}} {count}')
+        metric("phase_seconds", "gauge", "Seconds spent in each phase, summed.")
+        for phase, key in PHASE_KEYS.items():
+            total = sum(item.get(key, 0.0) for item in items)  # type: ignore
+            lines.append(f'{p}_phase_seconds{{phase="{phase}"}} {total:.3f}')
+        metric("bytes", "gauge", "Bytes transferred in the last batch.")
+        lines.append(f"{p}_bytes {sum(item.get('bytes', 0) for item in items)}")
+        metric("retries", "gauge", "Retries in the last batch.")
+        lines.append(f"{p}_retries {sum(item.get('retries', 0) for item in items)}")
+        metric("errors", "gauge", "Failed attempts by the class of the error.")
+        errors: dict[str, int] = {}
+        for item in items:
+            if "error_class" in item:
+                errors[item["error_class"]] = errors.get(item["error_class"], 0) + 1
+        for name, count in sorted(errors.items()):
+            lines.append(f'{p}_errors{{error_class="{name}"}} {count}')
+        metric("last_run_timestamp_seconds", "gauge", "End of the last batch.")
+        lines.append(f"{p}_last_run_timestamp_seconds {time.time():.0f}")
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
@@ -0,0 +1,103 @@
+import random
+
+import yt_dlp
+from yt_dlp.networking.exceptions import HTTPError, network_exceptions
+from yt_dlp.utils import ExtractorError, GeoRestrictedError, UnsupportedError
+
+# Parts of the messages of errors that do not change by retrying
+PERMANENT_ERROR_MESSAGES: tuple[str, ...] = (
+    "private video",
+    "video unavailable",
+    "has been removed",
+    "account associated with this video has been terminated",
+    "sign in to confirm your age",
+    "members-only",
+    "join this channel",
+    "not available in your country",
+    "copyright",
+    "requested format is not available",
+)
+# HTTP status codes that are worth retrying, such as rate limits
+RETRYABLE_HTTP_STATUS: tuple[int, ...] = (403, 408, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """How many times and how long after a failed download is retried."""
+
+    def __init__(
+        self, max_attempts: int = 3, base_delay: float = 5.0, max_delay: float = 300.0
+    ) -> None:
+        """Initialize the RetryPolicy object.
+
+        Args:
+            max_attempts (int, optional): Number of attempts including the
+            first one. Defaults to 3, and 1 disables retrying.
+            base_delay (float, optional): Seconds before the first retry,
+            doubled for each further retry. Defaults to 5.0.
+            max_delay (float, optional): Upper bound of the seconds before a
+            retry. Defaults to 300.0.
+
+        Example:
+            >>> policy = RetryPolicy(max_attempts=5)
+            >>> policy.can_retry(error, attempts=1)
+            True
+            >>> policy.delay(attempts=3)  # 10 to 20 seconds
+            14.2
+        """
+
+        self.max_attempts: int = max(1, max_attempts)
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+
+    def can_retry(self, error: Exception, attempts: int) -> bool:
+        """Return True if the download may succeed after 'attempts' failures."""
+        return attempts < self.max_attempts and is_retryable(error)
+
+    def delay(self, attempts: int) -> float:
+        # Exponential backoff with jitter, so that the threads that failed at
+        # the same time do not retry at the same time
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Classify an error of yt-dlp as temporary (True) or permanent (False).
+
+    Note:
+        Network errors and unknown errors are temporary, since the number of
+        retries is limited anyway. Private, removed or unsupported videos are
+        permanent.
+    """
+
+    cause = _cause(error)
+    if isinstance(cause, HTTPError):
+        return cause.status in RETRYABLE_HTTP_STATUS
+    if isinstance(cause, (UnsupportedError, GeoRestrictedError)):
+        return False
+    message = str(error).lower()
+    if any(part in message for part in PERMANENT_ERROR_MESSAGES):
+        return False
+    if isinstance(cause, ExtractorError):
+        # Expected errors are the messages of the site, not of the network
+        return not cause.expected
+    return True
+
+
+def error_class(error: Exception) -> str:
+    """Return the name of the original error, such as 'HTTPError 429'."""
+    cause = _cause(error)
+    if isinstance(cause, HTTPError):
+        return f"{type(cause).__name__} {cause.status}"
+    return type(cause).__name__
+
+
+def _cause(error: Exception) -> Exception:
+    cause = error
+    if isinstance(error, yt_dlp.DownloadError) and error.exc_info:
+        cause = error.exc_info[1] or error
+    if isinstance(cause, ExtractorError):
+        # Such as 'Unable to download webpage' caused by a network error
+        inner = cause.cause or cause.exc_info[1]
+        if isinstance(inner, network_exceptions):
+            cause = inner
+    return cause
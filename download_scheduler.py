@@ -0,0 +1,81 @@
+import math
+from heapq import heappop, heappush
+from queue import Queue
+from typing import Any
+
+from enum_config import SchedulePolicy
+from record_store import RecordView
+
+# Used when only the duration is known, about 720p at 30fps
+ASSUMED_BYTES_PER_SECOND: float = 2_500_000 / 8
+
+
+def expected_size(info: dict[str, Any]) -> float:
+    """Estimate the bytes of a video from its metadata, 0.0 if unknown.
+
+    Args:
+        info (dict[str, Any]): Metadata of a video, or an entry of a playlist
+        extracted with 'extract_flat'.
+
+    Returns:
+        float: 'filesize' or 'filesize_approx' if they exist, otherwise
+        estimated from 'duration'.
+
+    Example:
+        >>> expected_size({"filesize_approx": 1000, "duration": 60})
+        1000.0
+        >>> expected_size({"duration": 60})
+        18750000.0
+    """
+
+    size = info.get("filesize") or info.get("filesize_approx")
+    if size:
+        return float(size)
+    return float(info.get("duration") or 0) * ASSUMED_BYTES_PER_SECOND
+
+
+class RecordsPriorityQueue(Queue):
+    """A RecordsQ which hands out the videos in the order of a SchedulePolicy.
+
+    Note:
+        The None that tells the threads to finish is handed out after all
+        videos, and videos of the same priority keep the order they were put.
+        Videos whose size is unknown are regarded as 0 bytes.
+
+    Example:
+        >>> records_q = RecordsPriorityQueue(policy=SchedulePolicy.LARGEST_FIRST)
+        >>> for record in records:
+        ...     records_q.put(record)
+        >>> records_q.get().expected_size == max(r.expected_size for r in records)
+        True
+    """
+
+    def __init__(
+        self, maxsize: int = 0, policy: SchedulePolicy = SchedulePolicy.FIFO
+    ) -> None:
+        self.policy: SchedulePolicy = policy
+        super().__init__(maxsize)
+
+    # Same as queue.PriorityQueue, with the priority computed from the item
+    def _init(self, maxsize: int) -> None:
+        self.queue: list[tuple[float, int, RecordView | None]] = []
+        self._count: int = 0
+
+    def _qsize(self) -> int:
+        return len(self.queue)
+
+    def _put(self, item: RecordView | None) -> None:
+        heappush(self.queue, (self._priority(item), self._count, item))
+        self._count += 1
+
+    def _get(self) -> RecordView | None:
+        return heappop(self.queue)[2]
+
+    def _priority(self, item: RecordView | None) -> float:
+        if item is None:
+            return math.inf
+        if self.policy == SchedulePolicy.LARGEST_FIRST:
+            return -item.expected_size
+        if self.policy == SchedulePolicy.SMALLEST_FIRST:
+            return item.expected_size
+        return 0.0
@@ -32,3 +32,11 @@ class FileNameFormat(Enum):
     X_D_T = 8
     T_X_D = 9
     T_D_X = 10
+
+
+class SchedulePolicy(Enum):
+    """Order in which the queued videos are downloaded"""
+
+    FIFO = "fifo"
+    LARGEST_FIRST = "largest"
+    SMALLEST_FIRST = "smallest"
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+# ioctl of Linux to share the data blocks of two files (btrfs, xfs, ...)
+FICLONE: int = 0x40049409
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """Make dst a file with the same content as src, without copying if possible.
+
+    Args:
+        src (str): Path of an existing file.
+        dst (str): Path of the file to be created.
+
+    Returns:
+        str: How dst was created, 'hardlink', 'reflink' or 'copy'.
+
+    Raises:
+        FileExistsError: If dst already exists.
+        OSError: If dst cannot be created in any way.
+
+    Example:
+        >>> link_or_copy("dir/1,Title.mp4", "dir/5,Title.mp4")
+        'hardlink'
+    """
+
+    if os.path.lexists(dst):
+        raise FileExistsError(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        # Another file system, or not supported by the file system
+        pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        # Not available on Windows
+        return False
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+    return False
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Iterator
+
+
+class FragmentBudget:
+    """Share a number of concurrent fragment downloads between the videos.
+
+    DASH and HLS formats are downloaded as many small fragments, and yt-dlp
+    downloads 'concurrent_fragment_downloads' of them at the same time.
+    This sets that option of every active download to its share of the total.
+    """
+
+    def __init__(self, total: int = 16) -> None:
+        """Initialize the FragmentBudget object.
+
+        Args:
+            total (int, optional): Number of fragments downloaded concurrently
+            by all videos together. Defaults to 16.
+
+        Note:
+            yt-dlp reads the option when it starts each format, so a running
+            download gets its new share from its next format (the audio after
+            the video). The total may be exceeded until then.
+
+        Example:
+            >>> budget = FragmentBudget(16)
+            >>> with budget.share(ydl.params):
+            ...     ydl.download([url])  # 16 alone, 8 with another video, ...
+        """
+
+        self.total: int = max(1, total)
+        self._lock = Lock()
+        # Keyed by id, since the params of different downloads may be equal
+        self._active: dict[int, dict[str, Any]] = {}
+
+    @contextmanager
+    def share(self, params: dict[str, Any]) -> Iterator[None]:
+        """Count params as an active download until the end of the with block.
+
+        Args:
+            params (dict[str, Any]): 'params' of the YoutubeDL instance, whose
+            'concurrent_fragment_downloads' is updated while it is active.
+        """
+
+        with self._lock:
+            self._active[id(params)] = params
+            self._rebalance()
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._active[id(params)]
+                self._rebalance()
+
+    def _rebalance(self) -> None:
+        if not self._active:
+            return
+        base, extra = divmod(self.total, len(self._active))
+        for i, params in enumerate(self._active.values()):
+            params["concurrent_fragment_downloads"] = max(1, base + (i < extra))
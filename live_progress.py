@@ -0,0 +1,246 @@
+import sys
+import time
+from threading import Event, Lock, Thread
+from typing import Any, TextIO
+
+
+class WorkerCounter:
+    """Progress of one download worker, which downloads one file at a time.
+
+    Note:
+        The hook is called by the thread of the worker, or by the threads of
+        yt-dlp downloading the fragments of its file at the same time. They
+        share the lock of the counter, not a lock of all workers.
+    """
+
+    __slots__ = (
+        "name",
+        "bytes",
+        "filename",
+        "file_bytes",
+        "file_total",
+        "_lock",
+        "_last_key",
+        "_last_downloaded",
+    )
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.bytes: int = 0
+        # The file being downloaded, "" when the worker is not downloading
+        self.filename: str = ""
+        self.file_bytes: int = 0
+        self.file_total: float = 0.0
+        self._lock = Lock()
+        self._last_key: str = ""
+        self._last_downloaded: int = 0
+
+    def hook(self, progress: dict[str, Any]) -> None:
+        """Progress hook for yt-dlp, given to the downloads of this worker only."""
+        with self._lock:
+            if progress.get("status") != "downloading":
+                # Already counted, or an existing file that was not downloaded
+                self.filename = ""
+                self._last_key = ""
+                return
+            key = progress.get("filename") or ""
+            downloaded = progress.get("downloaded_bytes") or 0
+            if key != self._last_key:
+                # A resumed download starts from the size of the '.part' file
+                self._last_key = key
+                self._last_downloaded = downloaded
+            # The fragments may report their totals out of order
+            if downloaded > self._last_downloaded:
+                self.bytes += downloaded - self._last_downloaded
+                self._last_downloaded = downloaded
+            self.filename = key
+            self.file_bytes = self._last_downloaded
+            self.file_total = (
+                progress.get("total_bytes") or progress.get("total_bytes_estimate") or 0
+            )
+
+    def end_download(self) -> None:
+        """Mark the worker as not downloading, whether it failed or not."""
+        with self._lock:
+            self.filename = ""
+            self._last_key = ""
+
+
+class LiveProgress:
+    """Show the total progress of all download workers on the terminal.
+
+    Each worker counts its own bytes in its WorkerCounter, and a single thread
+    sums the counters and redraws the status at an interval, so the cost of a
+    refresh depends on the number of workers, not of videos.
+    """
+
+    def __init__(
+        self,
+        per_worker: bool = False,
+        interval: float = 1.0,
+        stream: TextIO = sys.stderr,
+    ) -> None:
+        """Initialize the LiveProgress object.
+
+        Args:
+            per_worker (bool, optional): If True, a row is shown for each
+            worker under the total. Defaults to False, a single line.
+            interval (float, optional): Seconds between the refreshes.
+            Defaults to 1.0.
+            stream (TextIO, optional): Where the status is written.
+            Defaults to sys.stderr.
+
+        Note:
+            The status is redrawn in place only if stream is a terminal.
+            Otherwise a line is appended at each refresh.
+
+        Example:
+            >>> progress = LiveProgress(per_worker=True)
+            >>> progress.expect(record.expected_size)  # For each video
+            >>> counter = progress.worker("worker 1")  # For each worker
+            >>> ydl_opts["progress_hooks"] = [counter.hook]
+            >>> progress.start()
+            >>> ...
+            >>> counter.end_download()
+            >>> progress.finished()
+            >>> progress.stop()
+        """
+
+        self.per_worker: bool = per_worker
+        self.interval: float = interval
+        self.stream: TextIO = stream
+        self.is_tty: bool = stream.isatty()
+        # Not taken for each update of the progress
+        self._workers_lock = Lock()
+        self._workers: list[WorkerCounter] = []
+        self._finished_items: int = 0
+        self._expected_bytes: float = 0.0
+        self._expected_items: int = 0
+        self._stop = Event()
+        self._thread: Thread | None = None
+        # Kept by the refreshing thread only
+        self._last_bytes: int = 0
+        self._last_time: float = 0.0
+        self._rate: float = 0.0
+        self._worker_bytes: dict[str, int] = {}
+        self._drawn_lines: int = 0
+        # Weight of the latest interval in the smoothed rate
+        self.RATE_SMOOTHING: float = 0.3
+
+    def expect(self, expected_size: float, items: int = 1) -> None:
+        """Add videos of expected_size bytes to the total, for the ETA."""
+        # Called from the thread that queues the videos only
+        self._expected_bytes += expected_size
+        self._expected_items += items
+
+    def worker(self, name: str) -> WorkerCounter:
+        """Add the counter of a download worker, kept until the end."""
+        counter = WorkerCounter(name)
+        with self._workers_lock:
+            self._workers.append(counter)
+        return counter
+
+    def finished(self) -> None:
+        """Count a video as finished, whether it succeeded or not."""
+        with self._workers_lock:
+            self._finished_items += 1
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._last_time = time.monotonic()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop refreshing, after drawing the final status."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._refresh()
+        if self.is_tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._refresh()
+
+    def _refresh(self) -> None:
+        with self._workers_lock:
+            workers = list(self._workers)
+            finished = self._finished_items
+        now = time.monotonic()
+        total_bytes = sum(worker.bytes for worker in workers)
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            rate = (total_bytes - self._last_bytes) / elapsed
+            self._rate += self.RATE_SMOOTHING * (rate - self._rate)
+        self._last_bytes = total_bytes
+        self._last_time = now
+
+        active = [worker for worker in workers if worker.filename]
+        remaining = max(
+            self._expected_bytes - total_bytes,
+            sum(max(0.0, w.file_total - w.file_bytes) for w in active),
+        )
+        eta = _format_seconds(remaining / self._rate) if self._rate > 0 else "--:--"
+        items = f"{finished} / {self._expected_items or '?'}"
+        lines = [
+            f"[{items}] {_format_bytes(total_bytes)}"
+            + (
+                f" / {_format_bytes(self._expected_bytes)}"
+                if self._expected_bytes
+                else ""
+            )
+            + f"  {_format_bytes(self._rate)}/s  ETA {eta}  active: {len(active)}"
+        ]
+        if self.per_worker:
+            for worker in workers:
+                worker_bytes = worker.bytes
+                worker_rate = (
+                    (worker_bytes - self._worker_bytes.get(worker.name, 0)) / elapsed
+                    if elapsed > 0
+                    else 0.0
+                )
+                self._worker_bytes[worker.name] = worker_bytes
+                lines.append(f"  {worker.name}: {_format_worker(worker, worker_rate)}")
+        self._draw(lines)
+
+    def _draw(self, lines: list[str]) -> None:
+        if not self.is_tty:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+            return
+        # Move to the first line drawn last time, and overwrite the lines
+        text = f"\x1b[{self._drawn_lines - 1}F" if self._drawn_lines > 1 else ""
+        text += "\r" + "\n".join("\x1b[K" + line for line in lines)
+        self.stream.write(text)
+        self.stream.flush()
+        self._drawn_lines = len(lines)
+
+
+def _format_worker(worker: WorkerCounter, rate: float) -> str:
+    if not worker.filename:
+        return "idle"
+    percent = (
+        f"{worker.file_bytes / worker.file_total:4.0%}" if worker.file_total else " ?%"
+    )
+    name = worker.filename.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+    return f"{percent} {_format_bytes(rate)}/s  {name}"
+
+
+def _format_bytes(byte_count: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if byte_count < 1024:
+            return f"{byte_count:.1f} {unit}"
+        byte_count /= 1024
+    return f"{byte_count:.1f} TiB"
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes:02}:{seconds:02}"
@@ -1,12 +1,24 @@
 import argparse
-from queue import Queue
-from typing import Tuple
+from logging import getLogger
 
+from bandwidth_limiter import BandwidthLimiter, parse_rate, parse_rate_schedule
+from batch_job import load_job, load_plan, save_plan
 from deside_option_video_download import DesideOptionVideoDownload
+from download_metrics import MetricsRecorder
+from download_retry import RetryPolicy
+from download_scheduler import RecordsPriorityQueue
+from enum_config import SchedulePolicy
+from fragment_budget import FragmentBudget
+from live_progress import LiveProgress
+from logger_config import LoggerConfigurator
+from metadata_cache import MetadataCache
+from record_store import RecordsQ
+from span_trace import SpanTracer
 from video_download import VideoDownloaderQueue
+from ydl_pool import YoutubeDLPool
 
 
-def analysis_args() -> str:
+def analysis_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Download videos from the internet.")
     parser.add_argument(
         "-c",
@@ -20,27 +32,367 @@ def analysis_args() -> str:
             "to be used for download."
         ),
     )
+    parser.add_argument(
+        "-a",
+        "--analysis-threads",
+        action="store",
+        type=int,
+        default=4,
+        required=False,
+        help="Number of urls whose information is retrieved concurrently.",
+    )
+    parser.add_argument(
+        "--analysis-timeout",
+        action="store",
+        type=float,
+        default=120.0,
+        required=False,
+        help="Seconds after which retrieving the upload date of a url is given up.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the metadata cache.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the cached metadata and retrieve it again.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help="Directory of the metadata cache.",
+    )
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        action="store_true",
+        help=(
+            "Start downloading while the urls are still analyzed. "
+            "All videos in playlists are downloaded."
+        ),
+    )
+    parser.add_argument(
+        "--queue-size",
+        action="store",
+        type=int,
+        default=16,
+        required=False,
+        help="Maximum number of analyzed videos waiting to be downloaded.",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        action="store",
+        type=int,
+        default=4,
+        required=False,
+        help="Number of videos downloaded concurrently.",
+    )
+    parser.add_argument(
+        "--min-threads",
+        action="store",
+        type=int,
+        default=0,
+        required=False,
+        help=(
+            "Minimum number of download threads. If it differs from "
+            "--max-threads, the number is adjusted to the download speed."
+        ),
+    )
+    parser.add_argument(
+        "--max-threads",
+        action="store",
+        type=int,
+        default=0,
+        required=False,
+        help="Maximum number of download threads.",
+    )
+    parser.add_argument(
+        "--postprocess-threads",
+        action="store",
+        type=int,
+        default=0,
+        required=False,
+        help=(
+            "Number of videos converted by ffmpeg concurrently. "
+            "Defaults to the number of CPUs."
+        ),
+    )
+    parser.add_argument(
+        "--schedule",
+        action="store",
+        type=str,
+        choices=[policy.value for policy in SchedulePolicy],
+        default=SchedulePolicy.LARGEST_FIRST.value,
+        required=False,
+        help=(
+            "Order of the downloads by the expected size of the videos. "
+            "'largest' keeps a long video from finishing last."
+        ),
+    )
+    parser.add_argument(
+        "--retries",
+        action="store",
+        type=int,
+        default=2,
+        required=False,
+        help=(
+            "Number of times a download failed for a temporary reason is "
+            "retried, resuming from the partially downloaded file."
+        ),
+    )
+    parser.add_argument(
+        "--retry-delay",
+        action="store",
+        type=float,
+        default=5.0,
+        required=False,
+        help="Seconds before the first retry, doubled for each further retry.",
+    )
+    parser.add_argument(
+        "--limit-rate",
+        action="store",
+        type=parse_rate,
+        default=0.0,
+        required=False,
+        help=(
+            "Total download speed of all threads in bytes per second, "
+            "such as '500K' or '2M'. Defaults to no limit."
+        ),
+    )
+    parser.add_argument(
+        "--limit-schedule",
+        action="store",
+        type=parse_rate_schedule,
+        default=[],
+        required=False,
+        help=(
+            "Total download speed for times of the day, such as "
+            "'09:00-18:00=2M,22:00-06:00=0'. 0 means no limit. "
+            "--limit-rate applies to the other times."
+        ),
+    )
+    parser.add_argument(
+        "--fragments",
+        action="store",
+        type=int,
+        default=16,
+        required=False,
+        help=(
+            "Number of fragments of DASH/HLS formats downloaded concurrently, "
+            "shared by all active downloads. 0 downloads one fragment at a time "
+            "for each video."
+        ),
+    )
+    parser.add_argument(
+        "--no-archive",
+        action="store_true",
+        help="Download the videos even if they are in the download archive.",
+    )
+    parser.add_argument(
+        "--archive-file",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help=(
+            "File recording the downloaded videos. "
+            "Defaults to 'download_archive.txt' in the directory to save files."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help="File to write the metrics of each video to, as JSON Lines.",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help=(
+            "File to write the totals of the metrics to, for the textfile "
+            "collector of Prometheus node_exporter."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help=(
+            "File to write what each thread did to, in the Chrome trace format. "
+            "Open it in https://ui.perfetto.dev or analyze it with trace_analyzer.py."
+        ),
+    )
+    parser.add_argument(
+        "--progress",
+        action="store",
+        type=str,
+        choices=["line", "workers"],
+        default="",
+        required=False,
+        help=(
+            "Show the total bytes, speed and ETA of the downloads on stderr, "
+            "in a line or with a row for each thread."
+        ),
+    )
+    parser.add_argument(
+        "--job",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help=(
+            "Job file in TOML or JSON giving the options instead of the prompts, "
+            "such as 'dir_path', 'urls' and 'download_mode'. See batch_job.py."
+        ),
+    )
+    parser.add_argument(
+        "--save-plan",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help=(
+            "File to write the selected videos and options to, "
+            "without downloading them. Download them later with --plan."
+        ),
+    )
+    parser.add_argument(
+        "--plan",
+        action="store",
+        type=str,
+        default="",
+        required=False,
+        help="Download the videos in a file written with --save-plan.",
+    )
     args = parser.parse_args()
-    cookie_path: str = args.cookiefile
-    return cookie_path.strip(" \"'")
+    args.cookiefile = args.cookiefile.strip(" \"'")
+    return args
 
 
 def main():
-    urls_filename_q: Queue[Tuple[str, str]] = Queue()
-    cookiepath = analysis_args()
+    args = analysis_args()
+    policy = SchedulePolicy(args.schedule)
+    records_q: RecordsQ = RecordsPriorityQueue(policy=policy)
+    bandwidth_limiter = None
+    if args.limit_rate or args.limit_schedule:
+        bandwidth_limiter = BandwidthLimiter(args.limit_rate, args.limit_schedule)
+    fragment_budget = FragmentBudget(args.fragments) if args.fragments > 0 else None
+    retry_policy = RetryPolicy(
+        max_attempts=args.retries + 1, base_delay=args.retry_delay
+    )
+    metrics = None
+    if args.metrics_jsonl or args.metrics_prom:
+        metrics = MetricsRecorder()
+    tracer = SpanTracer() if args.trace else None
+    live_progress = None
+    if args.progress:
+        live_progress = LiveProgress(per_worker=args.progress == "workers")
+    metadata_cache = None
+    if not args.no_cache:
+        metadata_cache = MetadataCache(cache_dir=args.cache_dir, refresh=args.refresh)
+    # Shared by the analysis and the download so that cookies are read only once
+    ydl_pool = YoutubeDLPool(args.cookiefile)
 
-    set_optioner = DesideOptionVideoDownload(cookie_file=cookiepath)
-    result = set_optioner.run()
-    if result is None:
-        return
-    ydl_opts, custom_opt, multi_url_filename = result
+    set_optioner = DesideOptionVideoDownload(
+        cookie_file=args.cookiefile,
+        analysis_threads=args.analysis_threads,
+        analysis_timeout=args.analysis_timeout,
+        metadata_cache=metadata_cache,
+        ydl_pool=ydl_pool,
+        use_archive=not args.no_archive,
+        archive_file=args.archive_file.strip(" \"'"),
+    )
+    try:
+        # A job and a plan are resolved before downloading, so not pipelined
+        if args.pipeline and not (args.job or args.plan or args.save_plan):
+            ydl_opts, custom_opt, records = set_optioner.run_pipelined()
+            video_downloader = VideoDownloaderQueue(
+                ydl_opts,
+                custom_opt,
+                thread_count=args.threads,
+                ydl_pool=ydl_pool,
+                postprocess_threads=args.postprocess_threads,
+                min_threads=args.min_threads,
+                max_threads=args.max_threads,
+                retry_policy=retry_policy,
+                bandwidth_limiter=bandwidth_limiter,
+                fragment_budget=fragment_budget,
+                metrics=metrics,
+                tracer=tracer,
+                live_progress=live_progress,
+            )
+            download_status_urls_q = video_downloader.start_download_pipelined(
+                records, queue_size=args.queue_size, policy=policy
+            )
+        else:
+            try:
+                if args.plan:
+                    result = load_plan(args.plan)
+                elif args.job:
+                    result = set_optioner.run_job(load_job(args.job))
+                else:
+                    result = set_optioner.run()
+            except ValueError as e:
+                LoggerConfigurator()
+                getLogger().error(e)
+                return
+            if result is None:
+                return
+            ydl_opts, custom_opt, multi_record = result
+            if args.save_plan:
+                save_plan(args.save_plan, ydl_opts, custom_opt, multi_record)
+                LoggerConfigurator()
+                getLogger().info(
+                    f"{len(multi_record)} videos are saved to '{args.save_plan}'."
+                )
+                return
 
-    for url, filename in multi_url_filename:
-        urls_filename_q.put((url, filename))
+            for record in multi_record:
+                records_q.put(record)
+                if live_progress is not None:
+                    live_progress.expect(record.expected_size)
 
-    video_downloader = VideoDownloaderQueue(ydl_opts, custom_opt)
-    download_status_urls_q = video_downloader.start_download(urls_filename_q)
+            video_downloader = VideoDownloaderQueue(
+                ydl_opts,
+                custom_opt,
+                thread_count=args.threads,
+                ydl_pool=ydl_pool,
+                postprocess_threads=args.postprocess_threads,
+                min_threads=args.min_threads,
+                max_threads=args.max_threads,
+                retry_policy=retry_policy,
+                bandwidth_limiter=bandwidth_limiter,
+                fragment_budget=fragment_budget,
+                metrics=metrics,
+                tracer=tracer,
+                live_progress=live_progress,
+            )
+            download_status_urls_q = video_downloader.start_download(records_q)
+    finally:
+        ydl_pool.close()
+        if metadata_cache is not None:
+            metadata_cache.close()
     video_downloader.display_result(download_status_urls_q)
+    if metrics is not None:
+        if args.metrics_jsonl:
+            metrics.export_jsonl(args.metrics_jsonl)
+        if args.metrics_prom:
+            metrics.export_prometheus(args.metrics_prom)
+    if tracer is not None:
+        tracer.export_chrome(args.trace)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from logging import getLogger
+from threading import Lock
+from typing import Any
+
+from logger_config import LoggerConfigurator
+
+Metadata = dict[str, Any]
+
+
+def default_cache_dir() -> str:
+    """Return the directory where the cache is stored unless specified."""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "video_downloader")
+
+
+class MetadataCache:
+    """A persistent cache of the metadata retrieved by yt-dlp, stored in SQLite."""
+
+    def __init__(
+        self,
+        cache_dir: str = "",
+        flat_ttl: float = 60 * 60,
+        detailed_ttl: float = 24 * 60 * 60,
+        max_bytes: int = 256 * 1024 * 1024,
+        refresh: bool = False,
+    ) -> None:
+        """Initialize the MetadataCache object.
+
+        Args:
+            cache_dir (str, optional): Directory of the database file.
+            Defaults to "", which uses 'default_cache_dir()'.
+            flat_ttl (float, optional): Seconds for which the metadata retrieved
+            with extract_flat=True is valid. Defaults to an hour.
+            detailed_ttl (float, optional): Seconds for which the metadata retrieved
+            with extract_flat=False is valid. Defaults to a day.
+            max_bytes (int, optional): Upper limit of the total size of the
+            compressed metadata. The least recently used ones are removed first.
+            refresh (bool, optional): If True, the cached metadata is never
+            returned, but newly retrieved metadata is still stored.
+
+        Example:
+            >>> cache = MetadataCache(refresh=True)
+            >>> analyzer = AnalysisUrls(cache=cache)
+        """
+
+        LoggerConfigurator()
+        self.logger = getLogger()
+
+        self.cache_dir: str = cache_dir or default_cache_dir()
+        self.flat_ttl: float = flat_ttl
+        self.detailed_ttl: float = detailed_ttl
+        self.max_bytes: int = max_bytes
+        self.refresh: bool = refresh
+        # One connection is shared by the analysis threads
+        self._lock = Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.cache_dir, "metadata.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " url TEXT NOT NULL,"
+            " extract_flat INTEGER NOT NULL,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (url, extract_flat))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)"
+        )
+        self._conn.execute("DELETE FROM metadata WHERE expires_at < ?", (time.time(),))
+        self._total_bytes: int = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM metadata"
+        ).fetchone()[0]
+
+    def get(self, url: str, extract_flat: bool) -> Metadata | None:
+        """Return the cached metadata, or None if it is missing or expired."""
+        if self.refresh:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM metadata"
+                " WHERE url = ? AND extract_flat = ?",
+                (url, extract_flat),
+            ).fetchone()
+            if row is None:
+                return None
+            data, expires_at = row
+            if expires_at < now:
+                self._delete(url, extract_flat)
+                return None
+            self._conn.execute(
+                "UPDATE metadata SET last_used = ? WHERE url = ? AND extract_flat = ?",
+                (now, url, extract_flat),
+            )
+        self.logger.debug(f"Metadata is read from the cache. Url: '{url}'")
+        return json.loads(zlib.decompress(data))
+
+    def put(
+        self, url: str, extract_flat: bool, info: Metadata, ttl: float | None = None
+    ) -> None:
+        """Store the metadata, which must be serializable as json.
+
+        Args:
+            url (str): The url passed to yt-dlp.
+            extract_flat (bool): The extract_flat option passed to yt-dlp.
+            info (Metadata): The metadata to be stored.
+            ttl (float | None, optional): Seconds for which it is valid.
+            Defaults to None, which uses flat_ttl or detailed_ttl.
+        """
+
+        if ttl is None:
+            ttl = self.flat_ttl if extract_flat else self.detailed_ttl
+        data = zlib.compress(json.dumps(info, default=str).encode())
+        now = time.time()
+        with self._lock:
+            self._delete(url, extract_flat)
+            self._conn.execute(
+                "INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?)",
+                (url, extract_flat, data, len(data), now + ttl, now),
+            )
+            self._total_bytes += len(data)
+            self._evict()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _delete(self, url: str, extract_flat: bool) -> None:
+        row = self._conn.execute(
+            "DELETE FROM metadata WHERE url = ? AND extract_flat = ? RETURNING size",
+            (url, extract_flat),
+        ).fetchone()
+        if row is not None:
+            self._total_bytes -= row[0]
+
+    def _evict(self) -> None:
+        # Remove the least recently used metadata until it fits in max_bytes
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT url, extract_flat FROM metadata ORDER BY last_used LIMIT 32"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for url, extract_flat in rows:
+                self._delete(url, extract_flat)
+                if self._total_bytes <= self.max_bytes:
+                    return
@@ -0,0 +1,156 @@
+from array import array
+from queue import Queue
+from typing import Any, Iterator
+
+from types_config import UrlData
+
+
+class RecordStore:
+    """A column-oriented store of the videos to be downloaded.
+
+    Each video is a row, and each item of it is kept in its own list or array
+    instead of a dict per video. 'RecordView' objects refer to a row without
+    copying it, and are passed from the analysis to the download threads.
+
+    Example:
+        >>> store = RecordStore()
+        >>> row = store.append("https://www.youtube.com/watch?v=abc123", "Title")
+        >>> record = store[row]
+        >>> record.filename = "Title.mp4"
+        >>> print(record["title"], store.filenames[row])
+        Title Title.mp4
+    """
+
+    def __init__(self) -> None:
+        self.urls: list[str] = []
+        self.titles: list[str] = []
+        self.indexes: array = array("I")
+        self.same_playlists: array = array("I")
+        self.directly_specified: array = array("b")
+        # Estimated bytes, 0.0 if unknown. Used to schedule the downloads
+        self.expected_sizes: array = array("d")
+        # Set by the selection of the range and the assembly of file names
+        self.selected: array = array("b")
+        self.filenames: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def __getitem__(self, row: int) -> "RecordView":
+        if not 0 <= row < len(self.urls):
+            raise IndexError(row)
+        return RecordView(self, row)
+
+    def __iter__(self) -> Iterator["RecordView"]:
+        return (RecordView(self, row) for row in range(len(self.urls)))
+
+    def append(
+        self,
+        url: str,
+        title: str,
+        index: int = 0,
+        same_playlist: int = 0,
+        directly_specified: bool = True,
+        expected_size: float = 0.0,
+    ) -> int:
+        """Add a video and return its row."""
+        self.urls.append(url)
+        self.titles.append(title)
+        self.indexes.append(index)
+        self.same_playlists.append(same_playlist)
+        self.directly_specified.append(directly_specified)
+        self.expected_sizes.append(expected_size)
+        self.selected.append(False)
+        self.filenames.append("")
+        return len(self.urls) - 1
+
+    def extend(self, other: "RecordStore") -> None:
+        """Add all videos of other, column by column."""
+        self.urls.extend(other.urls)
+        self.titles.extend(other.titles)
+        self.indexes.extend(other.indexes)
+        self.same_playlists.extend(other.same_playlists)
+        self.directly_specified.extend(other.directly_specified)
+        self.expected_sizes.extend(other.expected_sizes)
+        self.selected.extend(other.selected)
+        self.filenames.extend(other.filenames)
+
+    def selected_records(self) -> list["RecordView"]:
+        return [RecordView(self, row) for row, sel in enumerate(self.selected) if sel]
+
+
+class RecordView:
+    """A row of a RecordStore, which can also be read like UrlData."""
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store: RecordStore, row: int) -> None:
+        self.store: RecordStore = store
+        self.row: int = row
+
+    def __getitem__(self, key: str) -> Any:
+        # For the code written for UrlData, such as data["title"]
+        if key not in UrlData.__annotations__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self) -> str:
+        return f"RecordView({self.to_url_data()}, filename={self.filename!r})"
+
+    @property
+    def url(self) -> str:
+        return self.store.urls[self.row]
+
+    @property
+    def title(self) -> str:
+        return self.store.titles[self.row]
+
+    @property
+    def index(self) -> int:
+        return self.store.indexes[self.row]
+
+    @property
+    def same_playlist(self) -> int:
+        return self.store.same_playlists[self.row]
+
+    @property
+    def directly_specified(self) -> bool:
+        return bool(self.store.directly_specified[self.row])
+
+    @property
+    def expected_size(self) -> float:
+        return self.store.expected_sizes[self.row]
+
+    @expected_size.setter
+    def expected_size(self, value: float) -> None:
+        self.store.expected_sizes[self.row] = value
+
+    @property
+    def selected(self) -> bool:
+        return bool(self.store.selected[self.row])
+
+    @selected.setter
+    def selected(self, value: bool) -> None:
+        self.store.selected[self.row] = value
+
+    @property
+    def filename(self) -> str:
+        return self.store.filenames[self.row]
+
+    @filename.setter
+    def filename(self, value: str) -> None:
+        self.store.filenames[self.row] = value
+
+    def to_url_data(self) -> UrlData:
+        return {
+            "url": self.url,
+            "title": self.title,
+            "index": self.index,
+            "same_playlist": self.same_playlist,
+            "directly_specified": self.directly_specified,
+            "expected_size": self.expected_size,
+        }
+
+
+RecordsQ = Queue[RecordView | None]
+"""None tells a download thread that there are no more videos"""
@@ -0,0 +1,177 @@
+import json
+import time
+from contextlib import contextmanager
+from threading import Lock, current_thread
+from typing import Any, Iterator, TypedDict
+
+
+class Span(TypedDict):
+    """A phase of a video on a thread, the times are 'time.monotonic()'"""
+
+    name: str
+    item: str  # File name of the video, "" if not for a video
+    thread: str  # "" if not on a thread, such as waiting in the queue
+    start: float
+    end: float
+
+
+# Process id written in the trace, there is only one process
+TRACE_PID: int = 1
+
+
+class SpanTracer:
+    """Record what each thread is doing, and export it as a Chrome trace.
+
+    The trace can be opened in https://ui.perfetto.dev or chrome://tracing,
+    and analyzed with 'trace_analyzer.py'.
+
+    Example:
+        >>> tracer = SpanTracer()
+        >>> with tracer.span("postprocess", item="Title.mp4"):
+        ...     convert()
+        >>> tracer.add("queue wait", queued_at, time.monotonic(), thread="")
+        >>> tracer.export_chrome("trace.json")
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, item: str = "") -> Iterator[None]:
+        """Record the with block as a span of the current thread."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.monotonic(), item)
+
+    def add(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        item: str = "",
+        thread: str | None = None,
+    ) -> None:
+        """Record a span that has already ended.
+
+        Args:
+            name (str): Name of the phase, such as 'transfer'.
+            start (float): 'time.monotonic()' when it started.
+            end (float): 'time.monotonic()' when it ended.
+            item (str, optional): File name of the video. Defaults to "".
+            thread (str | None, optional): Name of the thread, "" for a span
+            that is not on a thread and may overlap the others.
+            Defaults to None, which means the current thread.
+        """
+
+        if thread is None:
+            thread = current_thread().name
+        with self._lock:
+            self._spans.append(
+                {
+                    "name": name,
+                    "item": item,
+                    "thread": thread,
+                    "start": start,
+                    "end": end,
+                }
+            )
+
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def export_chrome(self, path: str) -> None:
+        """Write the spans in the Trace Event Format of Chrome.
+
+        Note:
+            Spans on a thread are complete events on the row of the thread.
+            The others are async events, one row for each video.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": to_chrome_events(self.spans())}, f, ensure_ascii=False
+            )
+
+
+def to_chrome_events(spans: list[Span]) -> list[dict[str, Any]]:
+    if not spans:
+        return []
+    origin = min(span["start"] for span in spans)
+    tids: dict[str, int] = {}
+    async_ids: dict[str, int] = {}
+    events: list[dict[str, Any]] = []
+    for span in sorted(spans, key=lambda span: span["start"]):
+        ts = (span["start"] - origin) * 1e6
+        common = {"name": span["name"], "cat": "video", "pid": TRACE_PID}
+        args = {"item": span["item"]}
+        if span["thread"]:
+            tid = tids.setdefault(span["thread"], len(tids) + 1)
+            dur = (span["end"] - span["start"]) * 1e6
+            events.append({**common, "ph": "X", "tid": tid, "ts": ts, "dur": dur})
+            events[-1]["args"] = args
+        else:
+            async_id = async_ids.setdefault(span["item"], len(async_ids) + 1)
+            end_ts = (span["end"] - origin) * 1e6
+            events.append({**common, "ph": "b", "id": async_id, "ts": ts, "args": args})
+            events.append({**common, "ph": "e", "id": async_id, "ts": end_ts})
+    for thread, tid in tids.items():
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": TRACE_PID,
+                "tid": tid,
+                "args": {"name": thread},
+            }
+        )
+    return events
+
+
+def from_chrome_events(events: list[dict[str, Any]]) -> list[Span]:
+    """Read the spans back from the events written by 'export_chrome'."""
+    threads = {
+        event["tid"]: event["args"]["name"]
+        for event in events
+        if event.get("ph") == "M" and event.get("name") == "thread_name"
+    }
+    spans: list[Span] = []
+    # Async spans are open until their end event, keyed by (id, name)
+    open_spans: dict[tuple[Any, str], Span] = {}
+    for event in events:
+        ph = event.get("ph")
+        start = event.get("ts", 0) / 1e6
+        if ph == "X":
+            spans.append(
+                {
+                    "name": event["name"],
+                    "item": event.get("args", {}).get("item", ""),
+                    "thread": threads.get(event["tid"], str(event["tid"])),
+                    "start": start,
+                    "end": start + event.get("dur", 0) / 1e6,
+                }
+            )
+        elif ph == "b":
+            open_spans[(event["id"], event["name"])] = {
+                "name": event["name"],
+                "item": event.get("args", {}).get("item", ""),
+                "thread": "",
+                "start": start,
+                "end": start,
+            }
+        elif ph == "e":
+            span = open_spans.pop((event["id"], event["name"]), None)
+            if span is not None:
+                span["end"] = start
+                spans.append(span)
+    return spans
+
+
+def load_chrome_trace(path: str) -> list[Span]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    # Both the object format and the bare array format are valid
+    events = data["traceEvents"] if isinstance(data, dict) else data
+    return from_chrome_events(events)
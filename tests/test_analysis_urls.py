@@ -0,0 +1,26 @@
+import pytest
+import yt_dlp
+
+from analysis_urls import AnalysisUrls
+
+URL = "https://www.youtube.com/playlist?list=PLx"
+
+
+def test_failed_lookup_is_retried(monkeypatch):
+    analyzer = AnalysisUrls()
+    results: list = []
+
+    def extract_metadata(url, extract_flat, timeout):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(analyzer, "_extract_metadata", extract_metadata)
+    for extract_flat in [True, False]:
+        results[:] = [yt_dlp.DownloadError("Timed out"), None, {"title": "a"}]
+        with pytest.raises(yt_dlp.DownloadError):
+            analyzer._download_metadata(URL, extract_flat)
+        assert analyzer._download_metadata(URL, extract_flat) is None
+        assert analyzer._download_metadata(URL, extract_flat) == {"title": "a"}
+        assert analyzer._in_flight == {}
@@ -0,0 +1,127 @@
+from datetime import datetime
+from datetime import time as day_time
+
+import pytest
+
+import bandwidth_limiter
+from bandwidth_limiter import BandwidthLimiter, parse_rate, parse_rate_schedule
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now: float = 1_000.0
+        self.slept: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(bandwidth_limiter.time, "monotonic", fake)
+    monkeypatch.setattr(bandwidth_limiter.time, "sleep", fake.sleep)
+    return fake
+
+
+def set_time_of_day(monkeypatch: pytest.MonkeyPatch, hour: int, minute: int) -> None:
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 1, 1, hour, minute)
+
+    monkeypatch.setattr(bandwidth_limiter, "datetime", FakeDatetime)
+
+
+@pytest.mark.parametrize(
+    ("text", "rate"),
+    [("0", 0.0), ("500", 500.0), ("500K", 512_000.0), (" 2M ", 2_097_152.0)],
+)
+def test_parse_rate(text, rate):
+    assert parse_rate(text) == rate
+
+
+@pytest.mark.parametrize("text", ["", "fast", "2X"])
+def test_invalid_rate(text):
+    with pytest.raises(ValueError):
+        parse_rate(text)
+
+
+def test_parse_rate_schedule():
+    assert parse_rate_schedule("09:00-18:00=2M, 22:30-06:00=10K,") == [
+        (day_time(9, 0), day_time(18, 0), 2_097_152.0),
+        (day_time(22, 30), day_time(6, 0), 10_240.0),
+    ]
+    assert parse_rate_schedule("") == []
+
+
+@pytest.mark.parametrize("text", ["09:00=2M", "09:00-18:00", "9-18=2M", "a-b=1"])
+def test_invalid_schedule(text):
+    with pytest.raises(ValueError, match="Invalid schedule"):
+        parse_rate_schedule(text)
+
+
+@pytest.mark.parametrize(
+    ("hour", "minute", "rate"),
+    [
+        (8, 59, 100.0),
+        (9, 0, 2_000.0),
+        (17, 59, 2_000.0),
+        (18, 0, 100.0),
+        (23, 0, 50.0),
+        (0, 0, 50.0),
+        (5, 59, 50.0),
+        (6, 0, 100.0),
+    ],
+)
+def test_schedule_wraps_past_midnight(monkeypatch, hour, minute, rate):
+    set_time_of_day(monkeypatch, hour, minute)
+    schedule = parse_rate_schedule("09:00-18:00=2000, 22:00-06:00=50")
+    assert BandwidthLimiter(100.0, schedule).current_rate() == rate
+
+
+def test_burst_then_limited(clock):
+    limiter = BandwidthLimiter(rate=1_000.0, burst_seconds=1.0)
+    # The bucket starts empty, and is refilled by the rate
+    clock.now += 5
+    limiter.consume(1_000)
+    assert clock.slept == []
+    limiter.consume(500)
+    assert clock.slept == [0.5]
+    limiter.consume(2_000)
+    assert clock.slept == [0.5, 2.0]
+
+
+def test_tokens_refill_while_idle(clock):
+    limiter = BandwidthLimiter(rate=1_000.0, burst_seconds=2.0)
+    clock.now += 1.5
+    limiter.consume(1_500)
+    assert clock.slept == []
+    clock.now += 0.25
+    limiter.consume(500)
+    assert clock.slept == [0.25]
+
+
+def test_no_limit(clock):
+    limiter = BandwidthLimiter(rate=0.0)
+    limiter.consume(10**9)
+    assert clock.slept == []
+
+
+def test_hook_counts_only_new_bytes(clock):
+    limiter = BandwidthLimiter(rate=1_000.0, burst_seconds=1.0)
+    consumed: list[int] = []
+    limiter.consume = consumed.append  # type: ignore[method-assign]
+    # Resumed from a '.part' file of 5000 bytes
+    for downloaded in [5_000, 5_400, 6_000]:
+        limiter.hook(
+            {"status": "downloading", "filename": "a", "downloaded_bytes": downloaded}
+        )
+    limiter.hook({"status": "finished", "filename": "a", "downloaded_bytes": 6_000})
+    limiter.hook({"status": "downloading", "filename": "a", "downloaded_bytes": 100})
+    limiter.hook({"status": "downloading", "filename": "a", "downloaded_bytes": 300})
+    assert consumed == [400, 600, 200]
@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+from batch_job import PLAN_VERSION, load_job, load_plan, save_plan, validate_job
+from download_archive import DownloadArchive
+from enum_config import DownloadMode, Thumbnail
+from record_store import RecordStore
+
+JOB_TOML = """\
+dir_path = "videos"
+urls = ["https://www.youtube.com/playlist?list=cba321"]
+csv_files = ["urls.csv"]
+download_mode = "M4A"
+thumbnail_mode = "PLAIN"
+file_name_format = "D_T"
+
+[playlist_ranges]
+default = "all"
+1 = "1, 5-7"
+"""
+JOB = {
+    "dir_path": "videos",
+    "urls": ["https://www.youtube.com/playlist?list=cba321"],
+    "csv_files": ["urls.csv"],
+    "download_mode": "M4A",
+    "thumbnail_mode": "PLAIN",
+    "file_name_format": "D_T",
+    "playlist_ranges": {"default": "all", "1": "1, 5-7"},
+}
+
+
+def test_load_toml(tmp_path):
+    path = tmp_path / "job.toml"
+    path.write_text(JOB_TOML, encoding="utf-8")
+    assert load_job(str(path)) == JOB
+
+
+def test_load_json(tmp_path):
+    path = tmp_path / "job.json"
+    data = {**JOB, "playlist_ranges": {"1": 5}}
+    path.write_text(json.dumps(data), encoding="utf-8")
+    assert load_job(str(path)) == {**JOB, "playlist_ranges": {"1": "5"}}
+
+
+@pytest.mark.parametrize(
+    ("name", "content", "message"),
+    [
+        ("job.toml", "dir_path = ", "Invalid job file"),
+        ("job.json", "{", "Invalid job file"),
+        ("job.json", "[]", "not a table"),
+        ("job.toml", 'urls = ["https://a"]', "'dir_path' is required"),
+    ],
+)
+def test_invalid_job_file(tmp_path, name, content, message):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_job(str(path))
+
+
+def test_missing_job_file(tmp_path):
+    with pytest.raises(ValueError, match="Cannot read the job file"):
+        load_job(str(tmp_path / "job.toml"))
+
+
+@pytest.mark.parametrize(
+    ("data", "message"),
+    [
+        ({"dir_path": "v", "url": []}, "Unknown key"),
+        ({"dir_path": 1}, "'dir_path' in the job must be str, not int"),
+        ({"dir_path": "v", "urls": "https://a"}, "must be list, not str"),
+        ({"dir_path": "v", "urls": [1]}, "'urls' in the job must be a list of str"),
+        ({"dir_path": "v", "csv_files": [None]}, "'csv_files' in the job must be"),
+        ({"dir_path": "v", "playlist_ranges": []}, "must be dict"),
+    ],
+)
+def test_validation_errors(data, message):
+    with pytest.raises(ValueError, match=message):
+        validate_job(data)
+
+
+def test_plan_round_trip(tmp_path):
+    store = RecordStore()
+    for i in range(3):
+        row = store.append(f"https://a/{i}", f"Title {i}", i + 1, 1, i == 0, 10.0 * i)
+        store[row].filename = f"Title{i}.m4a"
+    archive_path = str(tmp_path / "download_archive.txt")
+    ydl_opts = {
+        "format": "bestaudio[ext=m4a]",
+        "writethumbnail": False,
+        "outtmpl": "deletion prohibited",
+        "progress_hooks": [print],
+    }
+    custom_opt = {
+        "dir_path": str(tmp_path),
+        "ffmpeg_path": "ffmpeg",
+        "download_mode": DownloadMode.M4A,
+        "thumbnail_mode": Thumbnail.GET_PNG,
+        "info_dicts": {"https://a/0": {"title": "Title 0"}},
+        "download_archive": DownloadArchive(archive_path),
+    }
+    path = str(tmp_path / "plan.json")
+    save_plan(path, ydl_opts, custom_opt, list(store))  # type: ignore[arg-type]
+
+    loaded_opts, loaded_opt, records = load_plan(path)
+    assert loaded_opts == {
+        key: value for key, value in ydl_opts.items() if key != "progress_hooks"
+    }
+    assert loaded_opt["download_archive"].file_path == archive_path
+    assert {**loaded_opt, "download_archive": None} == {
+        **custom_opt,
+        "info_dicts": {},
+        "download_archive": None,
+    }
+    assert [(record.to_url_data(), record.filename) for record in records] == [
+        (record.to_url_data(), record.filename) for record in store
+    ]
+
+
+def test_plan_without_archive(tmp_path):
+    path = str(tmp_path / "plan.json")
+    custom_opt = {
+        "dir_path": str(tmp_path),
+        "ffmpeg_path": "",
+        "download_mode": DownloadMode.HIGH,
+        "thumbnail_mode": Thumbnail.PLAIN,
+    }
+    save_plan(path, {"format": "best"}, custom_opt, [])  # type: ignore[typeddict-item]
+    assert load_plan(path)[1]["download_archive"] is None
+
+
+@pytest.mark.parametrize(
+    ("content", "message"),
+    [
+        ("{", "Invalid plan file"),
+        ("[]", "not an object"),
+        ('"plan"', "not an object"),
+        (json.dumps({"version": PLAN_VERSION + 1}), "Unsupported plan version"),
+        (json.dumps({"version": PLAN_VERSION}), "Invalid plan file"),
+    ],
+)
+def test_invalid_plan_file(tmp_path, content, message):
+    path = tmp_path / "plan.json"
+    path.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError, match=message):
+        load_plan(str(path))
+
+
+def test_missing_plan_file(tmp_path):
+    with pytest.raises(ValueError, match="Cannot read the plan file"):
+        load_plan(str(tmp_path / "plan.json"))
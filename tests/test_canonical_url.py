@@ -0,0 +1,80 @@
+import pytest
+
+from canonical_url import canonicalize_url, video_key
+
+VIDEO_URL = "https://www.youtube.com/watch?v=abc123DEF45"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/watch?v=abc123DEF45",
+        "  https://www.youtube.com/watch?v=abc123DEF45  ",
+        "https://youtube.com/watch?v=abc123DEF45",
+        "https://m.youtube.com/watch?v=abc123DEF45&feature=share",
+        "https://music.youtube.com/watch?v=abc123DEF45",
+        "https://WWW.YouTube.com/watch?v=abc123DEF45",
+        "https://youtu.be/abc123DEF45?si=xyz&t=30",
+        "https://www.youtube.com/shorts/abc123DEF45",
+        "https://www.youtube.com/embed/abc123DEF45",
+        "https://www.youtube-nocookie.com/embed/abc123DEF45",
+        "https://www.youtube.com/live/abc123DEF45?utm_source=x",
+        "https://www.youtube.com/watch?v=abc123DEF45#t=10",
+    ],
+)
+def test_video_urls(url):
+    assert canonicalize_url(url) == VIDEO_URL
+
+
+def test_video_in_playlist():
+    url = "https://www.youtube.com/watch?list=PLx&v=abc123DEF45&index=3&si=y"
+    assert canonicalize_url(url) == VIDEO_URL + "&list=PLx&index=3"
+    url = "https://www.youtube.com/watch?v=abc123DEF45&list=PLx&index=last"
+    assert canonicalize_url(url) == VIDEO_URL + "&list=PLx"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/playlist?list=PLx",
+        "https://m.youtube.com/playlist?list=PLx&feature=share",
+        "https://www.youtube.com/watch?list=PLx",
+    ],
+)
+def test_playlist_urls(url):
+    assert canonicalize_url(url) == "https://www.youtube.com/playlist?list=PLx"
+
+
+def test_invalid_video_id_is_not_a_video():
+    assert canonicalize_url("https://www.youtube.com/watch?v=short") == (
+        "https://www.youtube.com/watch?v=short"
+    )
+    assert video_key("https://www.youtube.com/watch?v=short") == (
+        "https://www.youtube.com/watch?v=short"
+    )
+
+
+def test_channel_url():
+    url = "http://m.youtube.com/@channel/videos?si=abc"
+    assert canonicalize_url(url) == "https://www.youtube.com/@channel/videos"
+
+
+def test_other_sites_lose_only_tracking():
+    url = "HTTPS://Example.com/Path/Video?id=1&utm_source=x&fbclid=y#frag"
+    assert canonicalize_url(url) == "https://example.com/Path/Video?id=1"
+
+
+def test_video_key_is_same_for_all_urls_of_a_video():
+    urls = [
+        "https://youtu.be/abc123DEF45",
+        "https://www.youtube.com/watch?v=abc123DEF45&list=PLx&index=2",
+        "https://www.youtube.com/shorts/abc123DEF45",
+    ]
+    assert {video_key(url) for url in urls} == {"youtube abc123DEF45"}
+
+
+def test_video_key_of_other_urls():
+    assert video_key("https://www.youtube.com/playlist?list=PLx") == (
+        "https://www.youtube.com/playlist?list=PLx"
+    )
+    assert video_key("https://example.com/v?id=1&si=x") == "https://example.com/v?id=1"
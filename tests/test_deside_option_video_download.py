@@ -0,0 +1,48 @@
+from analysis_urls import AnalysisUrls
+from deside_option_video_download import DesideOptionVideoDownload
+from enum_config import FileNameFormat
+from record_store import RecordStore
+
+URLS = [f"https://www.youtube.com/watch?v=video{i}00000" for i in range(4)]
+
+
+def test_dates_stay_with_their_urls(monkeypatch):
+    dates = {URLS[0]: "20200101", URLS[2]: "20220101", URLS[3]: "20230101"}
+
+    def get_urls_detailed_data(self, urls, wanted_data, timeout=None, keep_info=False):
+        # The date of URLS[1] could not be retrieved
+        return [
+            {"url": url, "upload_date": dates[url]} if url in dates else None
+            for url in urls
+        ]
+
+    monkeypatch.setattr(AnalysisUrls, "get_urls_detailed_data", get_urls_detailed_data)
+    optioner = DesideOptionVideoDownload()
+    optioner.file_name_fmt = FileNameFormat.D_T
+    store = RecordStore()
+    for i, url in enumerate(URLS):
+        store.append(url, f"Title {i}")
+    records = optioner.assembly_file_name(list(store))
+    assert [record.filename for record in records] == [
+        "20200101,Title0.mp4",
+        "Title1.mp4",
+        "20220101,Title2.mp4",
+        "20230101,Title3.mp4",
+    ]
+
+
+def test_missing_key_fails_only_its_url(monkeypatch):
+    infos = {
+        URLS[0]: {"upload_date": "20200101"},
+        URLS[1]: {"title": "Live stream"},
+    }
+    analyzer = AnalysisUrls()
+    monkeypatch.setattr(
+        analyzer,
+        "_download_metadata",
+        lambda url, extract_flat=True, timeout=None: infos[url],
+    )
+    assert analyzer.get_urls_detailed_data(URLS[:2], "upload_date") == [
+        {"url": URLS[0], "upload_date": "20200101"},
+        None,
+    ]
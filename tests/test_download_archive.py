@@ -0,0 +1,41 @@
+from download_archive import DownloadArchive
+
+VIDEO_URL = "https://www.youtube.com/watch?v=abc123DEF45"
+
+
+def test_record_and_find(tmp_path):
+    archive = DownloadArchive(str(tmp_path / "archive.txt"))
+    assert not archive.contains_url(VIDEO_URL)
+    archive.record({"extractor_key": "Youtube", "id": "abc123DEF45"})
+    assert "youtube abc123DEF45" in archive
+    assert archive.contains_url(VIDEO_URL)
+    # Any url of the same video
+    assert archive.contains_url("https://youtu.be/abc123DEF45?si=x")
+    assert not archive.contains_url("https://youtu.be/zzz123DEF45")
+
+
+def test_kept_in_the_file(tmp_path):
+    path = str(tmp_path / "archive.txt")
+    archive = DownloadArchive(path)
+    archive.record({"extractor_key": "Youtube", "id": "abc123DEF45"})
+    archive.record({"extractor_key": "Youtube", "id": "abc123DEF45"})
+    archive.record({"ie_key": "Vimeo", "id": "123"})
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "youtube abc123DEF45\nvimeo 123\n"
+    assert len(DownloadArchive(path)) == 2
+
+
+def test_incomplete_metadata_is_not_recorded(tmp_path):
+    path = tmp_path / "archive.txt"
+    archive = DownloadArchive(str(path))
+    archive.record({"id": "abc123DEF45"})
+    archive.record({"extractor_key": "Youtube"})
+    assert len(archive) == 0
+    assert not path.exists()
+
+
+def test_other_urls_are_not_found(tmp_path):
+    archive = DownloadArchive(str(tmp_path / "archive.txt"))
+    archive.record({"extractor_key": "Generic", "id": "video"})
+    assert archive.archive_id_from_url("https://example.com/video") is None
+    assert not archive.contains_url("https://example.com/video")
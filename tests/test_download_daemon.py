@@ -0,0 +1,231 @@
+import http.client
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from download_daemon import (
+    STATE_FILENAME,
+    DaemonServer,
+    DownloadDaemon,
+    load_token,
+    request_api,
+)
+from download_metrics import MetricsRecorder
+
+JOB = {"dir_path": os.path.abspath("videos"), "urls": ["https://a"]}
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    # Not started, so that the submitted jobs stay queued
+    daemon = DownloadDaemon(str(tmp_path))
+    yield daemon
+    daemon.close()
+
+
+@pytest.fixture
+def server(daemon, tmp_path):
+    server = DaemonServer(daemon, 0, load_token(str(tmp_path), create=True))
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def port_of(server: DaemonServer) -> int:
+    return server.server_address[1]
+
+
+def send(server, method: str, headers: dict, body: bytes | None = None) -> tuple:
+    # Sends the headers as they are, unlike request_api
+    connection = http.client.HTTPConnection("127.0.0.1", port_of(server))
+    connection.putrequest(method, "/jobs", skip_host=True)
+    for key, value in headers.items():
+        connection.putheader(key, value)
+    connection.endheaders(body)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def valid_headers(server) -> dict:
+    return {
+        "Host": f"127.0.0.1:{port_of(server)}",
+        "Authorization": f"Bearer {server.token}",
+        "Content-Type": "application/json",
+    }
+
+
+class FakeDownloader:
+    def __init__(self) -> None:
+        self.cancelled: bool = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+def test_token_file(tmp_path):
+    token = load_token(str(tmp_path / "state"), create=True)
+    path = tmp_path / "state" / "token"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert len(token) >= 32
+    # Kept across restarts
+    assert load_token(str(tmp_path / "state"), create=True) == token
+    assert load_token(str(tmp_path / "state")) == token
+    with pytest.raises(OSError):
+        load_token(str(tmp_path / "other"))
+
+
+def test_submit_and_status(server):
+    port = port_of(server)
+    state = request_api("POST", "/jobs", server.token, JOB, port)
+    assert state["status"] == "queued"
+    assert request_api("GET", f"/jobs/{state['id']}", server.token, port=port) == {
+        **state,
+        "failed_urls": [],
+    }
+    assert [job["id"] for job in request_api("GET", "/jobs", server.token, port=port)]
+    assert "error" in request_api("GET", "/jobs/nothing", server.token, port=port)
+
+
+@pytest.mark.parametrize(
+    "job",
+    [
+        {"dir_path": "videos", "urls": ["https://a"]},
+        {**JOB, "ffmpeg_path": "/bin/sh"},
+        {**JOB, "urls": [1]},
+    ],
+)
+def test_invalid_jobs_are_rejected(server, job):
+    assert "error" in request_api("POST", "/jobs", server.token, job, port_of(server))
+    assert server.daemon.status() == []
+
+
+def test_invalid_token(server):
+    result = request_api("GET", "/jobs", "wrong", port=port_of(server))
+    assert result == {"error": "Invalid token"}
+    headers = valid_headers(server)
+    del headers["Authorization"]
+    assert send(server, "GET", headers)[0] == 401
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [
+        {"Host": "evil.example"},
+        {"Host": "localhost:1"},
+        {"Origin": "https://evil.example"},
+        {"Origin": "null"},
+    ],
+)
+def test_requests_from_web_pages_are_rejected(server, changed):
+    headers = {**valid_headers(server), **changed}
+    assert send(server, "GET", headers)[0] == 403
+    body = json.dumps(JOB).encode()
+    headers["Content-Length"] = str(len(body))
+    assert send(server, "POST", headers, body)[0] == 403
+    assert server.daemon.status() == []
+
+
+def test_content_type_is_checked_only_on_post(server):
+    headers = valid_headers(server)
+    del headers["Content-Type"]
+    assert send(server, "GET", headers)[0] == 200
+    body = json.dumps(JOB).encode()
+    headers.update({"Content-Type": "text/plain", "Content-Length": str(len(body))})
+    assert send(server, "POST", headers, body)[0] == 415
+
+
+@pytest.mark.parametrize(
+    ("length", "code"),
+    [(None, 411), ("-1", 400), ("ten", 400), (str(64 * 1024 * 1024), 413)],
+)
+def test_invalid_content_length(server, length, code):
+    headers = valid_headers(server)
+    if length is not None:
+        headers["Content-Length"] = length
+    assert send(server, "POST", headers)[0] == code
+    assert server.daemon.status() == []
+
+
+def test_cancel_queued_job(server):
+    port = port_of(server)
+    state = request_api("POST", "/jobs", server.token, JOB, port)
+    path = f"/jobs/{state['id']}"
+    result = request_api("DELETE", path, server.token, port=port)
+    assert result["status"] == "cancelled"
+    assert result["finished_at"] > 0
+    # Already finished
+    assert "error" in request_api("DELETE", path, server.token, port=port)
+    assert "error" in request_api("DELETE", "/jobs/nothing", server.token, port=port)
+
+
+def test_cancel_running_job(server):
+    daemon = server.daemon
+    port = port_of(server)
+    state = request_api("POST", "/jobs", server.token, JOB, port)
+    other = request_api("POST", "/jobs", server.token, JOB, port)
+    downloader = FakeDownloader()
+    daemon._update(state["id"], status="downloading")
+    daemon._running = (state["id"], downloader, MetricsRecorder())  # type: ignore
+    request_api("DELETE", f"/jobs/{other['id']}", server.token, port=port)
+    assert not downloader.cancelled
+    result = request_api("DELETE", f"/jobs/{state['id']}", server.token, port=port)
+    assert result["status"] == "cancelled"
+    assert downloader.cancelled
+
+
+def test_unfinished_jobs_are_resumed(tmp_path):
+    states = [
+        {
+            "id": job_id,
+            "status": status,
+            "job": JOB,
+            "submitted_at": 1.0,
+            "finished_at": 0.0,
+            "total": 0,
+            "succeeded": 0,
+            "failed_urls": [],
+            "finished_files": [],
+            "error": "",
+        }
+        for job_id, status in [
+            ("a", "queued"),
+            ("b", "analyzing"),
+            ("c", "downloading"),
+            ("d", "done"),
+            ("e", "cancelled"),
+        ]
+    ]
+    (tmp_path / STATE_FILENAME).write_text(json.dumps(states), encoding="utf-8")
+    daemon = DownloadDaemon(str(tmp_path))
+    assert {state["id"]: state["status"] for state in daemon.status()} == {
+        "a": "queued",
+        "b": "queued",
+        "c": "downloading",
+        "d": "done",
+        "e": "cancelled",
+    }
+    assert [daemon._pending.get_nowait() for _ in range(3)] == ["a", "b", "c"]
+    assert daemon._pending.empty()
+    daemon.close()
+
+
+@pytest.mark.parametrize(
+    "content",
+    ['[{"id": "a", "status": "queued"', '{"a": {}}', '[{"id": "a"}]', "[1]", "3"],
+)
+def test_broken_state_file(tmp_path, content):
+    (tmp_path / STATE_FILENAME).write_text(content, encoding="utf-8")
+    daemon = DownloadDaemon(str(tmp_path))
+    assert daemon.status() == []
+    assert daemon._pending.empty()
+    assert not (tmp_path / STATE_FILENAME).exists()
+    broken = [name for name in os.listdir(tmp_path) if ".broken-" in name]
+    assert len(broken) == 1
+    assert (tmp_path / broken[0]).read_text(encoding="utf-8") == content
+    daemon.close()
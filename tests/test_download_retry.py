@@ -0,0 +1,97 @@
+import io
+import sys
+
+import pytest
+import yt_dlp
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.utils import ExtractorError, GeoRestrictedError, UnsupportedError
+
+from download_retry import RetryPolicy, error_class, is_retryable
+
+
+def http_error(status: int) -> HTTPError:
+    return HTTPError(
+        Response(io.BytesIO(b""), "https://a", {}, status=status, reason="")
+    )
+
+
+def download_error(error: Exception) -> yt_dlp.DownloadError:
+    # As raised by YoutubeDL, with the original error in exc_info
+    try:
+        raise error
+    except Exception:
+        return yt_dlp.DownloadError(f"ERROR: {error}", sys.exc_info())
+
+
+@pytest.mark.parametrize("status", [403, 408, 429, 500, 502, 503, 504])
+def test_retryable_http_status(status):
+    assert is_retryable(download_error(http_error(status)))
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 410])
+def test_permanent_http_status(status):
+    assert not is_retryable(download_error(http_error(status)))
+
+
+def test_network_error_in_extractor_error():
+    error = ExtractorError("Unable to download webpage", cause=http_error(404))
+    assert not is_retryable(download_error(error))
+    assert error_class(download_error(error)) == "HTTPError 404"
+    error = ExtractorError("Unable to download webpage", cause=TransportError())
+    assert is_retryable(download_error(error))
+    assert error_class(download_error(error)) == "TransportError"
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Private video. Sign in if you've been granted access",
+        "Video unavailable",
+        "This video has been removed by the uploader",
+        "Sign in to confirm your age",
+        "Join this channel to get access to members-only content",
+        "Requested format is not available",
+    ],
+)
+def test_permanent_messages(message):
+    assert not is_retryable(download_error(ExtractorError(message)))
+    assert not is_retryable(yt_dlp.DownloadError(f"ERROR: {message}"))
+
+
+def test_extractor_errors():
+    assert not is_retryable(download_error(ExtractorError("No", expected=True)))
+    assert is_retryable(download_error(ExtractorError("Some error")))
+    assert not is_retryable(download_error(UnsupportedError("https://a")))
+    assert not is_retryable(download_error(GeoRestrictedError("Blocked")))
+
+
+def test_unknown_errors_are_retryable():
+    assert is_retryable(yt_dlp.DownloadError("ERROR: something"))
+    assert is_retryable(OSError("Connection reset"))
+
+
+def test_error_class():
+    assert error_class(download_error(http_error(429))) == "HTTPError 429"
+    assert error_class(download_error(UnsupportedError("https://a"))) == (
+        "UnsupportedError"
+    )
+    assert error_class(yt_dlp.DownloadError("ERROR: something")) == "DownloadError"
+    assert error_class(OSError()) == "OSError"
+
+
+def test_can_retry_limits_attempts():
+    policy = RetryPolicy(max_attempts=3)
+    error = download_error(http_error(503))
+    assert policy.can_retry(error, attempts=1)
+    assert policy.can_retry(error, attempts=2)
+    assert not policy.can_retry(error, attempts=3)
+    assert not policy.can_retry(download_error(http_error(404)), attempts=1)
+    assert not RetryPolicy(max_attempts=0).can_retry(error, attempts=1)
+
+
+def test_delay_is_backoff_with_jitter():
+    policy = RetryPolicy(base_delay=4.0, max_delay=20.0)
+    for attempts, full_delay in [(1, 4.0), (2, 8.0), (3, 16.0), (4, 20.0), (9, 20.0)]:
+        for _ in range(20):
+            assert full_delay / 2 <= policy.delay(attempts) <= full_delay
@@ -0,0 +1,54 @@
+import pytest
+
+from download_scheduler import RecordsPriorityQueue, expected_size
+from enum_config import SchedulePolicy
+from record_store import RecordStore
+
+SIZES = [300.0, 0.0, 500.0, 300.0, 100.0]
+
+
+def drain(policy: SchedulePolicy) -> list[int | None]:
+    store = RecordStore()
+    records_q = RecordsPriorityQueue(policy=policy)
+    for i, size in enumerate(SIZES):
+        records_q.put(store[store.append(f"https://a/{i}", "", expected_size=size)])
+    records_q.put(None)
+    items = [records_q.get() for _ in range(len(SIZES) + 1)]
+    return [None if item is None else item.row for item in items]
+
+
+@pytest.mark.parametrize(
+    ("policy", "rows"),
+    [
+        (SchedulePolicy.FIFO, [0, 1, 2, 3, 4, None]),
+        (SchedulePolicy.LARGEST_FIRST, [2, 0, 3, 4, 1, None]),
+        (SchedulePolicy.SMALLEST_FIRST, [1, 4, 0, 3, 2, None]),
+    ],
+)
+def test_order_of_policy(policy, rows):
+    # Same sizes keep the order they were put, and None is the last
+    assert drain(policy) == rows
+
+
+def test_none_put_first_is_still_last():
+    store = RecordStore()
+    records_q = RecordsPriorityQueue(policy=SchedulePolicy.LARGEST_FIRST)
+    records_q.put(None)
+    records_q.put(store[store.append("https://a", "", expected_size=1.0)])
+    assert records_q.get() is not None
+    assert records_q.get() is None
+    assert records_q.empty()
+
+
+@pytest.mark.parametrize(
+    ("info", "size"),
+    [
+        ({"filesize": 1000, "filesize_approx": 2000, "duration": 60}, 1000.0),
+        ({"filesize": None, "filesize_approx": 2000}, 2000.0),
+        ({"duration": 60}, 18_750_000.0),
+        ({"duration": None}, 0.0),
+        ({}, 0.0),
+    ],
+)
+def test_expected_size(info, size):
+    assert expected_size(info) == size
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import file_links
+from file_links import link_or_copy
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / "1,Title.mp4"
+    path.write_bytes(b"video data")
+    return path
+
+
+def test_hardlink(tmp_path, src):
+    dst = tmp_path / "5,Title.mp4"
+    assert link_or_copy(str(src), str(dst)) == "hardlink"
+    assert os.path.samefile(src, dst)
+
+
+def test_existing_dst_is_not_replaced(tmp_path, src):
+    dst = tmp_path / "5,Title.mp4"
+    dst.write_bytes(b"other")
+    with pytest.raises(FileExistsError):
+        link_or_copy(str(src), str(dst))
+    assert dst.read_bytes() == b"other"
+
+
+def test_copy_if_links_fail(tmp_path, src, monkeypatch):
+    def fail(*args):
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(file_links.os, "link", fail)
+    monkeypatch.setattr(file_links, "_reflink", lambda src, dst: False)
+    dst = tmp_path / "5,Title.mp4"
+    assert link_or_copy(str(src), str(dst)) == "copy"
+    assert dst.read_bytes() == b"video data"
+    assert not os.path.samefile(src, dst)
+
+
+def test_failed_reflink_leaves_no_file(tmp_path, src):
+    # tmpfs and ext4 do not support reflinks
+    dst = tmp_path / "5,Title.mp4"
+    if file_links._reflink(str(src), str(dst)):
+        pytest.skip("The file system supports reflinks")
+    assert not dst.exists()
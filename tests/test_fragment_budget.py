@@ -0,0 +1,54 @@
+from fragment_budget import FragmentBudget
+
+
+def test_total_is_shared():
+    budget = FragmentBudget(16)
+    first: dict = {}
+    second: dict = {}
+    third: dict = {}
+    with budget.share(first):
+        assert first["concurrent_fragment_downloads"] == 16
+        with budget.share(second):
+            assert first["concurrent_fragment_downloads"] == 8
+            assert second["concurrent_fragment_downloads"] == 8
+            with budget.share(third):
+                shares = [
+                    params["concurrent_fragment_downloads"]
+                    for params in [first, second, third]
+                ]
+                assert sorted(shares) == [5, 5, 6]
+        # The share of the finished ones goes back to the others
+        assert first["concurrent_fragment_downloads"] == 16
+
+
+def test_equal_params_are_counted_separately():
+    budget = FragmentBudget(4)
+    first: dict = {}
+    second: dict = {}
+    with budget.share(first), budget.share(second):
+        assert first["concurrent_fragment_downloads"] == 2
+        assert second["concurrent_fragment_downloads"] == 2
+
+
+def test_at_least_one_fragment():
+    budget = FragmentBudget(2)
+    params_list: list[dict] = [{} for _ in range(3)]
+    with budget.share(params_list[0]), budget.share(params_list[1]):
+        with budget.share(params_list[2]):
+            assert all(
+                params["concurrent_fragment_downloads"] == 1 for params in params_list
+            )
+    assert FragmentBudget(0).total == 1
+
+
+def test_released_after_an_error():
+    budget = FragmentBudget(8)
+    first: dict = {}
+    try:
+        with budget.share(first):
+            raise OSError
+    except OSError:
+        pass
+    second: dict = {}
+    with budget.share(second):
+        assert second["concurrent_fragment_downloads"] == 8
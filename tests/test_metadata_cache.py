@@ -0,0 +1,112 @@
+import json
+import zlib
+
+import pytest
+
+import metadata_cache
+from metadata_cache import MetadataCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now: float = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(metadata_cache.time, "time", fake)
+    return fake
+
+
+def compressed_size(info: dict) -> int:
+    return len(zlib.compress(json.dumps(info, default=str).encode()))
+
+
+def test_put_and_get(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    cache.put("https://a", True, {"title": "a"})
+    assert cache.get("https://a", True) == {"title": "a"}
+    # Flat and detailed metadata are stored separately
+    assert cache.get("https://a", False) is None
+    assert cache.get("https://b", True) is None
+    cache.close()
+
+
+def test_expired_metadata_is_not_returned(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path), flat_ttl=10, detailed_ttl=100)
+    cache.put("https://a", True, {"title": "flat"})
+    cache.put("https://a", False, {"title": "detailed"})
+    clock.now += 11
+    assert cache.get("https://a", True) is None
+    assert cache.get("https://a", False) == {"title": "detailed"}
+    clock.now += 100
+    assert cache.get("https://a", False) is None
+    cache.close()
+
+
+def test_ttl_of_put(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path), flat_ttl=10)
+    cache.put("https://a", True, {"title": "a"}, ttl=1000)
+    clock.now += 500
+    assert cache.get("https://a", True) == {"title": "a"}
+    cache.close()
+
+
+def test_expired_metadata_is_deleted_on_open(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path), flat_ttl=10)
+    cache.put("https://a", True, {"title": "a"})
+    cache.close()
+    clock.now += 11
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    assert cache._total_bytes == 0
+    cache.close()
+
+
+def test_kept_across_instances(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    cache.put("https://a", False, {"title": "a"})
+    cache.close()
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    assert cache.get("https://a", False) == {"title": "a"}
+    cache.close()
+
+
+def test_refresh_does_not_return_but_stores(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path), refresh=True)
+    cache.put("https://a", True, {"title": "a"})
+    assert cache.get("https://a", True) is None
+    cache.close()
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    assert cache.get("https://a", True) == {"title": "a"}
+    cache.close()
+
+
+def test_least_recently_used_is_evicted(tmp_path, clock):
+    infos = {url: {"title": url} for url in ["https://a", "https://b", "https://c"]}
+    size = compressed_size(infos["https://a"])
+    cache = MetadataCache(cache_dir=str(tmp_path), max_bytes=size * 2)
+    cache.put("https://a", True, infos["https://a"])
+    clock.now += 1
+    cache.put("https://b", True, infos["https://b"])
+    clock.now += 1
+    # 'a' becomes more recently used than 'b'
+    assert cache.get("https://a", True) == infos["https://a"]
+    clock.now += 1
+    cache.put("https://c", True, infos["https://c"])
+    assert cache.get("https://b", True) is None
+    assert cache.get("https://a", True) == infos["https://a"]
+    assert cache.get("https://c", True) == infos["https://c"]
+    assert cache._total_bytes == size * 2
+    cache.close()
+
+
+def test_replacing_does_not_count_twice(tmp_path, clock):
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    cache.put("https://a", True, {"title": "a"})
+    cache.put("https://a", True, {"title": "a"})
+    assert cache._total_bytes == compressed_size({"title": "a"})
+    cache.close()
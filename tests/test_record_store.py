@@ -0,0 +1,81 @@
+import pytest
+
+from record_store import RecordStore, RecordView
+
+
+def make_store(count: int) -> RecordStore:
+    store = RecordStore()
+    for i in range(count):
+        store.append(f"https://a/{i}", f"Title {i}", index=i + 1, same_playlist=1)
+    return store
+
+
+def test_append_and_read():
+    store = RecordStore()
+    row = store.append("https://a", "Title", 3, 2, False, 1234.5)
+    assert row == 0 and len(store) == 1
+    record = store[row]
+    assert record.to_url_data() == {
+        "url": "https://a",
+        "title": "Title",
+        "index": 3,
+        "same_playlist": 2,
+        "directly_specified": False,
+        "expected_size": 1234.5,
+    }
+    assert record.selected is False
+    assert record.filename == ""
+
+
+def test_read_like_url_data():
+    store = make_store(1)
+    assert store[0]["title"] == "Title 0"
+    assert store[0]["index"] == 1
+    with pytest.raises(KeyError):
+        store[0]["filename"]
+
+
+def test_views_write_to_the_store():
+    store = make_store(2)
+    record = store[1]
+    record.filename = "Title 1.mp4"
+    record.selected = True
+    record.expected_size = 10.0
+    assert store.filenames == ["", "Title 1.mp4"]
+    assert list(store.selected) == [False, True]
+    assert store[1].expected_size == 10.0
+
+
+def test_index_out_of_range():
+    store = make_store(2)
+    with pytest.raises(IndexError):
+        store[2]
+    with pytest.raises(IndexError):
+        store[-1]
+
+
+def test_iterate():
+    store = make_store(3)
+    assert [record.url for record in store] == [f"https://a/{i}" for i in range(3)]
+
+
+def test_extend_keeps_all_columns():
+    store = make_store(2)
+    other = RecordStore()
+    row = other.append("https://b", "Other", 5, 0, True, 99.0)
+    other[row].selected = True
+    other[row].filename = "Other.mp4"
+    store.extend(other)
+    assert len(store) == 3
+    assert store[2].to_url_data() == other[0].to_url_data()
+    assert store[2].selected and store[2].filename == "Other.mp4"
+
+
+def test_selected_records_in_order():
+    store = make_store(5)
+    for row in [3, 1]:
+        store[row].selected = True
+    selected = store.selected_records()
+    assert all(isinstance(record, RecordView) for record in selected)
+    assert [record.row for record in selected] == [1, 3]
+    assert make_store(2).selected_records() == []
@@ -0,0 +1,61 @@
+from span_trace import Span
+from trace_analyzer import busy_intervals, critical_path, report, thread_utilization
+
+
+def span(name: str, item: str, thread: str, start: float, end: float) -> Span:
+    return {"name": name, "item": item, "thread": thread, "start": start, "end": end}
+
+
+SPANS: list[Span] = [
+    span("queue wait", "a", "", 0.0, 1.0),
+    span("download", "a", "download 1", 1.0, 4.0),
+    span("extract", "a", "download 1", 1.0, 2.0),
+    span("download", "b", "download 1", 5.0, 6.0),
+    span("download", "c", "download 2", 0.0, 2.0),
+    span("postprocess", "a", "postprocess 1", 4.0, 8.0),
+]
+
+
+def test_busy_intervals_merge_overlaps():
+    spans = [
+        span("x", "", "t", 3.0, 4.0),
+        span("x", "", "t", 0.0, 2.0),
+        span("x", "", "t", 0.5, 1.0),
+        span("x", "", "t", 2.0, 2.5),
+    ]
+    assert busy_intervals(spans) == [(0.0, 2.5), (3.0, 4.0)]
+
+
+def test_thread_utilization():
+    utilization = thread_utilization(SPANS)
+    # Spans without a thread are not counted
+    assert list(utilization) == ["download 1", "download 2", "postprocess 1"]
+    assert utilization["download 1"] == (4.0, [(0.0, 1.0), (4.0, 5.0), (6.0, 8.0)])
+    assert utilization["download 2"] == (2.0, [(2.0, 8.0)])
+    assert utilization["postprocess 1"] == (4.0, [(0.0, 4.0)])
+    assert thread_utilization([]) == {}
+
+
+def test_critical_path():
+    path = critical_path(SPANS)
+    assert [(s["name"], s["item"]) for s in path] == [
+        ("queue wait", "a"),
+        ("download", "a"),
+        ("postprocess", "a"),
+    ]
+    assert critical_path([]) == []
+
+
+def test_report(capsys):
+    report(SPANS, min_gap=1.0, top=10)
+    out = capsys.readouterr().out
+    assert "Batch: 8.00 s, 6 spans" in out
+    assert "download 1: busy 4.00 s (50%), idle 4.00 s (50%), 3 gaps" in out
+    assert "postprocess: 4.00 s (50%)" in out
+
+
+def test_report_without_time(capsys):
+    report([], min_gap=1.0, top=10)
+    assert "No spans" in capsys.readouterr().out
+    report([span("x", "a", "t", 1.0, 1.0)], min_gap=1.0, top=10)
+    assert "take no time" in capsys.readouterr().out
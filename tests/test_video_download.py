@@ -0,0 +1,129 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from benchmark import BenchmarkYoutubeDLPool, SyntheticMediaServer
+from download_metrics import MetricsRecorder
+from download_scheduler import RecordsPriorityQueue
+from enum_config import DownloadMode, Thumbnail
+from record_store import RecordStore
+from video_download import VideoDownloader, VideoDownloaderQueue
+
+SIZE = 300_000
+# Decodes 'pipe:0' by copying it, or fails if FAIL_STREAM is set, and converts
+# files by copying them
+FAKE_FFMPEG = """#!{python}
+import shutil
+import sys
+
+args = sys.argv[1:]
+if "-version" in args:
+    sys.exit(0)
+src, dst = args[args.index("-i") + 1], args[-1]
+if src == "pipe:0":
+    if {fail_stream}:
+        sys.exit(1)
+    with open(dst, "wb") as f:
+        shutil.copyfileobj(sys.stdin.buffer, f)
+else:
+    shutil.copyfile(src, dst)
+"""
+
+
+@pytest.fixture
+def server():
+    server = SyntheticMediaServer([SIZE])
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_ffmpeg(tmp_path, fail_stream: bool) -> str:
+    path = tmp_path / "ffmpeg"
+    path.write_text(FAKE_FFMPEG.format(python=sys.executable, fail_stream=fail_stream))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def download_wav(server, tmp_path, ffmpeg_path: str, chunk_size: int) -> list:
+    progress: list = []
+    ydl_pool = BenchmarkYoutubeDLPool()
+    downloader = VideoDownloader(
+        {"format": "bestaudio[ext=m4a]", "http_chunk_size": chunk_size},
+        {
+            "dir_path": str(tmp_path),
+            "ffmpeg_path": ffmpeg_path,
+            "download_mode": DownloadMode.WAV,
+            "thumbnail_mode": Thumbnail.PLAIN,
+        },
+        ydl_pool=ydl_pool,
+        progress_hooks=[progress.append],
+    )
+    try:
+        assert downloader.download_videos(server.urls()[0], "Video.m4a")
+    finally:
+        ydl_pool.close()
+    return progress
+
+
+@pytest.mark.skipif(os.name == "nt", reason="The fake ffmpeg is a script")
+def test_stream_is_read_in_ranges(server, tmp_path):
+    ffmpeg_path = make_ffmpeg(tmp_path, fail_stream=False)
+    progress = download_wav(server, tmp_path, ffmpeg_path, chunk_size=64 * 1024)
+    assert (tmp_path / "Video.wav").read_bytes() == bytes(SIZE)
+    assert not (tmp_path / "Video.m4a").exists()
+    assert progress[-1]["status"] == "finished"
+    assert progress[-1]["downloaded_bytes"] == SIZE
+
+
+@pytest.mark.skipif(os.name == "nt", reason="The fake ffmpeg is a script")
+def test_m4a_is_downloaded_if_the_stream_cannot_be_decoded(server, tmp_path):
+    ffmpeg_path = make_ffmpeg(tmp_path, fail_stream=True)
+    progress = download_wav(server, tmp_path, ffmpeg_path, chunk_size=0)
+    # Converted from the m4a file, which is removed
+    assert (tmp_path / "Video.wav").read_bytes() == bytes(SIZE)
+    assert not (tmp_path / "Video.m4a").exists()
+    assert not (tmp_path / "Video.wav.part").exists()
+    assert "error" in [item["status"] for item in progress]
+
+
+def test_unexpected_error_fails_only_its_video(tmp_path, monkeypatch):
+    def download_file(self, url, filename):
+        if filename == "Bad.m4a":
+            raise OSError("File name too long")
+        return {}
+
+    monkeypatch.setattr(VideoDownloader, "download_file", download_file)
+    monkeypatch.setattr(VideoDownloader, "post_process", lambda *args: True)
+    store = RecordStore()
+    records_q = RecordsPriorityQueue()
+    for i, filename in enumerate(["Good1.m4a", "Bad.m4a", "Good2.m4a"]):
+        record = store[store.append(f"https://a/{i}", filename)]
+        record.filename = filename
+        records_q.put(record)
+    metrics = MetricsRecorder()
+    downloader = VideoDownloaderQueue(
+        {"format": "bestaudio[ext=m4a]"},
+        {
+            "dir_path": str(tmp_path),
+            "ffmpeg_path": "",
+            "download_mode": DownloadMode.M4A,
+            "thumbnail_mode": Thumbnail.PLAIN,
+        },
+        thread_count=1,
+        postprocess_threads=1,
+        metrics=metrics,
+    )
+    status_q = downloader.start_download(records_q)
+    statuses = sorted(status_q.get() for _ in range(status_q.qsize()))
+    assert statuses == [
+        (False, "https://a/1"),
+        (True, "https://a/0"),
+        (True, "https://a/2"),
+    ]
+    bad = [item for item in metrics.items() if item.get("filename") == "Bad.m4a"]
+    assert bad[0]["error_class"] == "OSError"
+    assert "retries" not in bad[0]
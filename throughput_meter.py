@@ -0,0 +1,48 @@
+import time
+from threading import Lock
+from typing import Any
+
+
+class ThroughputMeter:
+    """Measure the total download speed of all threads from yt-dlp progress hooks.
+
+    Example:
+        >>> meter = ThroughputMeter()
+        >>> ydl_opts["progress_hooks"] = [meter.hook]
+        >>> # After downloading for a while
+        >>> print(f"{meter.rate() / 2**20:.1f} MiB/s")
+        12.3 MiB/s
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._bytes: int = 0
+        self._since: float = time.monotonic()
+        # Bytes already counted for each file being downloaded
+        self._counted: dict[str, int] = {}
+
+    def hook(self, progress: dict[str, Any]) -> None:
+        """Progress hook for yt-dlp, called by every download thread."""
+        # 'tmpfilename' is not given when the download is finished
+        key = progress.get("filename") or ""
+        downloaded = progress.get("downloaded_bytes") or 0
+        with self._lock:
+            if progress.get("status") != "downloading":
+                # Already counted, or an existing file that was not downloaded
+                self._counted.pop(key, None)
+                return
+            # A resumed download starts from the size of the '.part' file
+            delta = downloaded - self._counted.setdefault(key, downloaded)
+            if delta > 0:
+                self._bytes += delta
+            self._counted[key] = downloaded
+
+    def rate(self) -> float:
+        """Return the bytes per second since the last call, and start a new period."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._since
+            rate = self._bytes / elapsed if elapsed > 0 else 0.0
+            self._bytes = 0
+            self._since = now
+        return rate
@@ -0,0 +1,175 @@
+"""Report how busy the threads were in a trace written with 'main.py --trace'.
+
+Example:
+    python ./trace_analyzer.py trace.json
+    python ./trace_analyzer.py trace.json --min-gap 0.5 --top 20
+"""
+
+import argparse
+from bisect import bisect_right
+from collections import defaultdict
+
+from span_trace import Span, load_chrome_trace
+
+# Two spans closer than this are regarded as one after the other
+TIME_TOLERANCE: float = 1e-3
+
+
+def busy_intervals(spans: list[Span]) -> list[tuple[float, float]]:
+    """Return the union of the spans, since nested spans overlap."""
+    intervals: list[tuple[float, float]] = []
+    for span in sorted(spans, key=lambda span: span["start"]):
+        if intervals and span["start"] <= intervals[-1][1]:
+            last_start, last_end = intervals[-1]
+            intervals[-1] = (last_start, max(last_end, span["end"]))
+        else:
+            intervals.append((span["start"], span["end"]))
+    return intervals
+
+
+def thread_utilization(
+    spans: list[Span],
+) -> dict[str, tuple[float, list[tuple[float, float]]]]:
+    """Return the busy seconds and the idle gaps of each thread.
+
+    Returns:
+        dict[str, tuple[float, list[tuple[float, float]]]]: Keyed by the name
+        of the thread. The gaps are measured within the whole batch, from the
+        first span of all threads to the last.
+    """
+    if not spans:
+        return {}
+    batch_start = min(span["start"] for span in spans)
+    batch_end = max(span["end"] for span in spans)
+    by_thread: dict[str, list[Span]] = defaultdict(list)
+    for span in spans:
+        if span["thread"]:
+            by_thread[span["thread"]].append(span)
+
+    result: dict[str, tuple[float, list[tuple[float, float]]]] = {}
+    for thread, thread_spans in sorted(by_thread.items()):
+        intervals = busy_intervals(thread_spans)
+        busy = sum(end - start for start, end in intervals)
+        gaps: list[tuple[float, float]] = []
+        last_end = batch_start
+        for start, end in intervals + [(batch_end, batch_end)]:
+            if start > last_end:
+                gaps.append((last_end, start))
+            last_end = max(last_end, end)
+        result[thread] = (busy, gaps)
+    return result
+
+
+def critical_path(spans: list[Span]) -> list[Span]:
+    """Return the chain of spans that decided when the batch ended.
+
+    Note:
+        Starting from the span that ended last, the span before each one is
+        the one that ended last before it started, among the earlier phases of
+        the same video and the earlier spans of the same thread. The time
+        between them is waiting that nothing in the trace explains.
+    """
+    if not spans:
+        return []
+    # The spans of each video and of each thread, sorted by their end
+    groups: dict[tuple[str, str], list[Span]] = defaultdict(list)
+    for span in spans:
+        if span["item"]:
+            groups[("item", span["item"])].append(span)
+        if span["thread"]:
+            groups[("thread", span["thread"])].append(span)
+    ends: dict[tuple[str, str], list[float]] = {}
+    for key, group in groups.items():
+        group.sort(key=lambda span: span["end"])
+        ends[key] = [span["end"] for span in group]
+
+    path = [max(spans, key=lambda span: span["end"])]
+    while True:
+        span = path[-1]
+        previous: Span | None = None
+        keys = [("item", span["item"]), ("thread", span["thread"])]
+        for key in keys:
+            if key not in groups:
+                continue
+            i = bisect_right(ends[key], span["start"] + TIME_TOLERANCE)
+            # Skip the span itself and the spans nested in it
+            while i > 0 and groups[key][i - 1]["start"] >= span["start"]:
+                i -= 1
+            if i > 0 and (previous is None or ends[key][i - 1] > previous["end"]):
+                previous = groups[key][i - 1]
+        if previous is None:
+            break
+        path.append(previous)
+    path.reverse()
+    return path
+
+
+def report(spans: list[Span], min_gap: float, top: int) -> None:
+    if not spans:
+        print("No spans in the trace.")
+        return
+    batch_start = min(span["start"] for span in spans)
+    batch_end = max(span["end"] for span in spans)
+    wall = batch_end - batch_start
+    print(f"Batch: {wall:.2f} s, {len(spans)} spans")
+    if wall <= 0:
+        print("The spans take no time, nothing to report.")
+        return
+
+    print("\nThreads (busy / idle of the batch):")
+    all_gaps: list[tuple[float, float, str]] = []
+    for thread, (busy, gaps) in thread_utilization(spans).items():
+        idle = wall - busy
+        print(
+            f"\t{thread}: busy {busy:.2f} s ({busy / wall:.0%}), "
+            f"idle {idle:.2f} s ({idle / wall:.0%}), {len(gaps)} gaps"
+        )
+        all_gaps += [(start, end, thread) for start, end in gaps]
+
+    long_gaps = sorted(
+        (gap for gap in all_gaps if gap[1] - gap[0] >= min_gap),
+        key=lambda gap: gap[0] - gap[1],
+    )
+    print(f"\nLongest idle gaps (>= {min_gap} s):")
+    for start, end, thread in long_gaps[:top]:
+        print(
+            f"\t{end - start:.2f} s\t{thread}\t"
+            f"{start - batch_start:.2f} -> {end - batch_start:.2f} s"
+        )
+
+    path = critical_path(spans)
+    by_phase: dict[str, float] = defaultdict(float)
+    last_end = batch_start
+    for span in path:
+        by_phase["(unexplained wait)"] += max(0.0, span["start"] - last_end)
+        by_phase[span["name"]] += span["end"] - max(span["start"], last_end)
+        last_end = max(last_end, span["end"])
+    print(f"\nCritical path: {len(path)} spans")
+    for phase, seconds in sorted(by_phase.items(), key=lambda x: -x[1]):
+        print(f"\t{phase}: {seconds:.2f} s ({seconds / wall:.0%})")
+    for span in path[-top:]:
+        print(
+            f"\t{span['start'] - batch_start:.2f} -> "
+            f"{span['end'] - batch_start:.2f} s\t{span['name']}\t"
+            f"{span['thread'] or '-'}\t{span['item']}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="Trace file in the Chrome trace format.")
+    parser.add_argument(
+        "--min-gap",
+        type=float,
+        default=1.0,
+        help="Shortest idle gap listed, in seconds. Defaults to 1.0.",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of gaps and spans listed."
+    )
+    args = parser.parse_args()
+    report(load_chrome_trace(args.trace), args.min_gap, args.top)
+
+
+if __name__ == "__main__":
+    main()
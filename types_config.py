@@ -1,5 +1,4 @@
-from typing import TypedDict, NotRequired
-from queue import Queue
+from typing import Any, Callable, TypedDict, NotRequired
 
 
 class UrlData(TypedDict):
@@ -8,6 +7,7 @@ class UrlData(TypedDict):
     index: int
     same_playlist: int
     directly_specified: bool
+    expected_size: NotRequired[float]
 
 
 UrlsDataList = list[UrlData]
@@ -37,6 +37,7 @@ class YdlOpts(TypedDict):
 
 class ExYdlOpts(YdlOpts):
     extract_flat: bool
+    socket_timeout: NotRequired[float]
 
 
 class DlYdlOpts(YdlOpts):
@@ -44,9 +45,43 @@ class DlYdlOpts(YdlOpts):
     format: str
     writethumbnail: bool
     noprogress: NotRequired[bool]
+    continuedl: NotRequired[bool]
+    progress_hooks: NotRequired[list[Callable[[dict[str, Any]], None]]]
 
 
-UrlsFilenameQ = Queue[tuple[str, str]]
+# ==================== ====================
+# For the batch mode
+class BatchJob(TypedDict):
+    """Options read from a job file instead of the prompts"""
+
+    dir_path: str
+    urls: NotRequired[list[str]]
+    csv_files: NotRequired[list[str]]
+    # Range of each playlist, keyed by its number from 1 or "default"
+    playlist_ranges: NotRequired[dict[str, str]]
+    ffmpeg_path: NotRequired[str]
+    # Names of the members of the enums in enum_config.py
+    download_mode: NotRequired[str]
+    thumbnail_mode: NotRequired[str]
+    file_name_format: NotRequired[str]
+
+
+class PlannedVideo(UrlData):
+    filename: str
+
+
+class BatchPlan(TypedDict):
+    """Videos and options resolved from a job, to be downloaded later"""
+
+    version: int
+    ydl_opts: DlYdlOpts
+    dir_path: str
+    ffmpeg_path: str
+    download_mode: str
+    thumbnail_mode: str
+    archive_file: str  # "" if the download archive is not used
+    videos: list[PlannedVideo]
+
 
 # https://qiita.com/simonritchie/items/63218b0a5c4a3d3632a1
 # https://typing.readthedocs.io/en/latest/spec/
@@ -2,17 +2,43 @@ import copy
 import os
 import queue
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import AbstractContextManager, closing, nullcontext
+from heapq import heappop, heappush
+from itertools import count
 from logging import getLogger
 from queue import Queue
-from threading import current_thread
-from typing import Any
+from re import search
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Iterable, Iterator
+from urllib.parse import parse_qs, urlparse
 
 import yt_dlp
-from enum_config import DownloadMode, Thumbnail
+from mutagen import MutagenError
+from mutagen.id3 import APIC
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.wave import WAVE
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import RequestError, TransportError
+from yt_dlp.utils import determine_ext
+
+from bandwidth_limiter import BandwidthLimiter
+from canonical_url import video_key
+from download_archive import DownloadArchive
+from download_metrics import MetricsRecorder, TransferProbe
+from download_retry import RetryPolicy, error_class
+from download_scheduler import RecordsPriorityQueue
+from enum_config import DownloadMode, SchedulePolicy, Thumbnail
+from file_links import link_or_copy
+from fragment_budget import FragmentBudget
+from live_progress import LiveProgress, WorkerCounter
 from logger_config import LoggerConfigurator
-from types_config import DlYdlOpts, UrlsFilenameQ
+from record_store import RecordsQ, RecordView
+from span_trace import SpanTracer
+from throughput_meter import ThroughputMeter
+from types_config import DlYdlOpts
+from ydl_pool import YoutubeDLPool
 
 DownloadStatusUrlsQ = Queue[tuple[bool, str]]
 
@@ -22,12 +48,32 @@ DownloadStatusUrlsQ = Queue[tuple[bool, str]]
 class VideoDownloader:
     """A class for download YouTube videos."""
 
-    def __init__(self, dl_ydl_opts: DlYdlOpts, options: dict[str, Any]) -> None:
+    def __init__(
+        self,
+        dl_ydl_opts: DlYdlOpts,
+        options: dict[str, Any],
+        ydl_pool: YoutubeDLPool | None = None,
+        progress_hooks: list[Callable[[dict[str, Any]], None]] | None = None,
+        fragment_budget: FragmentBudget | None = None,
+        metrics: MetricsRecorder | None = None,
+        tracer: SpanTracer | None = None,
+    ) -> None:
         """Initialize the VideoDownload object.
 
         Args:
             ydl_opts (Dict[str, Any]): Options for downloading using yt_dlp
             options (Dict[str, Any]): Options obtained using SetOptionVideoDownload
+            ydl_pool (YoutubeDLPool | None): Pool of YoutubeDL instances, shared
+            with the other downloaders. Defaults to None, which creates a new pool.
+            progress_hooks (list[Callable] | None): Progress hooks for yt_dlp,
+            called during each download. Defaults to None.
+            fragment_budget (FragmentBudget | None): Number of fragments
+            downloaded concurrently, shared with the other downloaders.
+            Defaults to None, which downloads one fragment at a time.
+            metrics (MetricsRecorder | None): Records the time spent in each
+            step of the downloads. Defaults to None, which records nothing.
+            tracer (SpanTracer | None): Records the extraction and the transfer
+            of each download as spans. Defaults to None, which records nothing.
 
         Attributes:
             logger: Logger object for logging messages.
@@ -36,6 +82,10 @@ class VideoDownloader:
             ffmpeg_path: Location of 'ffmpeg.exe' to convert files, "" if not used.
             download_mode: Specifying file format. See enum_config.py
             thumbnail_mode: Specifying thumbnail format. See enum_config.py
+            ydl_pool: Pool of YoutubeDL instances.
+            info_dicts: Metadata retrieved in the analysis, keyed by url.
+            The video is downloaded from it instead of extracting the url again.
+            download_archive: Record of the downloaded videos, None if not used.
 
         Example:
             >>> downloader = VideoDownloader(ydl_opts, options)
@@ -49,13 +99,39 @@ class VideoDownloader:
         self.ffmpeg_path: str = options["ffmpeg_path"]
         self.download_mode: DownloadMode = options["download_mode"]
         self.thumbnail_mode: Thumbnail = options["thumbnail_mode"]
+        self.ydl_pool: YoutubeDLPool = ydl_pool or YoutubeDLPool(
+            dl_ydl_opts.get("cookiefile", "")
+        )
+        self.progress_hooks: list[Callable[[dict[str, Any]], None]] = (
+            progress_hooks or []
+        )
+        self.fragment_budget: FragmentBudget | None = fragment_budget
+        self.metrics: MetricsRecorder | None = metrics
+        self.tracer: SpanTracer | None = tracer
+        self.info_dicts: dict[str, dict[str, Any]] = options.get("info_dicts", {})
+        self.download_archive: DownloadArchive | None = options.get("download_archive")
         # Const
         self.EXT_WAV = ".wav"
         self.EXT_PNG = ".png"
         self.EXT_DEFAULT_THUMBNAIL = ".webp"
+        # Field of 'outtmpl' given the file name of each download
+        self.FILENAME_FIELD = "video_downloader_filename"
+        # Metadata older than this is extracted again, the stream urls may expire
+        self.INFO_MAX_AGE = 60 * 60
+        # Time needed to finish the download before the stream urls expire
+        self.INFO_EXPIRE_MARGIN = 30 * 60
+        # Bytes read at a time from a stream decoded while downloading
+        self.STREAM_BLOCK_SIZE = 64 * 1024
+        # Bytes of each range of the stream if 'http_chunk_size' is not given,
+        # the size yt-dlp suggests against the throttling of YouTube
+        self.STREAM_CHUNK_SIZE = 10 * 1024 * 1024
+        # Seconds for ffmpeg to finish writing after the stream has ended
+        self.FFMPEG_FINISH_TIMEOUT = 60.0
         # Reduce logs
         self.dl_ydl_opts["quiet"] = True
         self.dl_ydl_opts["noprogress"] = True
+        # A retry continues from the '.part' file left by the failed download
+        self.dl_ydl_opts["continuedl"] = True
 
     def download_videos(self, url: str, filename: str) -> bool:
         """Download videos from YouTube.
@@ -85,30 +161,334 @@ class VideoDownloader:
             successfully created using 'analysis_urls.py'.
         """
 
+        try:
+            info = self.download_file(url, filename)
+        except yt_dlp.DownloadError:
+            self.logger.error(
+                f"Failed to download video. url: '{url}', filename: '{filename}'"
+            )
+            return False
+        return self.post_process(filename, info)
+
+    def download_file(self, url: str, filename: str) -> dict[str, Any]:
+        """Download the video only, without the conversion and the thumbnail.
+
+        Returns:
+            dict[str, Any]: Metadata of the downloaded video, which is passed
+            to 'post_process'.
+
+        Raises:
+            yt_dlp.DownloadError: If the download failed. The partially
+            downloaded file is kept, and downloading it again resumes from it.
+
+        Note:
+            If metrics is given, the time until the first byte is recorded as
+            'first_byte_seconds', and the rest as 'transfer_seconds'. If tracer is
+            given, they are recorded as the spans 'extract' and 'transfer'.
+        """
         dl_ydl_opts: DlYdlOpts = copy.deepcopy(self.dl_ydl_opts)
         file_path: str = os.path.join(self.dir_path, filename)
-        return self._download(url, dl_ydl_opts, file_path)
+        probe = TransferProbe()
+        started = time.monotonic()
+        try:
+            return self._download(url, dl_ydl_opts, file_path, probe)
+        finally:
+            if self.metrics is not None:
+                self.metrics.add_transfer(filename, started, probe)
+            if self.tracer is not None:
+                self._trace_download(filename, started, probe)
 
-    # TODO 戻り値タプルで(DL, ほかの操作(サムネとか)の結果)とかいいかも
-    def _download(self, url: str, ydl_opts: DlYdlOpts, file_path: str) -> bool:
-        ydl_opts["outtmpl"] = file_path
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                self.logger.info(
-                    f"Filename: '{os.path.splitext(os.path.basename(file_path))[0]}'"
-                )
-                ydl.download([url])
-            except yt_dlp.DownloadError:
-                self.logger.error(
-                    f"Failed to download video. url: '{url}', file_path: '{file_path}'"
-                )
-                # TODO このときのファイル名とかurlを保持して最後にもう一回DL試したい
-                return False
+    def post_process(self, filename: str, info: dict[str, Any]) -> bool:
+        """Convert the file and process the thumbnail of a downloaded video.
+
+        Args:
+            filename (str): The same file name as passed to 'download_file'.
+            info (dict[str, Any]): Metadata returned by 'download_file'.
+
+        Returns:
+            bool: True if the video is ready, False otherwise.
+
+        Note:
+            It only runs ffmpeg and does not use the network, so it can be
+            called from another thread than the one that downloaded the video.
+        """
+        file_path: str = os.path.join(self.dir_path, filename)
         if self.download_mode == DownloadMode.WAV:
-            if not self._post_convert_to_wav_(file_path):
-                return False
+            # No m4a file if it was decoded into wav while downloading
+            if os.path.isfile(file_path):
+                with self._timer(filename, "ffmpeg_seconds"):
+                    if not self._post_convert_to_wav_(file_path):
+                        return False
+            file_path = os.path.splitext(file_path)[0] + self.EXT_WAV
         if self.thumbnail_mode not in [Thumbnail.PLAIN, Thumbnail.GET_WEBP]:
-            self._thumbnail_process(file_path)
+            with self._timer(filename, "thumbnail_seconds"):
+                self._thumbnail_process(file_path)
+        if self.download_archive is not None:
+            self.download_archive.record(info)
+        return True
+
+    def link_outputs(self, filename: str, other_filename: str) -> bool:
+        """Make the processed files of a video also exist under other_filename.
+
+        Args:
+            filename (str): File name of the video downloaded and processed by
+            'download_file' and 'post_process'.
+            other_filename (str): Another file name requested for the video.
+
+        Returns:
+            bool: True if all files exist under other_filename, False otherwise.
+
+        Note:
+            The files are hard links if possible, and reflinks or copies if the
+            file system does not support them. Thumbnails that are kept are
+            linked along with the video.
+        """
+        src_stem = os.path.splitext(os.path.join(self.dir_path, filename))[0]
+        dst_stem = os.path.splitext(os.path.join(self.dir_path, other_filename))[0]
+        exts = [os.path.splitext(filename)[1]]
+        if self.download_mode == DownloadMode.WAV:
+            exts = [self.EXT_WAV]
+        if self.thumbnail_mode == Thumbnail.GET_WEBP:
+            exts.append(self.EXT_DEFAULT_THUMBNAIL)
+        elif self.thumbnail_mode in [Thumbnail.GET_PNG, Thumbnail.GET_AND_SET]:
+            exts.append(self.EXT_PNG)
+
+        for ext in exts:
+            if not os.path.isfile(src_stem + ext):
+                continue
+            try:
+                method = link_or_copy(src_stem + ext, dst_stem + ext)
+            except FileExistsError:
+                self.logger.info(f"'{dst_stem + ext}' already exists.")
+                continue
+            except OSError as e:
+                self.logger.debug(e)
+                self.logger.error(f"Failed to create '{dst_stem + ext}'.")
+                return False
+            self.logger.debug(f"{method}: '{src_stem + ext}' -> '{dst_stem + ext}'")
+        self.logger.info(f"Filename: '{os.path.basename(dst_stem)}' (same video)")
+        return True
+
+    # TODO 戻り値タプルで(DL, ほかの操作(サムネとか)の結果)とかいいかも
+    def _download(
+        self, url: str, ydl_opts: DlYdlOpts, file_path: str, probe: TransferProbe
+    ) -> dict[str, Any]:
+        # The same options for all files, to reuse the instances of the pool
+        ydl_opts["outtmpl"] = os.path.join(
+            os.path.dirname(file_path).replace("%", "%%"), f"%({self.FILENAME_FIELD})s"
+        )
+        extra_info = {self.FILENAME_FIELD: os.path.basename(file_path)}
+        ydl_opts["progress_hooks"] = self.progress_hooks
+        if self.metrics is not None or self.tracer is not None:
+            ydl_opts["progress_hooks"] = self.progress_hooks + [probe.hook]
+        with self.ydl_pool.checkout(dict(ydl_opts)) as ydl, self._fragment_share(ydl):
+            self.logger.info(
+                f"Filename: '{os.path.splitext(os.path.basename(file_path))[0]}'"
+            )
+            info = self.info_dicts.pop(url, None)
+            if info is not None and not self._is_fresh_info(info):
+                info = None
+            if self.download_mode == DownloadMode.WAV and self.ffmpeg_path:
+                # Select the format of this download, without downloading
+                if info is None:
+                    info = ydl.extract_info(url, download=False)
+                else:
+                    info = ydl.process_ie_result(
+                        ydl.sanitize_info(info, True), download=False
+                    )
+                hooks = ydl_opts["progress_hooks"]
+                if self._stream_to_wav(ydl, info, file_path, hooks):
+                    return info
+            if info is not None:
+                info = self._download_from_info(ydl, info, url, extra_info)
+            else:
+                info = ydl.extract_info(url, extra_info=extra_info)
+        return info or {}
+
+    def _fragment_share(self, ydl: yt_dlp.YoutubeDL) -> AbstractContextManager[None]:
+        if self.fragment_budget is None:
+            return nullcontext()
+        return self.fragment_budget.share(ydl.params)
+
+    def _trace_download(
+        self, filename: str, started: float, probe: TransferProbe
+    ) -> None:
+        assert self.tracer is not None
+        ended = time.monotonic()
+        first_byte = ended if probe.first_byte is None else probe.first_byte
+        self.tracer.add("extract", started, first_byte, filename)
+        if probe.first_byte is not None:
+            self.tracer.add("transfer", first_byte, ended, filename)
+
+    def _timer(self, filename: str, key: str) -> AbstractContextManager[None]:
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.timer(filename, key)
+
+    def _download_from_info(
+        self,
+        ydl: yt_dlp.YoutubeDL,
+        info: dict[str, Any],
+        url: str,
+        extra_info: dict[str, Any],
+    ) -> dict[str, Any] | None:
+        # Same as 'YoutubeDL.download_with_info_file', without the json file
+        try:
+            return ydl.process_ie_result(
+                ydl.sanitize_info(info, True), download=True, extra_info=extra_info
+            )
+        except yt_dlp.DownloadError as e:
+            self.logger.debug(e)
+            self.logger.info("Failed to download from metadata, retry with the url.")
+            return ydl.extract_info(url, extra_info=extra_info)
+
+    def _stream_to_wav(
+        self,
+        ydl: yt_dlp.YoutubeDL,
+        info: dict[str, Any],
+        file_path: str,
+        progress_hooks: list[Callable[[dict[str, Any]], None]],
+    ) -> bool:
+        # ffmpeg decodes the stream as it arrives, so that the m4a file is
+        # neither written nor read again for the conversion. The stream is read
+        # by yt-dlp and given to the progress hooks, so that it is limited,
+        # measured and shown as the other downloads.
+        is_http = info.get("protocol") in ["http", "https"]
+        if info.get("requested_formats") or not is_http:
+            return False
+        wav_path = os.path.splitext(file_path)[0] + self.EXT_WAV
+        tmp_path = wav_path + ".part"
+        ffmpeg_cmd = [self.ffmpeg_path, "-y", "-loglevel", "error", "-i", "pipe:0"]
+        ffmpeg_cmd += ["-vn", "-f", "wav", tmp_path]
+        progress: dict[str, Any] = {
+            "status": "downloading",
+            "filename": wav_path,
+            "tmpfilename": tmp_path,
+            "downloaded_bytes": 0,
+            "total_bytes": info.get("filesize") or info.get("filesize_approx"),
+            "info_dict": info,
+        }
+        process = subprocess.Popen(
+            ffmpeg_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        assert process.stdin is not None
+        try:
+            with closing(self._iter_stream(ydl, info)) as stream:
+                for hook in progress_hooks:
+                    hook(dict(progress))
+                for chunk in stream:
+                    process.stdin.write(chunk)
+                    progress["downloaded_bytes"] += len(chunk)
+                    for hook in progress_hooks:
+                        hook(dict(progress))
+            # Closes the input, then waits for the rest of the output
+            _, stderr = process.communicate(timeout=self.FFMPEG_FINISH_TIMEOUT)
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    process.returncode, ffmpeg_cmd, stderr=stderr
+                )
+        except (
+            OSError,
+            RequestError,
+            subprocess.CalledProcessError,
+            subprocess.TimeoutExpired,
+        ) as e:
+            # OSError includes a broken pipe when ffmpeg cannot decode it
+            self.logger.debug(e)
+            self.logger.info("Failed to decode while downloading, download m4a.")
+            process.kill()
+            process.wait()
+            # As yt-dlp reports a failed download, for the hooks to forget it
+            progress["status"] = "error"
+            for hook in progress_hooks:
+                hook(dict(progress))
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, wav_path)
+        progress["status"] = "finished"
+        progress["total_bytes"] = progress["downloaded_bytes"]
+        for hook in progress_hooks:
+            hook(dict(progress))
+        if ydl.params.get("writethumbnail"):
+            self._write_thumbnail(ydl, info, file_path)
+        return True
+
+    def _iter_stream(
+        self, ydl: yt_dlp.YoutubeDL, info: dict[str, Any]
+    ) -> Iterator[bytes]:
+        # Read in ranges as the HTTP downloader of yt-dlp does, and retry a
+        # failed range from the last byte read. Cookies and proxies are applied
+        # by yt-dlp, and 'socket_timeout' stops a stalled read
+        chunk_size = int(ydl.params.get("http_chunk_size") or self.STREAM_CHUNK_SIZE)
+        retries = ydl.params.get("retries", 10)
+        headers = info.get("http_headers") or {}
+        start: int = 0
+        total: int | None = None
+        failures: int = 0
+        while total is None or start < total:
+            end = start + chunk_size - 1
+            request = Request(
+                info["url"], headers={**headers, "Range": f"bytes={start}-{end}"}
+            )
+            is_ranged = False
+            try:
+                with ydl.urlopen(request) as response:
+                    is_ranged = response.status == 206
+                    if not is_ranged and start > 0:
+                        # Not retried, the whole stream would be read again
+                        raise RequestError("The range of the stream is ignored.")
+                    content_range = response.headers.get("Content-Range") or ""
+                    match = search(r"/(\d+)$", content_range)
+                    if match is not None:
+                        total = int(match.group(1))
+                    while block := response.read(self.STREAM_BLOCK_SIZE):
+                        start += len(block)
+                        yield block
+            except TransportError as e:
+                failures += 1
+                if failures > retries:
+                    raise
+                self.logger.debug(f"Retry reading the stream from byte {start}: {e}")
+                continue
+            # The whole stream at once, or a range shorter than requested
+            if not is_ranged or (total is None and start <= end):
+                return
+            failures = 0
+
+    def _write_thumbnail(
+        self, ydl: yt_dlp.YoutubeDL, info: dict[str, Any], file_path: str
+    ) -> None:
+        # Named as yt-dlp does, the last thumbnail is the most preferred one
+        thumbnail = (info.get("thumbnails") or [{"url": info.get("thumbnail")}])[-1]
+        url = thumbnail.get("url")
+        if not url:
+            return
+        ext = thumbnail.get("ext") or determine_ext(url, "jpg")
+        thumbnail_path = f"{os.path.splitext(file_path)[0]}.{ext}"
+        try:
+            with ydl.urlopen(Request(url, headers=info.get("http_headers"))) as f:
+                data = f.read()
+        except RequestError as e:
+            self.logger.debug(e)
+            self.logger.warning("Failed to download the thumbnail.")
+            return
+        with open(thumbnail_path, "wb") as f:
+            f.write(data)
+
+    def _is_fresh_info(self, info: dict[str, Any]) -> bool:
+        now = time.time()
+        if now - info.get("epoch", 0) > self.INFO_MAX_AGE:
+            return False
+        # Googlevideo urls include the time when they expire
+        for fmt in info.get("formats") or []:
+            expire = parse_qs(urlparse(fmt.get("url") or "").query).get("expire")
+            if expire and expire[0].isdigit():
+                if int(expire[0]) - now < self.INFO_EXPIRE_MARGIN:
+                    return False
         return True
 
     def _post_convert_to_wav_(self, file_fullpath: str) -> bool:
@@ -165,17 +545,54 @@ class VideoDownloader:
         return True
 
     def _set_thumbnail(self, video_path: str, img_path: str) -> bool:
-        if self.download_mode in [DownloadMode.M4A, DownloadMode.WAV]:
-            self.logger.warning(
-                "Image cannot be embedded in audio files. A image is saved instead."
-            )
+        if self._embed_cover_in_place(video_path, img_path):
+            return True
+        if os.path.splitext(video_path)[1] == self.EXT_WAV:
+            self.logger.warning("Error during setting thumbnail.")
             return False
+        return self._set_thumbnail_with_ffmpeg(video_path, img_path)
+
+    def _embed_cover_in_place(self, file_path: str, img_path: str) -> bool:
+        # Only the metadata is rewritten, instead of copying the whole file
+        with open(img_path, "rb") as f:
+            img_data = f.read()
+        is_png = os.path.splitext(img_path)[1] == self.EXT_PNG
+        try:
+            if os.path.splitext(file_path)[1] == self.EXT_WAV:
+                wave = WAVE(file_path)
+                if wave.tags is None:
+                    wave.add_tags()
+                wave.tags.delall("APIC")
+                wave.tags.add(
+                    APIC(
+                        encoding=3,
+                        mime="image/png" if is_png else "image/jpeg",
+                        type=3,  # Front cover
+                        desc="Cover",
+                        data=img_data,
+                    )
+                )
+                wave.save()
+            else:
+                mp4 = MP4(file_path)
+                if mp4.tags is None:
+                    mp4.add_tags()
+                img_format = MP4Cover.FORMAT_PNG if is_png else MP4Cover.FORMAT_JPEG
+                mp4.tags["covr"] = [MP4Cover(img_data, imageformat=img_format)]
+                mp4.save()
+        except MutagenError as e:
+            # Such as a webm file downloaded with the extension of mp4
+            self.logger.debug(f"{e}\tfile: '{file_path}'")
+            return False
+        return True
+
+    def _set_thumbnail_with_ffmpeg(self, video_path: str, img_path: str) -> bool:
         # To avoid duplicate names for input and output files, rename original name
         TMP_STR = "IN_SET_THUMBNAIL"
         split_path = os.path.splitext(video_path)
         tmp_video_path = split_path[0] + TMP_STR + split_path[1]
         ffmpeg_cmd = [
-            "ffmpeg",
+            self.ffmpeg_path,
             "-i",
             video_path,
             "-i",
@@ -209,66 +626,589 @@ class VideoDownloader:
 
 class VideoDownloaderQueue:
     def __init__(
-        self, ydl_opts: DlYdlOpts, option: dict[str, Any], thread_count: int = 4
+        self,
+        ydl_opts: DlYdlOpts,
+        option: dict[str, Any],
+        thread_count: int = 4,
+        ydl_pool: YoutubeDLPool | None = None,
+        postprocess_threads: int = 0,
+        min_threads: int = 0,
+        max_threads: int = 0,
+        retry_policy: RetryPolicy | None = None,
+        bandwidth_limiter: BandwidthLimiter | None = None,
+        fragment_budget: FragmentBudget | None = None,
+        metrics: MetricsRecorder | None = None,
+        tracer: SpanTracer | None = None,
+        live_progress: LiveProgress | None = None,
     ) -> None:
+        """Initialize the VideoDownloaderQueue object.
+
+        Args:
+            ydl_opts (DlYdlOpts): Options for downloading using yt_dlp.
+            option (dict[str, Any]): Options obtained using SetOptionVideoDownload.
+            thread_count (int, optional): Number of videos downloaded
+            concurrently, or at the start if the number is adjusted.
+            Defaults to 4.
+            ydl_pool (YoutubeDLPool | None): Pool of YoutubeDL instances.
+            Defaults to None, which creates a new pool.
+            postprocess_threads (int, optional): Number of videos converted by
+            ffmpeg concurrently. Defaults to 0, which means the number of CPUs.
+            min_threads (int, optional): Lower bound of the download threads.
+            Defaults to 0, which means thread_count.
+            max_threads (int, optional): Upper bound of the download threads.
+            Defaults to 0, which means thread_count.
+            retry_policy (RetryPolicy | None): How failed downloads are retried.
+            Defaults to None, which means RetryPolicy().
+            bandwidth_limiter (BandwidthLimiter | None): Limit of the total
+            download speed of all threads. Defaults to None, which means no limit.
+            fragment_budget (FragmentBudget | None): Number of fragments of DASH
+            and HLS formats downloaded concurrently by all threads together.
+            Defaults to None, which means one fragment for each thread.
+            metrics (MetricsRecorder | None): Records the time spent in each
+            step, the size, the retries and the errors of each video.
+            Defaults to None, which records nothing.
+            tracer (SpanTracer | None): Records the queue wait, the extraction,
+            the transfer and the post-processing of each video as spans of the
+            threads. Defaults to None, which records nothing.
+            live_progress (LiveProgress | None): Shows the bytes, the speed and
+            the ETA of all threads while downloading. Defaults to None, which
+            only logs the number of finished videos.
+
+        Note:
+            A download thread hands the downloaded video over to the
+            post-processing threads and starts the next url at once, so that
+            the network is not idle while ffmpeg is running.
+            If max_threads is larger than min_threads, the total download speed
+            is measured regularly, and a thread is added while it rises and
+            removed when it falls.
+            A download that failed for a temporary reason is retried after the
+            other videos, resuming from its partial file. Only the videos that
+            failed permanently or ran out of attempts are reported as failures.
+            A video requested under several file names, such as in overlapping
+            playlists, is downloaded and processed once, and linked to the
+            other file names.
+        """
+
         LoggerConfigurator()
         self.logger = getLogger()
 
+        self.ydl_opts: DlYdlOpts = ydl_opts
+        self.option: dict[str, Any] = option
+        self.min_threads: int = min_threads or thread_count
+        self.max_threads: int = max(max_threads or thread_count, self.min_threads)
+        self.thread_count: int = min(
+            max(thread_count, self.min_threads), self.max_threads
+        )
+        self.postprocess_threads: int = postprocess_threads or os.cpu_count() or 1
+        self.ydl_pool: YoutubeDLPool = ydl_pool or YoutubeDLPool(
+            ydl_opts.get("cookiefile", "")
+        )
+        self.throughput_meter = ThroughputMeter()
+        self.bandwidth_limiter: BandwidthLimiter | None = bandwidth_limiter
+        self.fragment_budget: FragmentBudget | None = fragment_budget
+        self.retry_policy: RetryPolicy = retry_policy or RetryPolicy()
+        self.metrics: MetricsRecorder | None = metrics
+        self.tracer: SpanTracer | None = tracer
+        self.live_progress: LiveProgress | None = live_progress
+        # 'time.monotonic()' when the videos put before the start were queued
+        self._queued_at: float = time.monotonic()
+        # 'time.monotonic()' when the other videos were queued, by file name
+        self._queued_times: dict[str, float] = {}
+        # (time to retry, order, record) of the failed downloads
+        self._retries: list[tuple[float, int, RecordView]] = []
+        self._attempts: dict[tuple[str, str], int] = {}
+        self._retry_order = count()
+        self._retry_lock = Lock()
+        # The first record of each video is downloaded, and the files of the
+        # others are linked to it once it is finished
+        self._owners: dict[str, RecordView] = {}
+        self._same_videos: dict[str, list[RecordView]] = {}
+        self._finished: dict[str, bool] = {}
+        self._dedup_lock = Lock()
+        # Created when a thread needs one, and reused by the later threads
         self.downloaders: list[VideoDownloader] = []
-        self.thread_count: int = 0
-        self._set_download_option(ydl_opts, option, thread_count)
+        self._idle_downloaders: list[VideoDownloader] = []
+        # Counter of the live progress of each downloader
+        self._progress_counters: dict[VideoDownloader, WorkerCounter] = {}
+        self._worker_numbers = count(1)
+        self._workers_lock = Lock()
+        self._futures: list[Future[None]] = []
+        self._retiring: int = 0
+        self._closed: bool = False
+        # Set by 'cancel', the videos not started yet are skipped
+        self._cancelled = Event()
+        # Const
+        self.AUTOSCALE_INTERVAL: float = 10.0
+        # Relative change of the download speed regarded as a rise or a fall
+        self.AUTOSCALE_GAIN: float = 0.1
 
-    def _set_download_option(
-        self, ydl_opts: DlYdlOpts, option: dict[str, Any], thread_count: int
-    ) -> None:
-        self.downloaders = [
-            VideoDownloader(ydl_opts, option) for _ in range(thread_count)
-        ]
-        self.thread_count = thread_count
+    def cancel(self) -> None:
+        """Stop starting downloads, from another thread than the one downloading.
+
+        Note:
+            The downloads in progress and their post-processing are finished.
+            The videos not started yet, including those waiting to be retried,
+            are skipped without a status, so the start of the download returns
+            soon after.
+        """
+        self.logger.info("The remaining downloads are cancelled.")
+        self._cancelled.set()
+
+    def start_download(self, records_q: RecordsQ) -> DownloadStatusUrlsQ:
+        total_urls_len: int = records_q.qsize()
+        self._queued_at = time.monotonic()
+        # Tell the threads to finish once all urls have been taken
+        records_q.put(None)
+        return self._run_download_threads(records_q, total_urls_len)
+
+    def start_download_pipelined(
+        self,
+        records: Iterable[RecordView],
+        queue_size: int = 16,
+        policy: SchedulePolicy = SchedulePolicy.FIFO,
+    ) -> DownloadStatusUrlsQ:
+        """Download the videos while records is still producing them.
+
+        Args:
+            records (Iterable[RecordView]): Videos with their file names,
+            typically a generator that analyzes the urls lazily.
+            queue_size (int, optional): Maximum number of videos waiting for a
+            thread. When it is reached, records is not read until a thread
+            takes one. Defaults to 16.
+            policy (SchedulePolicy, optional): Order of the videos waiting for
+            a thread. Defaults to SchedulePolicy.FIFO.
+
+        Returns:
+            DownloadStatusUrlsQ: The same as 'start_download'.
+
+        Note:
+            records is read in the calling thread, so the analysis and the
+            downloads overlap without the analysis running ahead of them.
+            Only the waiting videos are ordered by policy, not all videos.
+        """
+
+        records_q: RecordsQ = RecordsPriorityQueue(max(1, queue_size), policy)
 
-    def start_download(self, urls_filename_q: UrlsFilenameQ) -> DownloadStatusUrlsQ:
+        def produce(futures: list[Future[None]]) -> None:
+            try:
+                for record in records:
+                    if self._cancelled.is_set():
+                        return
+                    self._queued_times[record.filename] = time.monotonic()
+                    if self.live_progress is not None:
+                        self.live_progress.expect(record.expected_size)
+                    if not self._put_while_running(records_q, record, futures):
+                        return
+            finally:
+                self._put_while_running(records_q, None, futures)
+
+        return self._run_download_threads(records_q, 0, produce)
+
+    def _run_download_threads(
+        self,
+        records_q: RecordsQ,
+        total_urls_len: int,
+        produce: Callable[[list[Future[None]]], None] | None = None,
+    ) -> DownloadStatusUrlsQ:
         download_status_urls_q: DownloadStatusUrlsQ = Queue()
-        total_urls_len: int = urls_filename_q.qsize()
+        self._retries = []
+        self._attempts = {}
+        self._owners = {}
+        self._same_videos = {}
+        self._finished = {}
+        self._queued_times = {}
 
         self.logger.info("Start downloading the video.")
-        with ThreadPoolExecutor(max_workers=self.thread_count) as e:
-            futures = [
-                e.submit(
-                    self._download_videos_via_queue,
-                    downloader,
-                    urls_filename_q,
-                    download_status_urls_q,
-                    total_urls_len,
+        if self.live_progress is not None:
+            self.live_progress.start()
+        try:
+            self._run_download_round(
+                records_q, download_status_urls_q, total_urls_len, produce
+            )
+            while self._retries and not self._cancelled.is_set():
+                retry_q = self._wait_for_retries()
+                self._run_download_round(
+                    retry_q, download_status_urls_q, total_urls_len
                 )
-                for downloader in self.downloaders
-            ]
+        finally:
+            if self.live_progress is not None:
+                self.live_progress.stop()
+        self.logger.info("Downloading of the video is completed.")
+        return download_status_urls_q
+
+    def _wait_for_retries(self) -> RecordsQ:
+        # Retry all the videos whose backoff ends first
+        wait_seconds = self._retries[0][0] - time.monotonic()
+        if wait_seconds > 0:
+            self.logger.info(
+                f"Wait {wait_seconds:.0f} seconds to retry "
+                f"{len(self._retries)} videos."
+            )
+            with self._span("retry wait"):
+                self._cancelled.wait(wait_seconds)
+        retry_q: RecordsQ = Queue()
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now:
+            record = heappop(self._retries)[2]
+            if self.tracer is not None:
+                failed_at = self._queued_times.get(record.filename, now)
+                self.tracer.add("retry backoff", failed_at, now, record.filename, "")
+            self._queued_times[record.filename] = now
+            retry_q.put(record)
+        retry_q.put(None)
+        return retry_q
+
+    def _run_download_round(
+        self,
+        records_q: RecordsQ,
+        download_status_urls_q: DownloadStatusUrlsQ,
+        total_urls_len: int,
+        produce: Callable[[list[Future[None]]], None] | None = None,
+    ) -> None:
+        self._futures = []
+        self._retiring = 0
+        self._closed = False
+        stop_scaling = Event()
 
+        # Shut down after the download threads, once the last video is converted
+        with ThreadPoolExecutor(
+            max_workers=self.postprocess_threads, thread_name_prefix="postprocess"
+        ) as post_executor, ThreadPoolExecutor(
+            max_workers=self.max_threads, thread_name_prefix="download"
+        ) as e:
+
+            def add_thread() -> bool:
+                with self._workers_lock:
+                    if self._closed:
+                        return False
+                    self._futures.append(
+                        e.submit(
+                            self._download_videos_via_queue,
+                            records_q,
+                            download_status_urls_q,
+                            total_urls_len,
+                            post_executor,
+                        )
+                    )
+                return True
+
+            for _ in range(self.thread_count):
+                add_thread()
+            if self.max_threads > self.min_threads:
+                Thread(
+                    target=self._autoscale,
+                    args=(records_q, add_thread, stop_scaling),
+                    daemon=True,
+                ).start()
+            try:
+                if produce is not None:
+                    produce(self._futures)
+                self._wait_threads()
+            finally:
+                stop_scaling.set()
+
+    def _wait_threads(self) -> None:
+        # Threads may be added while waiting for the others
+        while True:
+            with self._workers_lock:
+                futures = list(self._futures)
             for future in as_completed(futures):
                 future.result()
-        self.logger.info("Downloading of the video is completed.")
-        return download_status_urls_q
+            with self._workers_lock:
+                if len(self._futures) == len(futures):
+                    self._closed = True
+                    return
+
+    def _autoscale(
+        self, records_q: RecordsQ, add_thread: Callable[[], bool], stop: Event
+    ) -> None:
+        last_rate = 0.0
+        self.throughput_meter.rate()  # Start measuring from here
+        while not stop.wait(self.AUTOSCALE_INTERVAL):
+            rate = self.throughput_meter.rate()
+            with self._workers_lock:
+                active = sum(not f.done() for f in self._futures) - self._retiring
+            mib_rate = f"{rate / 2**20:.1f} MiB/s"
+            if (
+                rate > last_rate * (1 + self.AUTOSCALE_GAIN)
+                and active < self.max_threads
+                and not records_q.empty()
+            ):
+                if add_thread():
+                    self.logger.info(f"{mib_rate}. Download threads: {active + 1}")
+            elif rate < last_rate * (1 - self.AUTOSCALE_GAIN):
+                if active > self.min_threads:
+                    with self._workers_lock:
+                        self._retiring += 1
+                    self.logger.info(f"{mib_rate}. Download threads: {active - 1}")
+            last_rate = rate
+
+    def _put_while_running(
+        self,
+        records_q: RecordsQ,
+        item: RecordView | None,
+        futures: list[Future[None]],
+    ) -> bool:
+        # Not to wait forever for a thread that stopped with an exception
+        while True:
+            try:
+                records_q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                if all(future.done() for future in futures):
+                    return False
+
+    def _checkout_downloader(self) -> VideoDownloader:
+        with self._workers_lock:
+            if self._idle_downloaders:
+                return self._idle_downloaders.pop()
+        progress_hooks = [self.throughput_meter.hook]
+        if self.bandwidth_limiter is not None:
+            progress_hooks.append(self.bandwidth_limiter.hook)
+        counter = None
+        if self.live_progress is not None:
+            # Not for each thread, since yt-dlp calls the hook from the threads
+            # downloading the fragments too
+            with self._workers_lock:
+                name = f"download {next(self._worker_numbers)}"
+            counter = self.live_progress.worker(name)
+            progress_hooks.append(counter.hook)
+        downloader = VideoDownloader(
+            self.ydl_opts,
+            self.option,
+            ydl_pool=self.ydl_pool,
+            progress_hooks=progress_hooks,
+            fragment_budget=self.fragment_budget,
+            metrics=self.metrics,
+            tracer=self.tracer,
+        )
+        with self._workers_lock:
+            self.downloaders.append(downloader)
+            if counter is not None:
+                self._progress_counters[downloader] = counter
+        return downloader
+
+    def _should_retire(self) -> bool:
+        with self._workers_lock:
+            if self._retiring > 0:
+                self._retiring -= 1
+                return True
+        return False
 
     def _download_videos_via_queue(
+        self,
+        records_q: RecordsQ,
+        download_status_urls_q: DownloadStatusUrlsQ,
+        total_urls_len: int,
+        post_executor: ThreadPoolExecutor,
+    ) -> None:
+        downloader = self._checkout_downloader()
+        try:
+            while not self._should_retire():
+                record = records_q.get()
+                if record is None:
+                    # Leave it for the other threads
+                    records_q.put(None)
+                    self.logger.debug("No more urls. This thread is closed.")
+                    return
+                if self._cancelled.is_set():
+                    continue
+                self._record_queue_wait(record)
+                if self._is_same_video(
+                    downloader, record, download_status_urls_q, total_urls_len
+                ):
+                    continue
+                try:
+                    info = downloader.download_file(record.url, record.filename)
+                except yt_dlp.DownloadError as e:
+                    self._end_download(downloader)
+                    if not self._schedule_retry(e, record):
+                        self._finish_video(
+                            downloader,
+                            record,
+                            False,
+                            download_status_urls_q,
+                            total_urls_len,
+                        )
+                    continue
+                except Exception as e:
+                    # Such as an OSError of the file or an error of yt-dlp on
+                    # unusual metadata, not retried and not to stop the others
+                    self._end_download(downloader)
+                    self.logger.exception(
+                        f"Unexpected error in downloading: '{record.url}'"
+                    )
+                    if self.metrics is not None:
+                        self.metrics.set(record.filename, "error_class", error_class(e))
+                    self._finish_video(
+                        downloader,
+                        record,
+                        False,
+                        download_status_urls_q,
+                        total_urls_len,
+                    )
+                    continue
+                self._end_download(downloader)
+                post_executor.submit(
+                    self._post_process,
+                    downloader,
+                    record,
+                    info,
+                    download_status_urls_q,
+                    total_urls_len,
+                )
+            self.logger.debug("This thread is closed to reduce the threads.")
+        finally:
+            with self._workers_lock:
+                self._idle_downloaders.append(downloader)
+
+    def _schedule_retry(self, error: yt_dlp.DownloadError, record: RecordView) -> bool:
+        key = (record.url, record.filename)
+        if self.metrics is not None:
+            self.metrics.set(record.filename, "error_class", error_class(error))
+        with self._retry_lock:
+            attempts = self._attempts.get(key, 0) + 1
+            self._attempts[key] = attempts
+            if not self.retry_policy.can_retry(error, attempts):
+                self.logger.error(
+                    f"Failed to download video. url: '{record.url}', "
+                    f"filename: '{record.filename}', attempts: {attempts}"
+                )
+                return False
+            delay = self.retry_policy.delay(attempts)
+            # Until it is queued again, then the time it was queued
+            self._queued_times[record.filename] = time.monotonic()
+            if self.metrics is not None:
+                self.metrics.add(record.filename, "retries", 1)
+            heappush(
+                self._retries,
+                (time.monotonic() + delay, next(self._retry_order), record),
+            )
+        self.logger.warning(
+            f"Failed to download video, retry after {delay:.0f} seconds. "
+            f"url: '{record.url}', attempts: {attempts}"
+        )
+        return True
+
+    def _post_process(
         self,
         downloader: VideoDownloader,
-        urls_filename_q: UrlsFilenameQ,
+        record: RecordView,
+        info: dict[str, Any],
         download_status_urls_q: DownloadStatusUrlsQ,
         total_urls_len: int,
     ) -> None:
-        while True:
-            try:
-                url, filename = urls_filename_q.get(timeout=2)
-            except queue.Empty:
-                self.logger.debug("Empty queue. This thread is closed.")
-                # _for_debug(mess="This thread is closed")  # for debug
-                return
-            download_state = downloader.download_videos(url, filename)
-            download_status_urls_q.put((download_state, url))
-            self.logger.info(
-                f"Progress: {download_status_urls_q.qsize()} / {total_urls_len}"
+        try:
+            with self._span("postprocess", record.filename):
+                state = downloader.post_process(record.filename, info)
+        except Exception as e:
+            # Not to lose the result of the video in the executor
+            self.logger.debug(e)
+            self.logger.error(f"Unexpected error in post-processing: '{record.url}'")
+            state = False
+        self._finish_video(
+            downloader, record, state, download_status_urls_q, total_urls_len
+        )
+
+    def _record_queue_wait(self, record: RecordView) -> None:
+        queued_at = self._queued_times.pop(record.filename, self._queued_at)
+        now = time.monotonic()
+        if self.metrics is not None:
+            self.metrics.set(record.filename, "url", record.url)
+            self.metrics.add(record.filename, "queue_wait_seconds", now - queued_at)
+        if self.tracer is not None:
+            # Not on a thread, the videos wait in the queue at the same time
+            self.tracer.add("queue wait", queued_at, now, record.filename, thread="")
+
+    def _end_download(self, downloader: VideoDownloader) -> None:
+        counter = self._progress_counters.get(downloader)
+        if counter is not None:
+            counter.end_download()
+
+    def _span(self, name: str, item: str = "") -> AbstractContextManager[None]:
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.span(name, item)
+
+    def _is_same_video(
+        self,
+        downloader: VideoDownloader,
+        record: RecordView,
+        download_status_urls_q: DownloadStatusUrlsQ,
+        total_urls_len: int,
+    ) -> bool:
+        # True if the video is downloaded by another record, such as the same
+        # video in another playlist with a different file name
+        key = video_key(record.url)
+        with self._dedup_lock:
+            owner = self._owners.setdefault(key, record)
+            if owner is record:
+                return False
+            if key not in self._finished:
+                self._same_videos.setdefault(key, []).append(record)
+                return True
+            state = self._finished[key]
+        self._finish_same_video(
+            downloader, owner, record, state, download_status_urls_q, total_urls_len
+        )
+        return True
+
+    def _finish_video(
+        self,
+        downloader: VideoDownloader,
+        record: RecordView,
+        state: bool,
+        download_status_urls_q: DownloadStatusUrlsQ,
+        total_urls_len: int,
+    ) -> None:
+        self._put_status(download_status_urls_q, state, record, total_urls_len)
+        key = video_key(record.url)
+        with self._dedup_lock:
+            self._finished[key] = state
+            same_videos = self._same_videos.pop(key, [])
+        for same_video in same_videos:
+            self._finish_same_video(
+                downloader,
+                record,
+                same_video,
+                state,
+                download_status_urls_q,
+                total_urls_len,
             )
 
-            # _for_debug("DL")  # for debug
+    def _finish_same_video(
+        self,
+        downloader: VideoDownloader,
+        owner: RecordView,
+        record: RecordView,
+        state: bool,
+        download_status_urls_q: DownloadStatusUrlsQ,
+        total_urls_len: int,
+    ) -> None:
+        is_linked = state and owner.filename != record.filename
+        if is_linked:
+            with self._span("link", record.filename):
+                state = downloader.link_outputs(owner.filename, record.filename)
+        self._put_status(download_status_urls_q, state, record, total_urls_len)
+        if self.metrics is not None and is_linked and state:
+            self.metrics.set(record.filename, "status", "linked")
+
+    def _put_status(
+        self,
+        download_status_urls_q: DownloadStatusUrlsQ,
+        state: bool,
+        record: RecordView,
+        total_urls_len: int,
+    ) -> None:
+        # 0 means that the total is unknown until the analysis finishes
+        total = str(total_urls_len) if total_urls_len else "?"
+        if self.metrics is not None:
+            status = "success" if state else "failure"
+            self.metrics.set(record.filename, "status", status)
+        download_status_urls_q.put((state, record.url))
+        if self.live_progress is not None:
+            self.live_progress.finished()
+        self.logger.info(f"Progress: {download_status_urls_q.qsize()} / {total}")
 
     def display_result(self, status_urls_q: DownloadStatusUrlsQ) -> None:
         failures_urls_q: Queue[str] = Queue()
@@ -293,14 +1233,3 @@ class VideoDownloaderQueue:
         while not failures_urls_q.empty():
             url = failures_urls_q.get()
             self.logger.info(f"\t> '{url}'")
-
-
-def _for_debug(mess: str = ""):
-    """Check if all threads are runnning, based on the DL end time of each video."""
-    now = datetime.now()
-    name = current_thread().name
-    now = now.strftime("%H-%M-%S") + " " + name + " " + mess
-    path: str = ""
-
-    with open(path, "a") as f:
-        f.write(f"{now}\n")
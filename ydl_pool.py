@@ -0,0 +1,131 @@
+import copy
+import json
+from contextlib import contextmanager
+from logging import getLogger
+from threading import Lock
+from typing import Any, Callable, Iterator
+
+import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar, load_cookies
+
+from logger_config import LoggerConfigurator
+
+
+class YoutubeDLPool:
+    """A pool of reusable yt_dlp.YoutubeDL instances sharing one cookie jar."""
+
+    def __init__(self, cookiefile: str = "") -> None:
+        """Initialize the YoutubeDLPool object.
+
+        Args:
+            cookiefile (str, optional): Path to the cookie file. It is read only
+            once, and written back when the pool is closed. Defaults to "".
+
+        Note:
+            Building a YoutubeDL parses the cookie file and creates a new
+            request director, and closing it discards the open connections.
+            Instances checked out from this pool are kept for the next url
+            instead, one for each set of options and each concurrent user.
+            Only the public API of yt-dlp is used, so that an update of it
+            does not silently break the cookies or the hooks.
+
+        Example:
+            >>> pool = YoutubeDLPool(cookiefile="dir/cookies.txt")
+            >>> with pool.checkout({"quiet": True}) as ydl:
+            ...     info = ydl.extract_info(url, download=False)
+            >>> pool.close()
+        """
+
+        LoggerConfigurator()
+        self.logger = getLogger()
+
+        self.cookiefile: str = cookiefile
+        self._lock = Lock()
+        self._cookiejar: YoutubeDLCookieJar | None = None
+        self._idle: dict[str, list[yt_dlp.YoutubeDL]] = {}
+        self._instances: list[yt_dlp.YoutubeDL] = []
+        # Progress hooks of the current checkout of each instance
+        self._hooks: dict[yt_dlp.YoutubeDL, list[Callable[[dict[str, Any]], None]]] = {}
+
+    @contextmanager
+    def checkout(self, params: dict[str, Any]) -> Iterator[yt_dlp.YoutubeDL]:
+        """Borrow an instance created with params until the end of the with block.
+
+        Args:
+            params (dict[str, Any]): Options for yt_dlp. 'cookiefile' is ignored
+            in favor of the cookie file of the pool, and 'progress_hooks' may
+            differ between checkouts of the same instance.
+
+        Note:
+            'outtmpl' is a part of the options of an instance. To download
+            files of different names with one instance, give a field of the
+            name in 'outtmpl' and its value by 'extra_info' of 'extract_info'.
+        """
+
+        key = self._params_key(params)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            ydl = idle.pop() if idle else None
+        if ydl is None:
+            ydl = self._create(params)
+        # Called by the only hook added to the instance
+        self._hooks[ydl][:] = params.get("progress_hooks") or []
+        try:
+            yield ydl
+        finally:
+            with self._lock:
+                self._idle[key].append(ydl)
+
+    def close(self) -> None:
+        """Close all instances and write the cookies back to the cookie file."""
+        with self._lock:
+            for ydl in self._instances:
+                if self._cookiejar is not None:
+                    # Including the cookies set by the responses
+                    for cookie in ydl.cookiejar:
+                        self._cookiejar.set_cookie(cookie)
+                ydl.close()
+            self._instances.clear()
+            self._idle.clear()
+            self._hooks.clear()
+            if self._cookiejar is not None and self.cookiefile:
+                self._cookiejar.save()
+
+    def _create(self, params: dict[str, Any]) -> yt_dlp.YoutubeDL:
+        params = copy.deepcopy(
+            {k: v for k, v in params.items() if k not in ["progress_hooks"]}
+        )
+        params.pop("cookiefile", None)
+        ydl = yt_dlp.YoutubeDL(params)
+        # The cookie file is read once, and copied to the jar of each instance
+        for cookie in self._get_cookiejar():
+            ydl.cookiejar.set_cookie(copy.copy(cookie))
+        hooks: list[Callable[[dict[str, Any]], None]] = []
+
+        def call_hooks(progress: dict[str, Any]) -> None:
+            for hook in hooks:
+                hook(progress)
+
+        ydl.add_progress_hook(call_hooks)
+        with self._lock:
+            self._instances.append(ydl)
+            self._hooks[ydl] = hooks
+        self.logger.debug(f"New YoutubeDL instance. Total: {len(self._instances)}")
+        return ydl
+
+    def _get_cookiejar(self) -> YoutubeDLCookieJar:
+        with self._lock:
+            if self._cookiejar is None:
+                self._cookiejar = load_cookies(self.cookiefile or None, None, None)
+            return self._cookiejar
+
+    def _params_key(self, params: dict[str, Any]) -> str:
+        return json.dumps(
+            {
+                k: v
+                for k, v in params.items()
+                if k not in ["cookiefile", "progress_hooks"]
+            },
+            sort_keys=True,
+            default=repr,
+        )